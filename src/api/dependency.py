@@ -1,17 +1,71 @@
+import os
 from fastapi import HTTPException, status
-from vector_db import Database, Library
+from typing import Optional
+from vector_db import Database, Library, Replica
 
-db = Database()
+# Directory of the database snapshot, restored on startup. Snapshots are disabled if unset.
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH")
+# Write-ahead log replayed on top of the snapshot on startup, and appended to by every write.
+# Writes are only kept in memory if unset.
+WAL_PATH = os.getenv("WAL_PATH")
+# Seconds the write-ahead log waits before an fsync, for more writes to share it
+WAL_COMMIT_DELAY = float(os.getenv("WAL_COMMIT_DELAY", "0"))
+# Libraries unused for this many seconds are saved to the snapshot and unloaded. Never if unset.
+LIBRARY_IDLE_TIMEOUT = os.getenv("LIBRARY_IDLE_TIMEOUT")
+# Least recently used libraries are saved and unloaded while the loaded ones hold more than
+# this many megabytes of embeddings. Unbounded if unset.
+LIBRARY_MEMORY_BUDGET_MB = os.getenv("LIBRARY_MEMORY_BUDGET_MB")
+# Role of the process when serving from several processes, see `serve.py`: the `coordinator`
+# takes the writes and publishes them to the snapshot, the `reader`s serve the reads from the
+# snapshot and forward the writes to the coordinator at `COORDINATOR_URL`. Unset, a single
+# process serves everything.
+SERVING_ROLE = os.getenv("SERVING_ROLE")
+COORDINATOR_URL = os.getenv("COORDINATOR_URL")
+# Seconds between the coordinator's saves of the writes, and between the readers' checks for them
+PUBLISH_INTERVAL = float(os.getenv("PUBLISH_INTERVAL", "1"))
+# Megabytes per second the coordinator's saves write at most, on average: see `Database.start_publishing`
+PUBLISH_WRITE_RATE_MB = float(os.getenv("PUBLISH_WRITE_RATE_MB", "64"))
+REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", "0.5"))
+
+if SERVING_ROLE not in (None, "coordinator", "reader"):
+    raise ValueError(f"Unknown serving role `{SERVING_ROLE}`, expected `coordinator` or `reader`.")
+if SERVING_ROLE and not SNAPSHOT_PATH:
+    raise ValueError("Serving from several processes requires the `SNAPSHOT_PATH` environment variable.")
+if SERVING_ROLE == "reader" and not COORDINATOR_URL:
+    raise ValueError("Readers require the `COORDINATOR_URL` environment variable.")
+
+replica: Optional[Replica] = None
+if SERVING_ROLE == "reader":
+    # Loaded up front, so that searches never wait for a library to load
+    replica = Replica(SNAPSHOT_PATH, interval=REFRESH_INTERVAL)
+    replica.start()
+    db = replica.db
+else:
+    # Libraries are loaded from the snapshot the first time they're used
+    db = Database.load(SNAPSHOT_PATH, lazy=True) if SNAPSHOT_PATH else Database()
+    if WAL_PATH:
+        db.open_wal(WAL_PATH, commit_delay=WAL_COMMIT_DELAY)
+    if SNAPSHOT_PATH and (LIBRARY_IDLE_TIMEOUT or LIBRARY_MEMORY_BUDGET_MB):
+        db.start_eviction(
+            idle_timeout=float(LIBRARY_IDLE_TIMEOUT) if LIBRARY_IDLE_TIMEOUT else None,
+            memory_budget=int(float(LIBRARY_MEMORY_BUDGET_MB) * 2**20) if LIBRARY_MEMORY_BUDGET_MB else None
+        )
+    if SERVING_ROLE == "coordinator":
+        db.start_publishing(interval=PUBLISH_INTERVAL, write_rate=PUBLISH_WRITE_RATE_MB * 2**20)
+
+def current_db() -> Database:
+    """The database, or in a reader, the latest version of it loaded from the snapshot."""
+    return replica.db if replica is not None else db
 
 async def get_db() -> Database:
-    return db
+    return current_db()
 
 async def get_library(library_name: str) -> Library:
     try:
-        library = db.get_library(name=library_name)
+        library = current_db().get_library(name=library_name)
     except KeyError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(e)
         )
-    return library
\ No newline at end of file
+    return library
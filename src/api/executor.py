@@ -0,0 +1,105 @@
+"""
+Thread pools the routes run their blocking work on, so the event loop itself never blocks and
+one slow request doesn't stall the others.
+
+- `io_executor` runs what mostly waits: requests to the embedding provider, and writes, which
+  embed their chunks and wait for the write-ahead log's fsync. It has more threads than cores.
+- `cpu_executor` runs the scoring of searches and index builds, which hold a core (numpy
+  releases the GIL), so it has one thread per core.
+
+Each pool only queues so many tasks: once `max_queued` wait for a thread, `submit` turns new
+requests away with a 503, so a burst is shed at the door instead of piling up latency for
+every request behind it.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from fastapi import HTTPException, status
+
+class BoundedExecutor:
+    """A thread pool with a bounded queue, and metrics of its queue and threads."""
+    def __init__(
+        self,
+        name: str,
+        max_workers: int,
+        max_queued: int
+    ):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        # Tasks waiting for a thread, and running
+        self.queued = 0
+        self.running = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        # Seconds the completed tasks waited in the queue, in total
+        self.queue_seconds = 0.0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> asyncio.Future:
+        """
+        Run `fn(*args, **kwargs)` on the pool, and return a future to await for its result.
+        Raises a 503 if `max_queued` tasks are already waiting. Must be called from the event
+        loop.
+        """
+        with self._lock:
+            if self.queued >= self.max_queued:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=f"The {self.name} pool is busy, {self.queued} tasks are waiting. Retry later.",
+                    headers={"Retry-After": "1"}
+                )
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        submitted = time.perf_counter()
+
+        def run():
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.queue_seconds += time.perf_counter() - submitted
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        future = self._pool.submit(run)
+        future.add_done_callback(self.__discard_cancelled)
+        return asyncio.wrap_future(future)
+
+    def __discard_cancelled(self, future):
+        # A task cancelled before it ran, e.g. the client went away, leaves the queue unseen
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "workers": self.max_workers,
+                "running": self.running,
+                "queued": self.queued,
+                "max_queued": self.max_queued,
+                "max_queue_depth": self.max_queue_depth,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "mean_queue_seconds": self.queue_seconds / self.completed if self.completed else 0.0
+            }
+
+# Threads of the pools, and number of tasks each of them queues before turning requests away
+IO_WORKERS = int(os.getenv("IO_WORKERS", "32"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+EXECUTOR_MAX_QUEUED = int(os.getenv("EXECUTOR_MAX_QUEUED", "256"))
+
+io_executor = BoundedExecutor("io", max_workers=IO_WORKERS, max_queued=EXECUTOR_MAX_QUEUED)
+cpu_executor = BoundedExecutor("cpu", max_workers=CPU_WORKERS, max_queued=EXECUTOR_MAX_QUEUED)
@@ -0,0 +1,65 @@
+"""
+Forwarding of the writes a reader process receives to the coordinator, when serving from
+several processes (see `serve.py`). A reader only holds a read-only replica of the database,
+so every request that may write, building an index and saving a snapshot included, is sent on
+to the coordinator as it came, and the coordinator's response returned as it is. The reader
+sees the write once the coordinator publishes it, within `PUBLISH_INTERVAL` and
+`REFRESH_INTERVAL` seconds.
+"""
+
+import httpx
+from fastapi import Request, Response, status
+from fastapi.responses import JSONResponse
+
+# Requests that only read, though they aren't GETs
+READ_ONLY = {
+    ("POST", "/api/library/query"),
+    ("POST", "/api/library/query/batch"),
+}
+# Headers that only concern a single connection, or the encoding of a body httpx has decoded
+HOP_BY_HOP = {
+    "connection",
+    "keep-alive",
+    "transfer-encoding",
+    "te",
+    "trailer",
+    "upgrade",
+    "host",
+    "content-length",
+    "content-encoding",
+}
+
+def is_write(request: Request) -> bool:
+    if request.method in ("GET", "HEAD", "OPTIONS"):
+        return False
+    return (request.method, request.url.path.rstrip("/")) not in READ_ONLY
+
+class Forwarder:
+    """HTTP middleware sending the writes to the coordinator at `url`, and serving the reads."""
+    def __init__(self, url: str, timeout: float = 300.0):
+        self.url = url
+        self.client = httpx.AsyncClient(base_url=url, timeout=timeout)
+
+    async def __call__(self, request: Request, call_next) -> Response:
+        if not is_write(request):
+            return await call_next(request)
+        headers = {key: value for key, value in request.headers.items() if key.lower() not in HOP_BY_HOP}
+        try:
+            response = await self.client.request(
+                request.method,
+                request.url.path,
+                params=request.query_params,
+                content=await request.body(),
+                headers=headers
+            )
+        except httpx.HTTPError as e:
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"detail": f"The coordinator at {self.url} is unavailable: {e!r}. Retry later."},
+                headers={"Retry-After": "1"}
+            )
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            headers={key: value for key, value in response.headers.items() if key.lower() not in HOP_BY_HOP}
+        )
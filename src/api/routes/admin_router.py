@@ -0,0 +1,44 @@
+import time
+from fastapi import APIRouter, HTTPException, Depends, status
+
+from ..dependency import get_db, SNAPSHOT_PATH
+from ..executor import io_executor, cpu_executor
+
+from vector_db import Database
+from api.schemas import SnapshotResponse, ExecutorsResponse
+
+router = APIRouter(prefix="/admin")
+
+@router.post("/snapshot")
+async def snapshot(
+    db: Database = Depends(get_db)
+):
+    """Write a snapshot of every library, their documents, chunks and embeddings, to the `SNAPSHOT_PATH` directory. The last snapshot is restored when the server starts, without embedding the chunks again."""
+    if not SNAPSHOT_PATH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Snapshots are disabled, set the `SNAPSHOT_PATH` environment variable to enable them."
+        )
+    start = time.perf_counter()
+    saving = io_executor.submit(db.save, SNAPSHOT_PATH)
+    try:
+        await saving
+    except OSError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+    libraries = db.get_libraries()
+    return SnapshotResponse(
+        path=SNAPSHOT_PATH,
+        libraries=len(libraries),
+        chunks=sum(library.num_of_chunks for library in libraries),
+        seconds=time.perf_counter() - start
+    )
+
+@router.get("/executors")
+async def executors() -> ExecutorsResponse:
+    """Load of the thread pools that run the blocking work of the requests: `io` for embedding requests and writes, `cpu` for scoring searches and building indexes. Requests are turned away with a 503 once `max_queued` tasks wait for a pool."""
+    return ExecutorsResponse(
+        executors=[io_executor.stats(), cpu_executor.stats()]
+    )
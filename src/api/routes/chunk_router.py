@@ -4,13 +4,17 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.responses import JSONResponse
 
 from ..dependency import get_library, get_db
+from ..executor import io_executor
 
 from vector_db import Library, Database, Chunk
 from api.schemas import (
     AddChunkRequest, 
     UpdateChunkRequest, 
     ResponseChunk,
-    LibraryResponseMessage
+    LibraryResponseMessage,
+    BulkUpdateChunksRequest,
+    BulkDeleteChunksRequest,
+    BulkChunkResponse
 )
 from exceptions import DuplicateError
 
@@ -22,18 +26,22 @@ async def get_chunks(
     library: Library = Depends(get_library)
 ):
     """Get all chunks from a library. If document_id is provided, then get all chunks from that document"""
-    if document_id:
-        try:
-            doc = library.get_document(id=document_id)
-            chunks_iter = doc.get_chunks()
-        except KeyError as e:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=str(e)
-            )
-    else:
-        chunks_iter = library.get_chunks()
-    chunks = [chunk.dict() for chunk in chunks_iter]
+    def read():
+        # Waits for the library's writes, and loads it if it's unloaded
+        if document_id:
+            chunks_iter = library.get_document(id=document_id).get_chunks()
+        else:
+            chunks_iter = library.get_chunks()
+        return [chunk.dict() for chunk in chunks_iter]
+
+    reading = io_executor.submit(read)
+    try:
+        chunks = await reading
+    except KeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content=chunks
@@ -45,8 +53,9 @@ async def get_chunk(
     library: Library = Depends(get_library)
 ):
     """Method to get a chunk from a library by its id"""
+    reading = io_executor.submit(lambda: library.get_chunk(chunk_id=id).dict())
     try:
-        chunk = library.get_chunk(chunk_id=id)
+        chunk = await reading
     except KeyError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -54,7 +63,7 @@ async def get_chunk(
         )
     return JSONResponse(
         status_code=status.HTTP_200_OK,
-        content=chunk.dict()
+        content=chunk
     )
 
 @router.post("/")
@@ -78,8 +87,9 @@ async def add_chunk(
                 metadata=chunk.metadata.model_dump()
             )
         )
+    adding = io_executor.submit(library.add_chunks, chunks=chunks)
     try:
-        library.add_chunks(chunks=chunks)
+        await adding
     except DuplicateError as e:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -94,14 +104,57 @@ async def add_chunk(
         message="Chunks added successfully"
     )
     
+@router.post("/bulk-update")
+async def bulk_update_chunks(
+    request: BulkUpdateChunksRequest,
+    db: Database = Depends(get_db)
+) -> BulkChunkResponse:
+    """Update the text of many chunks of a library. The changed texts are re-embedded in batches
+    and the index is updated in one pass. Chunks that don't exist are reported as `not_found`
+    instead of failing the request."""
+    try:
+        library = db.get_library(name=request.library_name)
+    except KeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    statuses = await io_executor.submit(
+        library.update_chunks,
+        texts={chunk.id: chunk.text for chunk in request.chunks}
+    )
+    return BulkChunkResponse(
+        results=[{"id": id, "status": chunk_status} for id, chunk_status in statuses.items()]
+    )
+
+@router.post("/bulk-delete")
+async def bulk_remove_chunks(
+    request: BulkDeleteChunksRequest,
+    db: Database = Depends(get_db)
+) -> BulkChunkResponse:
+    """Remove many chunks from a library in one pass over the index. Chunks that don't exist
+    are reported as `not_found` instead of failing the request."""
+    try:
+        library = db.get_library(name=request.library_name)
+    except KeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    statuses = await io_executor.submit(library.remove_chunks, chunk_ids=request.ids)
+    return BulkChunkResponse(
+        results=[{"id": id, "status": chunk_status} for id, chunk_status in statuses.items()]
+    )
+    
 @router.patch("/{id}")
 async def update_chunk(
     id: str, request: UpdateChunkRequest, 
     library: Library = Depends(get_library)
 ):
     """Update a chunk text from a library"""
+    updating = io_executor.submit(library.update_chunk, chunk_id=id, text=request.text)
     try:
-        library.update_chunk(chunk_id=id, text=request.text)
+        await updating
     except KeyError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -117,8 +170,9 @@ async def remove_chunk(
     library: Library = Depends(get_library)
 ):
     """Remove a chunk from a library"""
+    removing = io_executor.submit(library.remove_chunk, chunk_id=id)
     try:
-        library.remove_chunk(chunk_id=id)
+        await removing
     except KeyError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -5,6 +5,7 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from ..dependency import get_library, get_db
+from ..executor import io_executor
 from api.schemas import AddDocumentRequest, ResponseDocument, LibraryResponseMessage
 
 from vector_db import Library, Document, Database
@@ -17,14 +18,15 @@ async def get_documents(
     library: Library = Depends(get_library)
 ):
     """Method to get all documents from a library"""
+    # Waits for the library's writes, and loads it if it's unloaded
+    reading = io_executor.submit(lambda: [doc.dict() for doc in library.get_documents()])
     try:
-        docs = library.get_documents()
+        response = await reading
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
-    response = [doc.dict() for doc in docs]
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content=response
@@ -36,8 +38,9 @@ async def get_document(
     library: Library = Depends(get_library)
 ):
     """Method to get a document from a library by its id"""
+    reading = io_executor.submit(lambda: library.get_document(id=doc_id).dict())
     try:
-        doc = library.get_document(id=doc_id)
+        doc = await reading
     except KeyError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -45,7 +48,7 @@ async def get_document(
         )
     return JSONResponse(
         status_code=status.HTTP_200_OK,
-        content=doc.dict()
+        content=doc
     )
     
 @router.post("/")
@@ -61,13 +64,15 @@ async def add_document(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(e)
         )
-    try:
-        doc = library.add_document(
-            document=Document(
-                name=request.name,
-                metadata=request.metadata.dict()
-            )
+    adding = io_executor.submit(
+        library.add_document,
+        document=Document(
+            name=request.name,
+            metadata=request.metadata.dict()
         )
+    )
+    try:
+        doc = await adding
     except DuplicateError as e:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -85,8 +90,9 @@ async def remove_document(
     library: Library = Depends(get_library)
 ):
     """Remove a document from a library"""
+    removing = io_executor.submit(library.remove_document, id=doc_id)
     try:
-        library.remove_document(id=doc_id)
+        await removing
     except KeyError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
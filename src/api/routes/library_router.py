@@ -5,12 +5,14 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from ..dependency import get_db, get_library as get_library_
+from ..executor import io_executor, cpu_executor
 
 from api.schemas import (
     AddLibraryRequest,
     LibraryResponseMessage,
     IndexTypes as RequestIndexTypes,
     QueryLibraryRequest,
+    BatchQueryLibraryRequest,
     UpdateLibraryRequest,
     ResponseLibrary,
     ResponseChunk
@@ -60,16 +62,24 @@ async def add_library(
     db: Database = Depends(get_db)
 ):
     """Add a library to the database."""
+    lib = Library(**library.model_dump(mode='json', include={'name', 'metadata', 'embedding_provider', 'metric'}))
     try:
-        lib = db.add_library(
-            Library(**library.dict())
+        lib.add_vector_search_index(index_type, **library.index_params(index_type))
+    except ValueError as e:
+        # Index parameters that don't fit the embedding provider, e.g. PQ sub-quantizers, or a
+        # metric the index doesn't support
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
         )
+    adding = io_executor.submit(db.add_library, lib)
+    try:
+        await adding
     except DuplicateError as e:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=str(e)
         )
-    lib.add_vector_search_index(index_type)
     
     return LibraryResponseMessage(
             message="Library added successfully"
@@ -88,11 +98,13 @@ async def update_library(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(e)
         )
+    renaming = io_executor.submit(
+        db.update_library_name,
+        previous_name=request.library_name,
+        new_name=request.new_name
+    )
     try:
-        db.update_library_name(
-            previous_name=request.library_name,
-            new_name=request.new_name
-        )
+        await renaming
     except KeyError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -113,8 +125,9 @@ async def remove_library(
     db: Database = Depends(get_db)
 ):
     """Remove a library from the database."""
+    removing = io_executor.submit(db.remove_library, name)
     try:
-        db.remove_library(name)
+        await removing
     except KeyError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -135,9 +148,10 @@ async def remove_library(
 async def build_index(
     library: Library = Depends(get_library_)
 ):
-    """Build the library's vector search index. Do this only when you have added all your chunks to the library."""
+    """Build the library's vector search index. Indexes are searchable right after every write, so this is optional: it merges the writes still waiting in the delta segment, retrains IVF centroids once the lists have become unbalanced, retrains PQ codebooks and int8 ranges, and purges HNSW tombstones."""
+    building = cpu_executor.submit(library.build_index)
     try:
-        library.build_index()
+        await building
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -152,7 +166,7 @@ async def query(
     request: QueryLibraryRequest, 
     db: Database = Depends(get_db)
 ):
-    """Perform a search on a library to retrieve relevant chunks."""
+    """Perform a search on a library to retrieve relevant chunks, optionally only among the chunks whose metadata matches `filter`. The query is either a text, a vector, which skips the embedding provider, or the id of a chunk of the library, to retrieve the chunks most like it. Every chunk comes with its `score`: its distance to the query with the `l2` metric, its similarity with `cosine` and `dot`. Chunks beyond `max_distance` or below `min_score` are left out."""
     try:
         library = db.get_library(name=request.library_name)
     except KeyError as e:
@@ -160,9 +174,40 @@ async def query(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(e)
         )
+    search_params = dict(
+        k=request.k,
+        filter=request.filter.expression() if request.filter else None,
+        max_distance=request.max_distance,
+        min_score=request.min_score
+    )
+    if request.vector is not None:
+        search = cpu_executor.submit(library.search_by_vector, vector=request.vector, **search_params)
+    elif request.chunk_id is not None:
+        search = cpu_executor.submit(library.search_by_chunk, chunk_id=request.chunk_id, **search_params)
+    else:
+        # The query is embedded on the I/O pool, and only scored on the CPU pool
+        embedding = io_executor.submit(library.embed_query, request.query)
+        try:
+            vector = await embedding
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=str(e)
+            )
+        search = cpu_executor.submit(library.search_by_vector, vector=vector, **search_params)
     try:
-        results = library.search(query=request.query, k=request.k)
-        chunks = [chunk.dict() for chunk in results]
+        results = await search
+        chunks = [{**chunk.dict(), "score": score} for chunk, score in results]
+    except KeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -171,4 +216,55 @@ async def query(
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content=chunks
-    )
\ No newline at end of file
+    )
+
+@router.post("/query/batch")
+async def query_batch(
+    request: BatchQueryLibraryRequest,
+    db: Database = Depends(get_db)
+):
+    """Perform many searches on a library at once. The queries are embedded with one request to the embedding provider, and the chunks are scored for all of them together. Returns the relevant chunks of every query, with their scores, in the order of the queries."""
+    try:
+        library = db.get_library(name=request.library_name)
+    except KeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    filter = request.filter.expression() if request.filter else None
+    embedding = io_executor.submit(library.embed_queries, request.queries)
+    try:
+        vectors = await embedding
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+    search = cpu_executor.submit(
+        library.search_many_by_vector,
+        vectors=vectors,
+        k=request.k,
+        filter=filter,
+        max_distance=request.max_distance,
+        min_score=request.min_score
+    )
+    try:
+        results = await search
+        chunks = [
+            [{**chunk.dict(), "score": score} for chunk, score in query_results]
+            for query_results in results
+        ]
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=chunks
+    )
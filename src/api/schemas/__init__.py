@@ -2,7 +2,17 @@ from .library import (
     AddLibraryRequest,
     LibraryResponseMessage,
     IndexTypes,
+    EmbeddingProviders,
+    Metrics,
+    Quantizations,
+    FlatL2Params,
+    LSHParams,
+    HNSWParams,
+    IVFParams,
+    PQParams,
+    MetadataFilter,
     QueryLibraryRequest,
+    BatchQueryLibraryRequest,
     UpdateLibraryRequest,
     ResponseLibrary
 )
@@ -15,5 +25,13 @@ from .documents import (
 from .chunk import (
     AddChunkRequest,
     UpdateChunkRequest,
-    ResponseChunk
-)
\ No newline at end of file
+    ResponseChunk,
+    BulkUpdateChunksRequest,
+    BulkDeleteChunksRequest,
+    BulkChunkResponse
+)
+from .admin import (
+    SnapshotResponse,
+    ExecutorStats,
+    ExecutorsResponse
+)
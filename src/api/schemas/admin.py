@@ -0,0 +1,22 @@
+from typing import List
+from pydantic import BaseModel, Field
+
+class SnapshotResponse(BaseModel):
+    path: str = Field(description="Directory the snapshot was written to")
+    libraries: int
+    chunks: int
+    seconds: float
+
+class ExecutorStats(BaseModel):
+    name: str
+    workers: int
+    running: int
+    queued: int = Field(description="Tasks waiting for a thread")
+    max_queued: int = Field(description="Tasks that can wait before requests are turned away")
+    max_queue_depth: int = Field(description="Most tasks that have waited at once")
+    completed: int
+    rejected: int
+    mean_queue_seconds: float = Field(description="Mean time the completed tasks waited for a thread")
+
+class ExecutorsResponse(BaseModel):
+    executors: List[ExecutorStats]
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from enum import Enum
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from api.schemas.metadata import ChunkMetadata
 
@@ -17,4 +18,29 @@ class ResponseChunk(BaseModel):
     id: str
     text: str
     embedding: Optional[List[float]]
-    metadata: Optional[ChunkMetadata]
\ No newline at end of file
+    metadata: Optional[ChunkMetadata]
+
+class ChunkTextUpdate(BaseModel):
+    id: str
+    text: str
+
+class BulkUpdateChunksRequest(BaseModel):
+    library_name: str
+    chunks: List[ChunkTextUpdate] = Field(description="New text of every chunk. If a chunk is listed more than once, the last text wins")
+
+class BulkDeleteChunksRequest(BaseModel):
+    library_name: str
+    ids: List[str]
+
+class ChunkStatuses(str, Enum):
+    Updated = 'updated'
+    Unchanged = 'unchanged'
+    Removed = 'removed'
+    NotFound = 'not_found'
+
+class ChunkStatus(BaseModel):
+    id: str
+    status: ChunkStatuses
+
+class BulkChunkResponse(BaseModel):
+    results: List[ChunkStatus]
@@ -1,15 +1,72 @@
 from enum import Enum
-from pydantic import BaseModel, Field
-from typing import Optional
-from api.schemas.metadata import LibraryMetadata
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import Any, Dict, List, Optional, Union
+from api.schemas.metadata import LibraryMetadata, ChunkMetadata
 
 class IndexTypes(str, Enum):
     FlatL2 = 'flatl2'
     LSH = 'lsh'
+    HNSW = 'hnsw'
+    IVF = 'ivf'
+    PQ = 'pq'
+
+class Quantizations(str, Enum):
+    Float16 = 'float16'
+    Int8 = 'int8'
+
+class Metrics(str, Enum):
+    L2 = 'l2'
+    Cosine = 'cosine'
+    Dot = 'dot'
+
+class EmbeddingProviders(str, Enum):
+    Cohere = 'cohere'
+    Hashing = 'hashing'
+    SentenceTransformers = 'sentence-transformers'
+
+class FlatL2Params(BaseModel):
+    quantization: Optional[Quantizations] = Field(default=None, description="Keep the scanned embeddings as float16, or int8 with a scale and offset per dimension")
+    rerank_factor: int = Field(default=4, ge=0, description="With quantization, re-rank the k * rerank_factor closest chunks with their full embeddings. 0 disables re-ranking")
+
+class LSHParams(BaseModel):
+    tables: int = Field(default=4, ge=1, description="Number of independent hash tables")
+    bits: int = Field(default=16, ge=1, le=64, description="Number of hyperplanes, i.e. bits per key, in each table")
+    probes: int = Field(default=8, ge=1, description="Number of buckets probed per table, by increasing Hamming radius")
+    candidate_limit: int = Field(default=2000, ge=1, description="Stop probing once this many candidates are gathered")
+    seed: Optional[int] = Field(default=None, ge=0, description="Seed of the random hyperplanes. Drawn when the library is created if not given, and kept with the library")
+
+class HNSWParams(BaseModel):
+    M: int = Field(default=16, ge=2, description="Maximum number of neighbours per node and layer (2M in the bottom layer)")
+    ef_construction: int = Field(default=100, ge=1, description="Size of the candidate list when inserting a node")
+    ef_search: int = Field(default=64, ge=1, description="Size of the candidate list when searching")
+
+class IVFParams(BaseModel):
+    n_lists: Optional[int] = Field(default=None, ge=1, description="Number of k-means cells. Defaults to the square root of the number of chunks at training time")
+    nprobe: int = Field(default=8, ge=1, description="Number of closest lists scanned per query")
+    imbalance_factor: float = Field(default=3.0, gt=1, description="Retrain on build once the longest list holds this many times the average")
+    pq_m: Optional[int] = Field(default=None, ge=1, description="Store chunks as this many product quantization codes, with the full embeddings on disk")
+    rerank_factor: int = Field(default=4, ge=0, description="With pq_m, re-rank the k * rerank_factor closest chunks with their full embeddings. 0 disables re-ranking")
+
+class PQParams(BaseModel):
+    m: int = Field(default=64, ge=1, description="Number of sub-quantizers, i.e. bytes per chunk. Must divide the embedding dimension")
+    rerank_factor: int = Field(default=4, ge=0, description="Re-rank the k * rerank_factor closest chunks with their full embeddings. 0 disables re-ranking")
 
 class AddLibraryRequest(BaseModel):
     name: str
     metadata: Optional[LibraryMetadata] = None
+    embedding_provider: EmbeddingProviders = EmbeddingProviders.Cohere
+    metric: Metrics = Field(default=Metrics.L2, description="Rank chunks by Euclidean distance, cosine similarity or dot product. The hnsw, ivf and pq indexes support l2 and cosine")
+    # Parameters of each index type, named after the index type
+    flatl2: Optional[FlatL2Params] = None
+    lsh: Optional[LSHParams] = None
+    hnsw: Optional[HNSWParams] = None
+    ivf: Optional[IVFParams] = None
+    pq: Optional[PQParams] = None
+
+    def index_params(self, index_type: IndexTypes) -> Dict[str, Any]:
+        """Parameters given for the chosen index type, if any."""
+        params = getattr(self, index_type.value, None)
+        return params.model_dump(mode='json') if params else {}
     
 class LibraryResponseMessage(BaseModel):
     message: str = Field(default="Library added successfully, index built successfully, etc.")
@@ -19,11 +76,68 @@ class UpdateLibraryRequest(BaseModel):
     new_name: str
     metadata: Optional[LibraryMetadata] = None
     
+FilterValue = Union[int, float, str]
+
+class MetadataFilter(BaseModel):
+    """A condition on a chunk metadata field, e.g. `{"field": "page_number", "gte": 1, "lt": 5}`,
+    or `and`/`or` over a list of filters."""
+    model_config = ConfigDict(populate_by_name=True)
+
+    field: Optional[str] = Field(default=None, description="Chunk metadata field to filter on")
+    eq: Optional[FilterValue] = None
+    in_: Optional[List[FilterValue]] = Field(default=None, alias="in")
+    gt: Optional[FilterValue] = None
+    gte: Optional[FilterValue] = None
+    lt: Optional[FilterValue] = None
+    lte: Optional[FilterValue] = None
+    and_: Optional[List["MetadataFilter"]] = Field(default=None, alias="and", min_length=1)
+    or_: Optional[List["MetadataFilter"]] = Field(default=None, alias="or", min_length=1)
+
+    @model_validator(mode="after")
+    def check_filter(self):
+        operators = [self.eq, self.in_, self.gt, self.gte, self.lt, self.lte]
+        conditions = sum(x is not None for x in (self.and_, self.or_, self.field))
+        if conditions != 1:
+            raise ValueError("A filter is exactly one of a field condition, `and` or `or`.")
+        if self.field is not None:
+            if self.field not in ChunkMetadata.model_fields:
+                raise ValueError(f"Unknown chunk metadata field `{self.field}`, use one of {', '.join(ChunkMetadata.model_fields)}.")
+            if all(op is None for op in operators):
+                raise ValueError("A field condition needs one of eq, in, gt, gte, lt or lte.")
+        elif any(op is not None for op in operators):
+            raise ValueError("Operators need a `field`.")
+        return self
+
+    def expression(self) -> Dict[str, Any]:
+        """The filter as the expression searched by the vector search index."""
+        return self.model_dump(by_alias=True, exclude_none=True)
+
 class QueryLibraryRequest(BaseModel):
     library_name: str
-    query: str
+    query: Optional[str] = Field(default=None, description="Text to embed and search for")
+    vector: Optional[List[float]] = Field(default=None, description="Query vector, searched as is without calling the embedding provider")
+    chunk_id: Optional[str] = Field(default=None, description="Search for the chunks most like this chunk, with its stored embedding")
+    k: int
+    filter: Optional[MetadataFilter] = Field(default=None, description="Only return chunks whose metadata matches this filter")
+    max_distance: Optional[float] = Field(default=None, description="Only return chunks within this distance of the query, for libraries with the `l2` metric")
+    min_score: Optional[float] = Field(default=None, description="Only return chunks scoring at least this similarity, for libraries with the `cosine` or `dot` metric")
+
+    @model_validator(mode="after")
+    def check_query(self):
+        if sum(x is not None for x in (self.query, self.vector, self.chunk_id)) != 1:
+            raise ValueError("Exactly one of `query`, `vector` or `chunk_id` must be provided.")
+        return self
+
+class BatchQueryLibraryRequest(BaseModel):
+    library_name: str
+    queries: List[str] = Field(min_length=1)
     k: int
+    filter: Optional[MetadataFilter] = Field(default=None, description="Only return chunks whose metadata matches this filter, for every query")
+    max_distance: Optional[float] = Field(default=None, description="Only return chunks within this distance of their query, for libraries with the `l2` metric")
+    min_score: Optional[float] = Field(default=None, description="Only return chunks scoring at least this similarity, for libraries with the `cosine` or `dot` metric")
     
 class ResponseLibrary(BaseModel):
     name: str = Field(default="library_name")
-    metadata: LibraryMetadata
\ No newline at end of file
+    metadata: LibraryMetadata
+    embedding_provider: str = Field(default="cohere")
+    metric: Metrics = Metrics.L2
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""
+Latency of a batch of queries searched one at a time against the same batch searched at once,
+with a single embedding request and a single matrix product over the FlatL2 index.
+
+    python -m benchmarks.batch_query --chunks 100000 --batch 32
+"""
+import argparse
+from utils.embed import HashingEmbeddingProvider
+from vector_db.index import FlatL2Index
+from .common import make_corpus, make_chunks, timed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    provider = HashingEmbeddingProvider(dim=args.dim)
+    texts, queries = make_corpus(args.chunks, args.batch)
+    index = FlatL2Index(embedding_provider=provider)
+    index.add(make_chunks(texts, provider))
+
+    one_by_one = min(
+        timed(lambda: [index.search(query, args.k) for query in queries])[1]
+        for _ in range(args.repeat)
+    )
+    batched = min(timed(index.search_many, queries, args.k)[1] for _ in range(args.repeat))
+    same = all(
+        [chunk.id for chunk, _ in single] == [chunk.id for chunk, _ in many]
+        for single, many in zip([index.search(query, args.k) for query in queries], index.search_many(queries, args.k))
+    )
+    print(f'{args.chunks} chunks, {args.dim} dims, {args.batch} queries, k={args.k}')
+    print(f'{"search":<12} {"batch ms":>9}')
+    print(f'{"one by one":<12} {1000 * one_by_one:>9.1f}')
+    print(f'{"batched":<12} {1000 * batched:>9.1f}')
+    print(f'speedup x{one_by_one / batched:.1f}, same results: {same}')
+
+if __name__ == '__main__':
+    main()
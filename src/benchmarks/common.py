@@ -0,0 +1,62 @@
+"""
+Helpers shared by the benchmarks: a synthetic corpus embedded offline with the hashing
+provider, and recall measured against an exact FlatL2 search.
+"""
+import time
+from typing import Callable, List, Sequence, Tuple
+import numpy as np
+from utils.embed import HashingEmbeddingProvider
+from vector_db import Chunk
+from vector_db.index import BaseVectorSearchIndex
+
+def make_corpus(
+    n_chunks: int,
+    n_queries: int,
+    n_topics: int = 100,
+    vocabulary: int = 20000,
+    words_per_chunk: int = 24,
+    seed: int = 0
+) -> Tuple[List[str], List[str]]:
+    """
+    Texts drawn from topics: most words of a text come from the words of its topic, the rest
+    from the whole vocabulary, so that texts of a topic end up close to each other.
+    """
+    rng = np.random.default_rng(seed)
+    topic_words = rng.integers(vocabulary, size=(n_topics, 200))
+
+    def texts(n: int, length: int) -> List[str]:
+        topics = rng.integers(n_topics, size=n)
+        own = rng.random((n, length)) < 0.7
+        words = np.where(
+            own,
+            topic_words[topics[:, None], rng.integers(200, size=(n, length))],
+            rng.integers(vocabulary, size=(n, length))
+        )
+        return [' '.join(f'w{word}' for word in row) for row in words.tolist()]
+
+    return texts(n_chunks, words_per_chunk), texts(n_queries, words_per_chunk // 3)
+
+def make_chunks(texts: Sequence[str], provider: HashingEmbeddingProvider) -> List[Chunk]:
+    chunks = [Chunk(text=text, metadata={'position': i}) for i, text in enumerate(texts)]
+    for chunk, embedding in zip(chunks, provider.embed_in_batches(list(texts))):
+        chunk.embedding = embedding
+    return chunks
+
+def timed(fn: Callable, *args, **kwargs) -> Tuple[object, float]:
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def search_positions(index: BaseVectorSearchIndex, queries: Sequence[str], k: int) -> Tuple[List[List[int]], float]:
+    """
+    Positions in the corpus of the results of every query, which unlike chunk ids are the same
+    across indexes, and the mean latency in milliseconds.
+    """
+    results, elapsed = timed(lambda: [
+        [chunk.metadata['position'] for chunk, _ in index.search(query, k)] for query in queries
+    ])
+    return results, 1000 * elapsed / len(queries)
+
+def recall_at_k(results: List[List[int]], expected: List[List[int]], k: int) -> float:
+    hits = sum(len(set(found[:k]) & set(truth[:k])) for found, truth in zip(results, expected))
+    return hits / (k * len(expected))
@@ -0,0 +1,127 @@
+"""
+Query throughput of the API served by `serve.py` with 1 reader process and with `--workers`,
+and the memory the readers hold, as their proportional set size: pages shared by several
+processes, like those of the memory-mapped embeddings, are split between them, so the total
+grows by the embeddings once, not once per reader.
+
+    python -m benchmarks.multiprocess_query --chunks 50000 --workers 4 --clients 16
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import httpx
+import numpy as np
+from utils.embed import HashingEmbeddingProvider
+from vector_db import Database, Library, Document
+from vector_db.index import IndexTypes
+from .common import make_corpus, make_chunks
+
+def save_snapshot(path: str, chunks, provider):
+    db = Database()
+    library = db.add_library(Library(name='bench', metadata={}, embedding_provider=provider))
+    library.add_vector_search_index(IndexTypes.FLATL2)
+    doc = library.add_document(Document(name='doc', metadata={}))
+    for chunk in chunks:
+        chunk.metadata['doc_id'] = doc.id
+    library.add_chunks(chunks)
+    db.save(path)
+
+def descendants(pid: int):
+    children = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as f:
+            children += [int(child) for child in f.read().split()]
+    return children + [grandchild for child in children for grandchild in descendants(child)]
+
+def pss_mb(pid: int) -> float:
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def readers(server: subprocess.Popen, workers: int):
+    # A single reader runs in the launcher's process, more are spawned by `uvicorn.run`
+    if workers == 1:
+        return [server.pid]
+    processes = []
+    for pid in descendants(server.pid):
+        with open(f'/proc/{pid}/cmdline') as f:
+            if 'multiprocessing.spawn' in f.read():
+                processes.append(pid)
+    return processes
+
+def serve(snapshot_path: str, workers: int, port: int):
+    server = subprocess.Popen(
+        [sys.executable, 'serve.py', '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port), '--coordinator-port', str(port + 1)],
+        env={**os.environ, 'SNAPSHOT_PATH': snapshot_path},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/api/library/', timeout=1.0)
+            if len(readers(server, workers)) == workers:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('The server did not start.')
+
+def load(port: int, vectors: np.ndarray, clients: int, seconds: float, k: int) -> float:
+    """Queries per second of `clients` concurrent clients searching the given vectors."""
+    stop = time.monotonic() + seconds
+    counts = [0] * clients
+
+    def client(i):
+        with httpx.Client(base_url=f'http://127.0.0.1:{port}/api', timeout=60.0) as http:
+            while time.monotonic() < stop:
+                vector = vectors[(i + counts[i] * clients) % len(vectors)]
+                response = http.post('/library/query', json={'library_name': 'bench', 'vector': vector.tolist(), 'k': k})
+                response.raise_for_status()
+                counts[i] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--port', type=int, default=8100)
+    args = parser.parse_args()
+
+    provider = HashingEmbeddingProvider(dim=args.dim)
+    texts, queries = make_corpus(args.chunks, 256)
+    vectors = np.asarray(provider.embed_in_batches(queries), dtype=np.float32)
+    embeddings_mb = args.chunks * args.dim * 4 / 2**20
+    print(f'{args.chunks} chunks, {args.dim} dims, {embeddings_mb:.0f} MB of embeddings, {args.clients} clients')
+    print(f'{"readers":>7} {"queries/s":>10} {"readers PSS MB":>15}')
+    with tempfile.TemporaryDirectory() as path:
+        save_snapshot(path, make_chunks(texts, provider), provider)
+        for workers in sorted({1, args.workers}):
+            server = serve(path, workers, args.port)
+            try:
+                qps = load(args.port, vectors, args.clients, args.seconds, args.k)
+                pss = sum(pss_mb(pid) for pid in readers(server, workers))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f'{workers:>7} {qps:>10.1f} {pss:>15.0f}')
+
+if __name__ == '__main__':
+    main()
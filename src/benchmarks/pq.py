@@ -0,0 +1,51 @@
+"""
+Memory per vector, latency and recall@k of the product quantized indexes against FlatL2.
+
+    python -m benchmarks.pq --chunks 20000 --dim 1024 --m 64
+"""
+import argparse
+from utils.embed import HashingEmbeddingProvider
+from vector_db.index import FlatL2Index, IVFIndex, PQIndex
+from .common import make_corpus, make_chunks, recall_at_k, search_positions, timed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--m', type=int, default=64)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--rerank-factor', type=int, default=4)
+    parser.add_argument('--nprobe', type=int, default=8)
+    args = parser.parse_args()
+
+    provider = HashingEmbeddingProvider(dim=args.dim)
+    texts, queries = make_corpus(args.chunks, args.queries)
+    indexes = {
+        'flatl2': FlatL2Index(embedding_provider=provider),
+        'pq': PQIndex(embedding_provider=provider, m=args.m, rerank_factor=0, seed=0),
+        f'pq, re-rank x{args.rerank_factor}': PQIndex(
+            embedding_provider=provider, m=args.m, rerank_factor=args.rerank_factor, seed=0
+        ),
+        f'ivf-pq, nprobe {args.nprobe}, re-rank x{args.rerank_factor}': IVFIndex(
+            embedding_provider=provider, nprobe=args.nprobe, pq_m=args.m,
+            rerank_factor=args.rerank_factor, seed=0
+        ),
+    }
+    expected = None
+    print(f'{args.chunks} chunks, {args.dim} dims, {args.queries} queries, k={args.k}')
+    print(f'{"index":<36} {"bytes/vector":>12} {"build s":>8} {"query ms":>9} {"recall@k":>9}')
+    for name, index in indexes.items():
+        index.add(make_chunks(texts, provider))
+        _, build_time = timed(index.build_index)
+        results, latency = search_positions(index, queries, args.k)
+        if expected is None:
+            expected = results
+        bytes_per_vector = getattr(index, 'bytes_per_vector', 4 * args.dim)
+        print(
+            f'{name:<36} {bytes_per_vector:>12} {build_time:>8.2f} {latency:>9.2f} '
+            f'{recall_at_k(results, expected, args.k):>9.3f}'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Memory per vector, latency and recall@k of the quantized FlatL2 scans against the float32 one.
+
+    python -m benchmarks.quantization --chunks 50000 --dim 1024
+"""
+import argparse
+from utils.embed import HashingEmbeddingProvider
+from vector_db.index import FlatL2Index
+from .common import make_corpus, make_chunks, recall_at_k, search_positions, timed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--rerank-factor', type=int, default=4)
+    args = parser.parse_args()
+
+    provider = HashingEmbeddingProvider(dim=args.dim)
+    texts, queries = make_corpus(args.chunks, args.queries)
+    configurations = {'float32': {}}
+    for quantization in ('float16', 'int8'):
+        configurations[quantization] = dict(quantization=quantization, rerank_factor=0)
+        configurations[f'{quantization}, re-rank x{args.rerank_factor}'] = dict(
+            quantization=quantization, rerank_factor=args.rerank_factor
+        )
+    expected = None
+    print(f'{args.chunks} chunks, {args.dim} dims, {args.queries} queries, k={args.k}')
+    print(f'{"index":<24} {"bytes/vector":>12} {"build s":>8} {"query ms":>9} {"recall@k":>9}')
+    for name, params in configurations.items():
+        index = FlatL2Index(embedding_provider=provider, **params)
+        index.add(make_chunks(texts, provider))
+        _, build_time = timed(index.build_index)
+        results, latency = search_positions(index, queries, args.k)
+        if expected is None:
+            expected = results
+        print(
+            f'{name:<24} {index.bytes_per_vector:>12} {build_time:>8.2f} {latency:>9.2f} '
+            f'{recall_at_k(results, expected, args.k):>9.3f}'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Ingest throughput with the write-ahead log off, and on with concurrent writers sharing fsyncs
+(group commit). Every writer adds already embedded chunks to the same library, `--batch` per
+write, so the benchmark measures the log and not the embedding provider.
+
+    python -m benchmarks.wal_ingest --chunks 20000 --batch 1 --writers 8
+"""
+import argparse
+import os
+import tempfile
+import threading
+from utils.embed import HashingEmbeddingProvider
+from vector_db import Database, Library, Document
+from vector_db.index import IndexTypes
+from .common import make_corpus, make_chunks, timed
+
+def ingest(chunks, provider, writers: int, batch: int, wal_path=None, commit_delay=0.0):
+    db = Database()
+    if wal_path:
+        db.open_wal(wal_path, commit_delay=commit_delay)
+    library = db.add_library(Library(name='bench', metadata={}, embedding_provider=provider))
+    library.add_vector_search_index(IndexTypes.FLATL2)
+    doc = library.add_document(Document(name='doc', metadata={}))
+    for chunk in chunks:
+        chunk.metadata['doc_id'] = doc.id
+    batches = [chunks[start:start + batch] for start in range(0, len(chunks), batch)]
+
+    def writer(i):
+        for chunk_batch in batches[i::writers]:
+            library.add_chunks(chunk_batch)
+
+    def run():
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    _, elapsed = timed(run)
+    return len(batches), elapsed, db.wal.fsyncs if db.wal else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--commit-delay', type=float, default=0.001)
+    args = parser.parse_args()
+
+    provider = HashingEmbeddingProvider(dim=args.dim)
+    texts, _ = make_corpus(args.chunks, 0)
+    configurations = {
+        'off': dict(writers=args.writers),
+        'on, 1 writer': dict(writers=1, wal=True),
+        f'on, {args.writers} writers': dict(writers=args.writers, wal=True),
+        f'on, {args.writers} writers, delay': dict(writers=args.writers, wal=True, commit_delay=args.commit_delay),
+    }
+    print(f'{args.chunks} chunks, {args.dim} dims, {args.batch} chunks per write')
+    print(f'{"wal":<24} {"chunks/s":>9} {"writes":>7} {"fsyncs":>7} {"writes/fsync":>13}')
+    with tempfile.TemporaryDirectory() as directory:
+        for name, config in configurations.items():
+            wal_path = os.path.join(directory, f'{len(os.listdir(directory))}.log') if config.get('wal') else None
+            writes, elapsed, fsyncs = ingest(
+                make_chunks(texts, provider),
+                provider,
+                writers=config['writers'],
+                batch=args.batch,
+                wal_path=wal_path,
+                commit_delay=config.get('commit_delay', 0.0)
+            )
+            per_fsync = f'{writes / fsyncs:>13.1f}' if fsyncs else f'{"-":>13}'
+            print(f'{name:<24} {args.chunks / elapsed:>9.0f} {writes:>7} {fsyncs:>7} {per_fsync}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Serve the API from several processes, so that searches use every core, while the embeddings
+are only held in memory once:
+
+    SNAPSHOT_PATH=./snapshot WAL_PATH=./wal python serve.py --workers 4 --port 8000
+
+One coordinator process, listening on `--coordinator-port` of localhost, takes every write and
+publishes it to the snapshot in `SNAPSHOT_PATH` (see `Database.start_publishing`). `--workers`
+reader processes share `--port`: each serves the reads from a replica of the snapshot, whose
+embeddings are memory-mapped from the same files (see `vector_db.replica`), and forwards the
+writes to the coordinator (see `api.proxy`).
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import httpx
+import uvicorn
+
+def wait_for(url: str, process: subprocess.Popen, timeout: float = 120.0):
+    """Wait for the coordinator to answer, which it does once its database is loaded."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f'The coordinator exited with code {process.returncode}.')
+        try:
+            httpx.get(f'{url}/api/library/', timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    sys.exit(f'The coordinator at {url} did not start within {timeout:.0f} seconds.')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--coordinator-port', type=int, default=8001)
+    args = parser.parse_args()
+    if not os.getenv('SNAPSHOT_PATH'):
+        sys.exit('Set the `SNAPSHOT_PATH` environment variable to the directory of the snapshot to serve.')
+
+    # Stop the coordinator too when stopped before the readers run, see below
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    coordinator_url = f'http://127.0.0.1:{args.coordinator_port}'
+    coordinator = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--host', '127.0.0.1', '--port', str(args.coordinator_port)],
+        env={**os.environ, 'SERVING_ROLE': 'coordinator'}
+    )
+    try:
+        # Started once the coordinator has replayed the write-ahead log, so it's ready for writes
+        wait_for(coordinator_url, coordinator)
+        # Inherited by the reader processes
+        os.environ['SERVING_ROLE'] = 'reader'
+        os.environ['COORDINATOR_URL'] = coordinator_url
+        uvicorn.run('server:app', host=args.host, port=args.port, workers=args.workers)
+    finally:
+        coordinator.terminate()
+        coordinator.wait()
+
+if __name__ == '__main__':
+    main()
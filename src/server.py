@@ -4,8 +4,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from api.routes import (
     library_router,
     document_router,
-    chunk_router
+    chunk_router,
+    admin_router
 )
+from api.dependency import SERVING_ROLE, COORDINATOR_URL
+from api.proxy import Forwarder
 
 app = FastAPI(
     title="vector-db",
@@ -14,4 +17,9 @@ app = FastAPI(
 
 app.include_router(library_router.router, prefix="/api")
 app.include_router(document_router.router, prefix="/api")
-app.include_router(chunk_router.router, prefix="/api")
\ No newline at end of file
+app.include_router(chunk_router.router, prefix="/api")
+app.include_router(admin_router.router, prefix="/api")
+
+if SERVING_ROLE == "reader":
+    # Readers only serve the reads, see `api.proxy`
+    app.middleware("http")(Forwarder(COORDINATOR_URL))
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from api.executor import BoundedExecutor
+
+
+def test_backpressure():
+    """
+    Tests that tasks beyond the queue's bound are turned away with a 503, and that the queued,
+    running, completed and rejected tasks are counted.
+    """
+    executor = BoundedExecutor("test", max_workers=1, max_queued=2)
+    release = threading.Event()
+
+    async def main():
+        running = executor.submit(release.wait)
+        # Let the first task take the only thread
+        while executor.running == 0:
+            await asyncio.sleep(0.01)
+        queued = [executor.submit(lambda i=i: i) for i in range(2)]
+        with pytest.raises(HTTPException) as rejected:
+            executor.submit(lambda: None)
+        assert rejected.value.status_code == 503
+        stats = executor.stats()
+        assert (stats["running"], stats["queued"], stats["max_queue_depth"]) == (1, 2, 2)
+        release.set()
+        assert await running
+        return await asyncio.gather(*queued)
+
+    assert asyncio.run(main()) == [0, 1]
+    stats = executor.stats()
+    assert (stats["running"], stats["queued"], stats["completed"], stats["rejected"]) == (0, 0, 3, 1)
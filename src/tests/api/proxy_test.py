@@ -0,0 +1,41 @@
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.proxy import Forwarder
+
+
+def test_writes_are_forwarded():
+    """
+    Tests that a reader serves the reads itself, searches included, and forwards the writes to
+    the coordinator with their body, returning its response as it is.
+    """
+    forwarded = []
+
+    def coordinator(request: httpx.Request) -> httpx.Response:
+        forwarded.append((request.method, request.url.path, request.content))
+        return httpx.Response(409, json={"detail": "exists"})
+
+    app = FastAPI()
+
+    @app.get("/api/library/")
+    async def libraries():
+        return {"served": "reader"}
+
+    @app.post("/api/library/query")
+    async def query():
+        return {"served": "reader"}
+
+    forwarder = Forwarder("http://coordinator")
+    forwarder.client = httpx.AsyncClient(base_url="http://coordinator", transport=httpx.MockTransport(coordinator))
+    app.middleware("http")(forwarder)
+    client = TestClient(app)
+
+    assert client.get("/api/library/").json() == {"served": "reader"}
+    assert client.post("/api/library/query", json={"query": "attention"}).json() == {"served": "reader"}
+    response = client.post("/api/library/", json={"name": "papers"})
+    assert response.status_code == 409
+    assert response.json() == {"detail": "exists"}
+    assert client.delete("/api/library/papers").status_code == 409
+    assert [(method, path) for method, path, _ in forwarded] == [("POST", "/api/library/"), ("DELETE", "/api/library/papers")]
+    assert forwarded[0][2] == b'{"name":"papers"}'
@@ -0,0 +1,35 @@
+import numpy as np
+
+from utils.embed import HashingEmbeddingProvider, get_provider, EMBEDDING_PROVIDERS
+
+
+def test_registry_has_builtin_providers():
+    """
+    Tests that the built-in providers are registered by name.
+    """
+    assert {"cohere", "hashing", "sentence-transformers"} <= set(EMBEDDING_PROVIDERS)
+    assert get_provider("hashing") is get_provider("hashing")
+
+
+def test_hashing_provider_is_deterministic():
+    """
+    Tests that the hashing provider gives the same normalized vectors across instances.
+    """
+    a = HashingEmbeddingProvider(dim=64).embed(["the quick brown fox"])
+    b = HashingEmbeddingProvider(dim=64).embed(["the quick brown fox"])
+    assert np.array_equal(a, b)
+    assert a.shape == (1, 64)
+    assert np.isclose(np.linalg.norm(a[0]), 1.0)
+
+
+def test_hashing_provider_keeps_similar_texts_close():
+    """
+    Tests that texts sharing words are closer than unrelated texts.
+    """
+    provider = HashingEmbeddingProvider(dim=256)
+    query, similar, unrelated = provider.embed([
+        "vector databases store embeddings",
+        "databases store embeddings of text",
+        "the weather is sunny today",
+    ])
+    assert query @ similar > query @ unrelated
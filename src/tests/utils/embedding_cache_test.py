@@ -0,0 +1,87 @@
+import numpy as np
+
+from utils.embed import CachedEmbeddingProvider, HashingEmbeddingProvider
+from utils.embedding_cache import EmbeddingCache
+
+
+class CountingProvider(HashingEmbeddingProvider):
+    """Hashing provider that records the texts it's asked to embed."""
+    def __init__(self):
+        super().__init__(dim=16)
+        self.calls = []
+
+    def embed(self, texts, input_type="search_document"):
+        self.calls.append(list(texts))
+        return super().embed(texts, input_type=input_type)
+
+
+def test_repeated_texts_skip_the_provider():
+    """
+    Tests that cached texts are not embedded again, and that duplicates in a request
+    are embedded once.
+    """
+    provider = CountingProvider()
+    cached = CachedEmbeddingProvider(provider, cache=EmbeddingCache())
+    first = cached.embed(["a b", "c d", "a b"])
+    second = cached.embed(["c d", "a b"])
+    assert provider.calls == [["a b", "c d"]]
+    assert np.array_equal(first[0], second[1])
+    assert cached.cache.hits == 2
+    assert cached.cache.misses == 3
+
+
+def test_input_type_is_part_of_the_key():
+    """
+    Tests that a query and a document with the same text are cached separately.
+    """
+    provider = CountingProvider()
+    cached = CachedEmbeddingProvider(provider, cache=EmbeddingCache())
+    cached.embed(["a b"], input_type="search_document")
+    cached.embed(["a b"], input_type="search_query")
+    assert len(provider.calls) == 2
+
+
+def test_only_the_given_input_types_are_cached():
+    """
+    Tests that texts of an input type that isn't cached always go to the provider.
+    """
+    provider = CountingProvider()
+    cached = CachedEmbeddingProvider(provider, cache=EmbeddingCache(), input_types=["search_query"])
+    cached.embed(["a b"], input_type="search_document")
+    cached.embed(["a b"], input_type="search_document")
+    cached.embed(["a b"], input_type="search_query")
+    cached.embed(["a b"], input_type="search_query")
+    assert len(provider.calls) == 3
+    assert len(cached.cache) == 1
+
+
+def test_lru_evicts_least_recently_used():
+    """
+    Tests that the in-memory cache holds at most `max_bytes` of embeddings.
+    """
+    # Two float32 embeddings of 2 dimensions
+    cache = EmbeddingCache(max_bytes=16)
+    keys = [EmbeddingCache.key("p", "m", "t", text) for text in "abc"]
+    cache.put_many([(keys[0], np.zeros(2)), (keys[1], np.ones(2))])
+    cache.get_many([keys[0]])
+    cache.put_many([(keys[2], np.ones(2))])
+    a, b, c = cache.get_many(keys)
+    assert a is not None and b is None and c is not None
+    assert cache.nbytes == 16
+
+
+def test_spill_file_survives_eviction_and_restart(tmp_path):
+    """
+    Tests that embeddings evicted from memory, or cached by a previous instance, are read
+    back from the spill file.
+    """
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(max_bytes=8, path=path)
+    keys = [EmbeddingCache.key("p", "m", "t", text) for text in "ab"]
+    cache.put_many([(keys[0], np.array([1.0, 2.0])), (keys[1], np.array([3.0, 4.0]))])
+    assert cache.get_many([keys[0]])[0].tolist() == [1.0, 2.0]
+    cache.close()
+
+    reopened = EmbeddingCache(max_bytes=8, path=path)
+    assert reopened.get_many([keys[1]])[0].tolist() == [3.0, 4.0]
+    assert reopened.hits == 1
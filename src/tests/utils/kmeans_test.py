@@ -0,0 +1,29 @@
+import numpy as np
+
+from utils.kmeans import kmeans
+
+
+def test_kmeans_finds_separated_clusters():
+    """
+    Tests that well separated blobs each get their own centroid, and that every point
+    is assigned to the centroid of its blob.
+    """
+    rng = np.random.default_rng(0)
+    centers = np.array([[0, 0], [10, 10], [-10, 10]], dtype=np.float32)
+    X = np.concatenate([center + rng.standard_normal((50, 2)) for center in centers])
+    centroids, labels = kmeans(X, 3, seed=0)
+    assert centroids.shape == (3, 2)
+    for blob in range(3):
+        blob_labels = labels[blob * 50:(blob + 1) * 50]
+        assert len(set(blob_labels.tolist())) == 1
+        assert np.linalg.norm(centroids[blob_labels[0]] - centers[blob]) < 1
+
+
+def test_kmeans_caps_clusters_at_points():
+    """
+    Tests that asking for more clusters than points gives one centroid per point.
+    """
+    X = np.eye(3, dtype=np.float32)
+    centroids, labels = kmeans(X, 10, seed=0)
+    assert len(centroids) == 3
+    assert sorted(labels.tolist()) == [0, 1, 2]
@@ -0,0 +1,95 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from utils.knn import KNearNeighbors, normalize
+
+
+def brute_force(X, query, k):
+    """Reference pure Python k nearest neighbors."""
+    dist = [
+        math.sqrt(sum((x - q) ** 2 for x, q in zip(embedding, query)))
+        for embedding in X
+    ]
+    return sorted(range(len(dist)), key=lambda i: dist[i])[:k]
+
+
+def test_predict_matches_brute_force():
+    """
+    Tests that the vectorized engine returns the same neighbors, in the same order,
+    as a full pure Python sort.
+    """
+    rng = random.Random(0)
+    X = [[rng.gauss(0, 1) for _ in range(64)] for _ in range(300)]
+    knn = KNearNeighbors().fit(X)
+    for _ in range(10):
+        query = [rng.gauss(0, 1) for _ in range(64)]
+        assert knn.predict(query, 10) == brute_force(X, query, 10)
+
+
+def test_predict_breaks_ties_by_position():
+    """
+    Tests that duplicate embeddings are returned in insertion order.
+    """
+    X = [[1.0, 0.0], [0.0, 1.0], [1.0, 0.0], [1.0, 0.0]]
+    knn = KNearNeighbors().fit(X)
+    assert knn.predict([1.0, 0.0], 2) == [0, 2]
+    assert knn.predict([1.0, 0.0], 10) == [0, 2, 3, 1]
+
+
+def test_predict_empty():
+    """
+    Tests that searching an empty vector space returns no neighbors.
+    """
+    assert KNearNeighbors().fit([]).predict([1.0, 0.0], 3) == []
+
+
+def test_predict_many_matches_predict():
+    """
+    Tests that scoring a batch of queries with one matrix product, in several blocks, returns
+    the same neighbors as scoring them one at a time.
+    """
+    rng = random.Random(1)
+    X = [[rng.gauss(0, 1) for _ in range(32)] for _ in range(200)]
+    queries = [[rng.gauss(0, 1) for _ in range(32)] for _ in range(7)]
+    knn = KNearNeighbors().fit(X)
+    knn.MAX_DISTANCES = 600
+    assert knn.predict_many(queries, 5) == [knn.predict(query, 5) for query in queries]
+    assert KNearNeighbors().predict_many(queries, 5) == [[]] * 7
+
+
+def test_inner_product_metrics():
+    """
+    Tests that the dot metric ranks by decreasing dot product, and that the cosine metric on
+    normalized vectors ranks like l2 does.
+    """
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((200, 16)).astype(np.float32)
+    query = rng.standard_normal(16).astype(np.float32)
+    knn = KNearNeighbors(metric='dot').fit(X)
+    assert knn.predict(query, 10) == np.argsort(-(X @ query), kind='stable')[:10].tolist()
+    assert knn.predict_many([query, -query], 10)[0] == knn.predict(query, 10)
+    unit = normalize(X)
+    assert np.allclose(np.linalg.norm(unit, axis=1), 1)
+    cosine = KNearNeighbors(metric='cosine').fit(unit)
+    assert cosine.predict(normalize(query), 10) == KNearNeighbors().fit(unit).predict(normalize(query), 10)
+    with pytest.raises(ValueError):
+        KNearNeighbors(metric='manhattan')
+
+
+def test_predict_max_distance():
+    """
+    Tests that neighbors farther than `max_distance` are dropped, keeping the order of the others.
+    """
+    rng = np.random.default_rng(2)
+    X = rng.standard_normal((300, 8)).astype(np.float32)
+    query = rng.standard_normal(8).astype(np.float32)
+    knn = KNearNeighbors().fit(X)
+    dist = knn.compute_distance(query)
+    threshold = float(np.sort(dist)[4])
+    assert knn.predict(query, 10, max_distance=threshold) == knn.predict(query, 5)
+    assert knn.predict(query, 3, max_distance=threshold) == knn.predict(query, 3)
+    assert knn.predict_many([query], 10, max_distance=threshold) == [knn.predict(query, 5)]
+    assert knn.predict(query, 10, max_distance=-1.0) == []
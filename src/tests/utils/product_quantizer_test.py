@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from utils.pq import ProductQuantizer
+
+
+def test_adc_matches_distance_to_decoded_vectors():
+    """
+    Tests that the lookup table distances are the exact distances from the query to
+    the decoded vectors, and that codes are one byte per sub-quantizer.
+    """
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((500, 32)).astype(np.float32)
+    pq = ProductQuantizer(dim=32, m=8, seed=0).train(X)
+    codes = pq.encode(X)
+    assert codes.shape == (500, 8) and codes.dtype == np.uint8
+    query = rng.standard_normal(32).astype(np.float32)
+    expected = ((pq.decode(codes) - query) ** 2).sum(axis=1)
+    assert np.allclose(pq.adc(pq.distance_table(query), codes), expected, rtol=1e-4, atol=1e-4)
+
+
+def test_encoding_reduces_reconstruction_error():
+    """
+    Tests that more sub-quantizers give a closer reconstruction of the vectors.
+    """
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((1000, 32)).astype(np.float32)
+    errors = []
+    for m in (2, 8, 32):
+        pq = ProductQuantizer(dim=32, m=m, iterations=10, seed=0).train(X)
+        errors.append(((pq.decode(pq.encode(X)) - X) ** 2).sum(axis=1).mean())
+    assert errors[0] > errors[1] > errors[2]
+
+
+def test_dimension_must_split_evenly():
+    """
+    Tests that the sub-quantizers must split the dimension evenly.
+    """
+    with pytest.raises(ValueError):
+        ProductQuantizer(dim=30, m=8)
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from utils.rwlock import ReadWriteLock
+
+
+def run(target):
+    thread = threading.Thread(target=target)
+    thread.start()
+    # Let the thread reach the lock
+    time.sleep(0.05)
+    return thread
+
+
+def test_readers_share_the_lock():
+    """
+    Tests that readers hold the lock at the same time, and that a writer waits for them.
+    """
+    lock = ReadWriteLock()
+    inside = threading.Barrier(3, timeout=5)
+    events = []
+
+    def read():
+        with lock.read():
+            # Every reader gets in before any of them leaves
+            inside.wait()
+            events.append("read")
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    time.sleep(0.05)
+    with lock.write():
+        events.append("write")
+    for reader in readers:
+        reader.join()
+    assert events == ["read", "read", "read", "write"]
+
+
+def test_writers_are_preferred():
+    """
+    Tests that a reader arriving while a writer waits gets the lock after the writer.
+    """
+    lock = ReadWriteLock()
+    events = []
+
+    def write():
+        with lock.write():
+            events.append("write")
+
+    def read():
+        with lock.read():
+            events.append("read")
+
+    lock.acquire_read()
+    writer = run(write)
+    reader = run(read)
+    assert events == []
+    lock.release_read()
+    writer.join()
+    reader.join()
+    assert events == ["write", "read"]
+
+
+def test_reentrancy():
+    """
+    Tests that a writer can take either side again, a reader can read again even with a writer
+    waiting, and that upgrading a read lock raises instead of deadlocking.
+    """
+    lock = ReadWriteLock()
+    with lock.write():
+        with lock.write():
+            with lock.read():
+                pass
+
+    def write():
+        with lock.write():
+            pass
+
+    with lock.read():
+        writer = run(write)
+        with lock.read():
+            pass
+        with pytest.raises(RuntimeError):
+            lock.acquire_write()
+    writer.join(timeout=5)
+    assert not writer.is_alive()
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from utils.scalar_quantizer import ScalarQuantizer
+
+
+@pytest.mark.parametrize("qtype", ["float16", "int8"])
+def test_distances_match_decoded_vectors(qtype):
+    """
+    Tests that distances computed on the codes are the distances to the decoded
+    vectors, and that decoding is close to the original vectors.
+    """
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((300, 24)).astype(np.float32)
+    sq = ScalarQuantizer(qtype).train(X)
+    codes = sq.encode(X)
+    assert codes.dtype == sq.dtype and codes.shape == X.shape
+    decoded = sq.decode(codes)
+    assert np.abs(decoded - X).max() <= (1e-2 if qtype == "float16" else sq.scale.max())
+    query = rng.standard_normal(24).astype(np.float32)
+    expected = ((decoded - query) ** 2).sum(axis=1)
+    distances = sq.distances(query, codes, sq.norms(codes))
+    assert np.allclose(distances, expected, rtol=1e-4, atol=1e-3)
+
+
+def test_int8_clips_values_outside_the_trained_range():
+    """
+    Tests that values beyond the training range decode to the edges of the range.
+    """
+    sq = ScalarQuantizer("int8").train(np.array([[0.0, -1.0], [1.0, 1.0]]))
+    decoded = sq.decode(sq.encode(np.array([[5.0, -5.0]])))
+    assert np.allclose(decoded, [[1.0, -1.0]], atol=1e-6)
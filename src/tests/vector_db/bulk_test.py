@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from utils.embed import HashingEmbeddingProvider
+from vector_db import Library, Document, Chunk
+from vector_db.index import IndexTypes
+
+
+class FakeEmbedder(HashingEmbeddingProvider):
+    """A local stand-in for the embedding API that records every call."""
+    name = "fake"
+    batch_size = 96
+
+    def __init__(self):
+        super().__init__(dim=16)
+        self.calls = []
+
+    def embed(self, texts, input_type="search_document"):
+        self.calls.append(len(texts))
+        return super().embed(texts, input_type=input_type)
+
+
+def make_library(embedder, index_type, n=300):
+    library = Library(name="test", metadata={}, embedding_provider=embedder)
+    library.add_vector_search_index(index_type)
+    doc = library.add_document(Document(name="doc", metadata={}))
+    chunks = [Chunk(text=f"chunk {i}", metadata={"doc_id": doc.id}) for i in range(n)]
+    library.add_chunks(chunks)
+    embedder.calls.clear()
+    return library, chunks
+
+
+@pytest.mark.parametrize("index_type", [IndexTypes.FLATL2, IndexTypes.LSH, IndexTypes.HNSW, IndexTypes.IVF])
+def test_update_chunks(index_type):
+    """
+    Tests that a bulk update re-embeds only the changed texts, in batches, and reports the
+    status of every chunk.
+    """
+    embedder = FakeEmbedder()
+    library, chunks = make_library(embedder, index_type)
+    texts = {chunk.id: f"new text {i}" for i, chunk in enumerate(chunks[:200])}
+    texts[chunks[200].id] = chunks[200].text
+    texts["missing"] = "text"
+    statuses = library.update_chunks(texts)
+    assert embedder.calls == [96, 96, 8]
+    assert list(statuses.values()).count("updated") == 200
+    assert statuses[chunks[200].id] == "unchanged"
+    assert statuses["missing"] == "not_found"
+    expected = embedder.embed(["new text 7"])[0]
+    assert library.get_chunk(chunks[7].id).text == "new text 7"
+    assert np.allclose(library.get_chunk(chunks[7].id).embedding, expected)
+    assert library.search("new text 7", k=1)[0][0] is chunks[7]
+
+
+@pytest.mark.parametrize("index_type", [IndexTypes.FLATL2, IndexTypes.LSH, IndexTypes.HNSW, IndexTypes.IVF])
+def test_remove_chunks(index_type):
+    """
+    Tests that a bulk delete removes the chunks from their documents and from the index, and
+    reports the chunks that don't exist.
+    """
+    library, chunks = make_library(FakeEmbedder(), index_type)
+    removed = [chunk.id for chunk in chunks[::2]]
+    statuses = library.remove_chunks(removed + ["missing"])
+    assert list(statuses.values()).count("removed") == 150
+    assert statuses["missing"] == "not_found"
+    assert len(library.get_chunks()) == 150
+    assert len(library.get_document(name="doc").get_chunks()) == 150
+    with pytest.raises(KeyError):
+        library.get_chunk(removed[0])
+    assert library.search("chunk 1", k=1)[0][0] is chunks[1]
@@ -0,0 +1,131 @@
+import threading
+
+import numpy as np
+import pytest
+
+import vector_db.index.hnsw as hnsw
+import vector_db.index.ivf as ivf
+from vector_db import Library, Document, Chunk
+from vector_db.index import IndexTypes
+
+
+QUERY = np.random.default_rng(0).standard_normal(1024)
+
+
+def make_library(index_type, n=300, **index_params):
+    library = Library(name="papers", metadata={}, embedding_provider="hashing")
+    library.add_vector_search_index(index_type, **index_params)
+    doc = library.add_document(Document(name="doc", metadata={}))
+    library.add_chunks([Chunk(text=f"chunk {i} topic {i % 7}", metadata={"doc_id": doc.id}) for i in range(n)])
+    return library, doc
+
+
+@pytest.mark.parametrize("index_type,index_params", [
+    (IndexTypes.FLATL2, {}),
+    (IndexTypes.LSH, {}),
+    (IndexTypes.HNSW, {"delta_threshold": 64}),
+    (IndexTypes.IVF, {"delta_threshold": 64}),
+])
+def test_reads_during_writes(index_type, index_params):
+    """
+    Tests that searches and chunk lookups running alongside adds, updates, removals and
+    rebuilds never fail, and that the library is consistent once the writes are done.
+    """
+    library, doc = make_library(index_type, **index_params)
+    errors = []
+    removed = set()
+    done = threading.Event()
+
+    def read():
+        try:
+            while not done.is_set():
+                for chunk, _ in library.search_by_vector(QUERY, k=10):
+                    try:
+                        assert library.get_chunk(chunk.id).id == chunk.id
+                    except KeyError:
+                        # Only a chunk removed since the search can be missing
+                        assert chunk.id in removed
+                assert len(library.get_chunks()) >= 200
+        except Exception as e:
+            errors.append(e)
+            raise
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    for round in range(3):
+        chunks = library.get_document(id=doc.id).get_chunks()
+        removed.update(chunk.id for chunk in chunks[:20])
+        library.remove_chunks([chunk.id for chunk in chunks[:20]])
+        library.update_chunks({chunk.id: f"{chunk.text} v{round}" for chunk in chunks[20:40]})
+        library.add_chunks([Chunk(text=f"new chunk {round} {i}", metadata={"doc_id": doc.id}) for i in range(20)])
+        library.build_index()
+    done.set()
+    for reader in readers:
+        reader.join()
+    assert errors == []
+    chunks = library.get_chunks()
+    assert len(chunks) == 300
+    assert sorted(chunk.id for chunk in chunks) == sorted(chunk.id for chunk in library.get_document(id=doc.id).get_chunks())
+
+
+def test_search_during_training(monkeypatch):
+    """
+    Tests that an IVF index is searched and written to while its centroids are trained, and
+    that the chunks added meanwhile are assigned to a list once they are.
+    """
+    library, doc = make_library(IndexTypes.IVF, background_merge=False)
+    training, release = threading.Event(), threading.Event()
+    kmeans = ivf.kmeans
+
+    def slow_kmeans(*args, **kwargs):
+        training.set()
+        assert release.wait(timeout=5)
+        return kmeans(*args, **kwargs)
+
+    monkeypatch.setattr(ivf, "kmeans", slow_kmeans)
+    trainer = threading.Thread(target=library.build_index)
+    trainer.start()
+    assert training.wait(timeout=5)
+    assert len(library.search_by_vector(QUERY, k=5)) == 5
+    library.add_chunks([Chunk(text="added while training", metadata={"doc_id": doc.id})])
+    release.set()
+    trainer.join()
+    assert library.index.is_trained and not library.index.delta
+    assert sum(len(chunk_ids) for chunk_ids in library.index.lists) == 301
+
+
+def test_search_during_compaction(monkeypatch):
+    """
+    Tests that an HNSW index is searched and written to while its graph is compacted in the
+    background, and that the chunks written to meanwhile are right in the new graph.
+    """
+    library, doc = make_library(IndexTypes.HNSW, n=200, max_tombstone_ratio=0.2, delta_threshold=16)
+    library.index.wait_for_merge()
+    library.build_index()
+    index = library.index
+    compacting, release = threading.Event(), threading.Event()
+    insert = hnsw.HNSWIndex._HNSWIndex__insert
+
+    def slow_insert(graph, chunk_id):
+        # Only the graph being compacted waits
+        if graph is not index:
+            compacting.set()
+            assert release.wait(timeout=5)
+        return insert(graph, chunk_id)
+
+    monkeypatch.setattr(hnsw.HNSWIndex, "_HNSWIndex__insert", slow_insert)
+    chunks = list(library.get_document(id=doc.id).get_chunks())
+    library.remove_chunks([chunk.id for chunk in chunks[:50]])
+    assert compacting.wait(timeout=5)
+    assert len(library.search_by_vector(QUERY, k=5)) == 5
+    library.remove_chunk(chunks[50].id)
+    library.update_chunk(chunks[51].id, "moved while compacting")
+    release.set()
+    index.wait_for_compaction()
+    assert len(index._tombstones) <= 2
+    assert chunks[50].id not in {chunk.id for chunk, _ in library.search_by_vector(chunks[50].embedding, k=10)}
+    assert library.search("moved while compacting", k=1)[0][0].id == chunks[51].id
+    library.build_index()
+    assert not index._tombstones and not index.delta
+    assert len(index._chunk_node) == 149
@@ -0,0 +1,48 @@
+# tests/vector_db/conftest.py
+import numpy as np
+import pytest
+
+from utils.embed import HashingEmbeddingProvider
+from vector_db import Chunk
+
+
+@pytest.fixture
+def dim():
+    return 16
+
+
+@pytest.fixture
+def provider(dim):
+    return HashingEmbeddingProvider(dim=dim)
+
+
+@pytest.fixture
+def make_chunks():
+    def make_chunks(n, dim, seed=0, varied_norms=False):
+        rng = np.random.default_rng(seed)
+        chunks = []
+        for i in range(n):
+            chunk = Chunk(text=f"chunk {i}", metadata={})
+            chunk.embedding = rng.standard_normal(dim)
+            if varied_norms:
+                # Vectors of very different lengths, so the metrics disagree
+                chunk.embedding = chunk.embedding * rng.uniform(0.1, 10)
+            chunks.append(chunk)
+        return chunks
+    return make_chunks
+
+
+@pytest.fixture
+def search_vector():
+    def search_vector(index, vector, k):
+        return [chunk.id for chunk, _ in index.search_by_vector(vector, k)]
+    return search_vector
+
+
+@pytest.fixture
+def exact_ids():
+    def exact_ids(index, vector, k):
+        matrix = index.embeddings.matrix
+        nearest = np.argsort(((matrix - vector) ** 2).sum(axis=1))[:k]
+        return [index.chunks[i].id for i in nearest]
+    return exact_ids
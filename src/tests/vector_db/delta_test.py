@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from vector_db import Chunk
+from vector_db.index import FlatL2Index, HNSWIndex, IVFIndex, LSHIndex, PQIndex
+
+
+INDEXES = [
+    lambda provider, **kwargs: FlatL2Index(embedding_provider=provider, **kwargs),
+    lambda provider, **kwargs: FlatL2Index(embedding_provider=provider, quantization="int8", **kwargs),
+    lambda provider, **kwargs: LSHIndex(embedding_provider=provider, seed=0),
+    lambda provider, **kwargs: HNSWIndex(embedding_provider=provider, M=8, seed=0, **kwargs),
+    lambda provider, **kwargs: IVFIndex(embedding_provider=provider, n_lists=4, seed=0, **kwargs),
+    lambda provider, **kwargs: PQIndex(embedding_provider=provider, m=4, seed=0, **kwargs),
+]
+
+
+@pytest.mark.parametrize("make_index", INDEXES)
+def test_searchable_right_after_writes(provider, make_index, make_chunks, search_vector):
+    """
+    Tests that added and updated chunks are found, and removed chunks are gone, without
+    building the index.
+    """
+    index = make_index(provider)
+    chunks = make_chunks(50, provider.dim)
+    index.add(chunks)
+    for chunk in chunks[:5]:
+        assert search_vector(index, chunk.embedding, 1) == [chunk.id]
+    target = np.full(provider.dim, 10.0, dtype=np.float32)
+    index.set_embedding(chunks[10].id, target)
+    assert search_vector(index, target, 1) == [chunks[10].id]
+    index.remove(chunks[10].id)
+    assert chunks[10].id not in search_vector(index, target, 5)
+
+
+@pytest.mark.parametrize("make_index", INDEXES[3:])
+def test_delta_is_merged_in_the_background(provider, make_index, make_chunks, search_vector):
+    """
+    Tests that a background merge starts once the delta reaches its threshold, and that
+    searches merge the delta with the main structure in the meantime.
+    """
+    index = make_index(provider, delta_threshold=300)
+    chunks = make_chunks(600, provider.dim)
+    index.add(chunks[:200])
+    assert len(index.delta) == 200
+    index.add(chunks[200:400])
+    index.wait_for_merge()
+    assert not index.delta
+    index.add(chunks[400:])
+    query = chunks[450].embedding
+    assert search_vector(index, query, 1) == [chunks[450].id]
+    index.build_index()
+    assert not index.delta
+    assert search_vector(index, query, 1) == [chunks[450].id]
+
+
+@pytest.mark.parametrize("make_index", INDEXES)
+def test_search_many(provider, make_index):
+    """
+    Tests that a batch of queries, embedded with one request, returns the same chunks as
+    searching the queries one at a time, with or without a delta.
+    """
+    index = make_index(provider)
+    chunks = [Chunk(text=f"chunk {i} topic {i % 7}", metadata={}) for i in range(300)]
+    index.add(chunks[:200])
+    index.build_index()
+    index.add(chunks[200:])
+    queries = [f"topic {i}" for i in range(7)]
+    calls = []
+    embed = provider.embed
+    provider.embed = lambda texts, input_type="search_document": calls.append(len(texts)) or embed(texts, input_type)
+    results = index.search_many(queries, k=5)
+    assert calls == [7]
+    expected = [index.search(query, k=5) for query in queries]
+    assert [[c.id for c, _ in r] for r in results] == [[c.id for c, _ in r] for r in expected]
+
+
+@pytest.mark.parametrize("make_index", INDEXES)
+def test_search_by_vector_and_chunk(provider, make_index, make_chunks):
+    """
+    Tests that searching by a raw vector or by a chunk id doesn't call the embedding provider,
+    and that a chunk's neighbours exclude the chunk itself.
+    """
+    index = make_index(provider)
+    chunks = make_chunks(100, provider.dim)
+    index.add(chunks)
+    index.build_index()
+    index.embed_query = None
+    assert [chunk.id for chunk, _ in index.search_by_vector(chunks[3].embedding, 1)] == [chunks[3].id]
+    twin = make_chunks(1, provider.dim, seed=1)[0]
+    twin.embedding = chunks[3].embedding + 1e-3
+    index.add([twin])
+    results = index.search_by_chunk(chunks[3].id, 5)
+    assert len(results) == 5
+    assert results[0][0] is twin
+    assert chunks[3] not in [chunk for chunk, _ in results]
+    with pytest.raises(ValueError):
+        index.search_by_vector([1.0, 2.0], 1)
+    with pytest.raises(KeyError):
+        index.search_by_chunk("missing", 1)
@@ -0,0 +1,99 @@
+import numpy as np
+
+from vector_db.index.embedding_store import EmbeddingStore, MemmapEmbeddingStore
+
+
+def test_append_grows_geometrically():
+    """
+    Tests that appending past the capacity grows the buffer and keeps previous rows.
+    """
+    store = EmbeddingStore(capacity=2)
+    for i in range(5):
+        assert store.append([float(i), 1.0]) == i
+    assert len(store) == 5
+    assert store.capacity >= 5
+    assert store.matrix.dtype == np.float32
+    assert store.matrix[:, 0].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert store.norms.tolist() == [1.0, 2.0, 5.0, 10.0, 17.0]
+
+
+def test_remove_swaps_with_last():
+    """
+    Tests that removing a row moves the last row into its place and reports where it came from.
+    """
+    store = EmbeddingStore()
+    store.extend([[0.0], [1.0], [2.0]])
+    assert store.remove(0) == 2
+    assert store.matrix[:, 0].tolist() == [2.0, 1.0]
+    assert store.remove(1) is None
+    assert store.matrix[:, 0].tolist() == [2.0]
+
+
+def test_get_returns_view():
+    """
+    Tests that rows are returned as views into the buffer rather than copies.
+    """
+    store = EmbeddingStore()
+    store.append([1.0, 2.0])
+    row = store.get(0)
+    store.set(0, [3.0, 4.0])
+    assert row.tolist() == [3.0, 4.0]
+    assert store.norms.tolist() == [25.0]
+
+
+def test_memmap_store_grows_on_disk(tmp_path):
+    """
+    Tests that a memory-mapped store keeps its rows in the file across growths, and
+    holds nothing but the norms in memory.
+    """
+    path = tmp_path / "vectors.bin"
+    store = MemmapEmbeddingStore(capacity=2, path=str(path))
+    store.extend(np.arange(20, dtype=np.float32).reshape(10, 2))
+    store.remove(0)
+    assert store.matrix[:, 0].tolist() == [18.0, 2.0, 4.0, 6.0, 8.0, 10.0, 12.0, 14.0, 16.0]
+    assert store.nbytes == 0
+    store.flush()
+    assert path.stat().st_size == store.file_nbytes >= 10 * 2 * 4
+    store.close()
+
+
+def test_attach_maps_without_copying(tmp_path):
+    """
+    Tests that an attached memory map backs the store as is, and that writes growing the
+    store copy it into memory without changing the file.
+    """
+    path = tmp_path / "vectors.bin"
+    np.arange(6, dtype=np.float32).tofile(path)
+    vectors = np.memmap(path, dtype=np.float32, mode="c", shape=(3, 2))
+    store = EmbeddingStore()
+    store.attach(vectors)
+    assert np.shares_memory(store.matrix, vectors)
+    assert store.norms.tolist() == [1.0, 13.0, 41.0]
+    store.set(0, [7.0, 7.0])
+    store.append([8.0, 9.0])
+    assert not np.shares_memory(store.matrix, vectors)
+    assert store.matrix[:, 0].tolist() == [7.0, 2.0, 4.0, 8.0]
+    assert np.fromfile(path, dtype=np.float32).tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_memmap_store_attaches_without_copying(tmp_path):
+    """
+    Tests that a memory-mapped store is backed by an attached map as is, and copies it into
+    its own file, leaving the attached file unchanged, once it grows.
+    """
+    path = tmp_path / "vectors.bin"
+    np.arange(6, dtype=np.float32).tofile(path)
+    vectors = np.memmap(path, dtype=np.float32, mode="c", shape=(3, 2))
+    store = MemmapEmbeddingStore(path=str(tmp_path / "store.bin"))
+    store.attach(vectors)
+    assert np.shares_memory(store.matrix, vectors)
+    store.flush()
+    assert (tmp_path / "store.bin").stat().st_size == 0
+    store.set(0, [7.0, 7.0])
+    store.append([8.0, 9.0])
+    assert not np.shares_memory(store.matrix, vectors)
+    assert store.matrix[:, 0].tolist() == [7.0, 2.0, 4.0, 8.0]
+    store.flush()
+    assert np.fromfile(tmp_path / "store.bin", dtype=np.float32)[:8].tolist() == [7.0, 7.0, 2.0, 3.0, 4.0, 5.0, 8.0, 9.0]
+    assert np.fromfile(path, dtype=np.float32).tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+    store.close()
@@ -0,0 +1,115 @@
+import time
+
+import numpy as np
+import pytest
+
+from vector_db import Database, Library, Document, Chunk
+from vector_db.index import IndexTypes
+
+
+QUERY = np.random.default_rng(0).standard_normal(1024)
+
+
+def add_library(db, name, n=50):
+    library = Library(name=name, metadata={"description": name}, embedding_provider="hashing")
+    library.add_vector_search_index(IndexTypes.FLATL2)
+    db.add_library(library)
+    doc = library.add_document(Document(name="doc", metadata={}))
+    library.add_chunks([Chunk(text=f"{name} chunk {i}", metadata={"doc_id": doc.id}) for i in range(n)])
+    return library
+
+
+def results(library):
+    return [(chunk.id, round(score, 4)) for chunk, score in library.search_by_vector(QUERY, k=5)]
+
+
+def test_lazy_load(tmp_path):
+    """
+    Tests that a lazily loaded database reads no library until it's used, that listing the
+    libraries and reading their metadata keeps them unloaded, and that a loaded library
+    searches like the saved one. The manifest holds no chunk, they're in each library's segment.
+    """
+    db = Database()
+    expected = {name: results(add_library(db, name)) for name in ("a", "b")}
+    db.save(str(tmp_path))
+    assert "a chunk 0" not in (tmp_path / "manifest.json").read_text()
+    loaded = Database.load(str(tmp_path), lazy=True)
+    assert not any(library.loaded for library in loaded.get_libraries())
+    assert [library.dict() for library in loaded.get_libraries()] == [library.dict() for library in db.get_libraries()]
+    library = loaded.get_library("a")
+    assert (library.num_of_chunks, library.nbytes, library.loaded) == (50, 0, False)
+    assert results(library) == expected["a"]
+    assert library.loaded and library.nbytes > 0
+    assert not loaded.get_library("b").loaded
+
+
+def test_evict_idle(tmp_path):
+    """
+    Tests that idle libraries are saved and unloaded, and that their writes, made before and
+    after being unloaded, survive loading them again.
+    """
+    db = Database()
+    library = add_library(db, "a")
+    db.save(str(tmp_path))
+    doc = library.get_document(name="doc")
+    library.add_chunks([Chunk(text="written before eviction", metadata={"doc_id": doc.id})])
+    db.idle_timeout = 0
+    assert db.evict() == ["a"]
+    assert not library.loaded
+    library.add_chunks([Chunk(text="written after eviction", metadata={"doc_id": doc.id})])
+    assert library.num_of_chunks == 52
+    assert db.evict() == ["a"]
+    reloaded = Database.load(str(tmp_path)).get_library("a")
+    assert {chunk.text for chunk in reloaded.get_chunks()} >= {"written before eviction", "written after eviction"}
+    assert results(reloaded) == results(library)
+
+
+def test_evict_memory_budget(tmp_path):
+    """
+    Tests that the least recently used libraries are unloaded until the loaded ones fit the
+    memory budget, and that the most recently used one is kept even if it doesn't fit.
+    """
+    db = Database()
+    for name in ("a", "b", "c"):
+        add_library(db, name)
+    db.save(str(tmp_path))
+    for name in ("b", "a", "c"):
+        results(db.get_library(name))
+    db.memory_budget = db.get_library("a").nbytes * 2
+    assert db.evict() == ["b"]
+    db.memory_budget = 0
+    assert db.evict() == ["a"]
+    assert [library.name for library in db.get_libraries() if library.loaded] == ["c"]
+
+
+def test_unsaved_library_stays_loaded(tmp_path):
+    """
+    Tests that a library never saved can't be unloaded, and that the database can only evict
+    libraries once it has a snapshot.
+    """
+    db = Database()
+    library = add_library(db, "a")
+    assert not library.unload()
+    db.idle_timeout = 0
+    with pytest.raises(ValueError):
+        db.evict()
+    db.save(str(tmp_path))
+    assert library.unload()
+    assert not library.unload()
+
+
+def test_eviction_outlives_a_failure(tmp_path):
+    """
+    Tests that a failed eviction is logged and doesn't stop the background eviction, which
+    unloads the library once the database has a snapshot.
+    """
+    db = Database()
+    library = add_library(db, "a")
+    db.start_eviction(idle_timeout=0, interval=0.01)
+    time.sleep(0.05)
+    assert library.loaded
+    db.save(str(tmp_path))
+    deadline = time.monotonic() + 5
+    while library.loaded and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not library.loaded
@@ -0,0 +1,84 @@
+import pytest
+
+from utils.embed import HashingEmbeddingProvider
+from vector_db import Chunk
+from vector_db.index import IndexTypes, MetadataIndex, SearchIndex
+
+
+def make_metadata(i):
+    return {
+        "doc_id": f"doc-{i % 10}",
+        "page_number": i % 50,
+        "date_created": f"2025-01-{i % 28 + 1:02d} 00:00:00",
+        "summary": None,
+    }
+
+
+@pytest.fixture
+def metadata_index():
+    index = MetadataIndex()
+    for i in range(500):
+        index.add(id=str(i), metadata=make_metadata(i))
+    return index
+
+
+def expected(predicate):
+    return {str(i) for i in range(500) if predicate(make_metadata(i))}
+
+
+def test_select(metadata_index):
+    """
+    Tests that eq, in, range, and/or filters select the same chunks as a linear scan.
+    """
+    assert metadata_index.select({"field": "doc_id", "eq": "doc-3"}) == expected(lambda m: m["doc_id"] == "doc-3")
+    assert metadata_index.select({"field": "page_number", "in": [1, 2, 99]}) == expected(lambda m: m["page_number"] in (1, 2))
+    assert metadata_index.select({"field": "page_number", "gte": 10, "lt": 20}) == expected(lambda m: 10 <= m["page_number"] < 20)
+    assert metadata_index.select({"field": "page_number", "gt": 45}) == expected(lambda m: m["page_number"] > 45)
+    assert metadata_index.select(
+        {"field": "date_created", "lte": "2025-01-05 00:00:00"}
+    ) == expected(lambda m: m["date_created"] <= "2025-01-05 00:00:00")
+    assert metadata_index.select({
+        "or": [
+            {"field": "doc_id", "eq": "doc-1"},
+            {"and": [{"field": "doc_id", "eq": "doc-2"}, {"field": "page_number", "lte": 12}]},
+        ]
+    }) == expected(lambda m: m["doc_id"] == "doc-1" or (m["doc_id"] == "doc-2" and m["page_number"] <= 12))
+    assert metadata_index.select({"field": "summary", "eq": "missing"}) == set()
+    with pytest.raises(ValueError):
+        metadata_index.select({"field": "doc_id", "like": "doc"})
+
+
+def test_remove(metadata_index):
+    """
+    Tests that removed chunks are no longer selected, and that values without chunks leave the
+    sorted values.
+    """
+    for i in range(0, 500, 50):
+        metadata_index.remove(id=str(i), metadata=make_metadata(i))
+    assert metadata_index.select({"field": "page_number", "eq": 0}) == set()
+    assert metadata_index.select({"field": "page_number", "lt": 1}) == set()
+    assert (0, 0) not in metadata_index.sorted_values["page_number"]
+
+
+@pytest.mark.parametrize("index_type", [IndexTypes.FLATL2, IndexTypes.LSH, IndexTypes.HNSW, IndexTypes.IVF])
+@pytest.mark.parametrize("filter", [
+    {"field": "doc_id", "eq": "doc-3"},
+    {"field": "page_number", "gte": 0, "lt": 45},
+])
+def test_filtered_search(index_type, filter):
+    """
+    Tests that selective (pre-filtered) and broad (post-filtered) searches only return chunks
+    matching the filter, and return k of them.
+    """
+    index = SearchIndex().initialize_index(
+        index_type=index_type,
+        embedding_provider=HashingEmbeddingProvider(dim=16)
+    )
+    chunks = [Chunk(text=f"chunk {i}", metadata=make_metadata(i)) for i in range(500)]
+    index.add(chunks)
+    index.build_index()
+    matching = index.metadata_index.select(filter)
+    results = index.search("chunk 33", k=10, filter=filter)
+    assert len(results) == 10
+    assert all(chunk.id in matching for chunk, _ in results)
+    assert index.search("chunk 33", k=10, filter={"field": "doc_id", "eq": "none"}) == []
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from vector_db.index import FlatL2Index
+
+
+@pytest.fixture
+def dim():
+    return 32
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_quantized_search_with_rerank(provider, quantization, make_chunks, search_vector, exact_ids):
+    """
+    Tests that quantized scans keep most of the exact neighbours, and that re-ranking
+    with the full embeddings returns them in the exact order.
+    """
+    index = FlatL2Index(embedding_provider=provider, quantization=quantization, rerank_factor=0)
+    index.add(make_chunks(1000, provider.dim))
+    index.build_index()
+    assert index.bytes_per_vector == index.quantizer.dtype.itemsize * provider.dim
+    queries = np.random.default_rng(1).standard_normal((20, provider.dim)).astype(np.float32)
+    hits = sum(
+        len(set(search_vector(index, q, 10)) & set(exact_ids(index, q, 10)))
+        for q in queries
+    )
+    assert hits / 200 >= 0.9
+    index.rerank_factor = 4
+    for query in queries:
+        assert search_vector(index, query, 10) == exact_ids(index, query, 10)
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_scores_are_sorted_without_rerank(provider, quantization, make_chunks):
+    """
+    Tests that quantized scans without re-ranking return their exact scores closest first,
+    and within `max_distance`.
+    """
+    index = FlatL2Index(embedding_provider=provider, quantization=quantization, rerank_factor=0)
+    index.add(make_chunks(1000, provider.dim))
+    index.build_index()
+    for query in np.random.default_rng(1).standard_normal((20, provider.dim)):
+        scores = [score for _, score in index.search_by_vector(query, 10)]
+        assert scores == sorted(scores)
+        threshold = scores[4]
+        within = [score for _, score in index.search_by_vector(query, 10, max_distance=threshold)]
+        assert within == sorted(within) and all(score <= threshold for score in within)
+
+
+def test_codes_stay_aligned_with_chunks(provider, make_chunks, search_vector, exact_ids):
+    """
+    Tests that chunks added, updated or removed after training keep their codes in
+    the row of their embedding.
+    """
+    index = FlatL2Index(embedding_provider=provider, quantization="int8")
+    chunks = make_chunks(300, provider.dim)
+    index.add(chunks[:200])
+    # Searches scan the full embeddings until the int8 ranges are trained
+    query = np.ones(provider.dim, dtype=np.float32)
+    assert search_vector(index, query, 5) == exact_ids(index, query, 5)
+    index.build_index()
+    index.add(chunks[200:])
+    for chunk in chunks[:50]:
+        index.remove(chunk.id)
+    index.update(chunks[60].id, "new text")
+    assert index.codes.size == index.embeddings.size == 250
+    codes = index.quantizer.encode(index.embeddings.matrix)
+    assert np.array_equal(index.codes.matrix, codes)
+    assert np.allclose(index.codes.norms, index.quantizer.norms(codes))
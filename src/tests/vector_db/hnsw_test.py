@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from vector_db.index import HNSWIndex
+
+
+def test_recall_against_brute_force(provider, make_chunks, search_vector, exact_ids):
+    """
+    Tests that the graph finds nearly all of the exact nearest neighbours.
+    """
+    index = HNSWIndex(embedding_provider=provider, M=8, ef_construction=64, ef_search=64, seed=0)
+    index.add(make_chunks(1000, provider.dim))
+    index.merge()
+    assert not index.delta
+    queries = np.random.default_rng(1).standard_normal((20, provider.dim)).astype(np.float32)
+    hits = sum(
+        len(set(search_vector(index, q, 10)) & set(exact_ids(index, q, 10)))
+        for q in queries
+    )
+    assert hits / 200 >= 0.9
+
+
+def test_removed_chunks_are_never_returned(provider, make_chunks, search_vector):
+    """
+    Tests that tombstoned chunks are skipped, and that the graph is compacted once
+    tombstones pile up.
+    """
+    index = HNSWIndex(embedding_provider=provider, M=8, max_tombstone_ratio=0.5, seed=0)
+    chunks = make_chunks(200, provider.dim)
+    index.add(chunks)
+    index.merge()
+    removed = {chunk.id for chunk in chunks[:60]}
+    for chunk_id in removed:
+        index.remove(chunk_id)
+    assert len(index._tombstones) == 60
+    for chunk in chunks[:60]:
+        assert not removed & set(search_vector(index, chunk.embedding, 5))
+    for chunk in chunks[60:120]:
+        index.remove(chunk.id)
+    # Crossing half the nodes triggers a rebuild without tombstones, in the background
+    index.wait_for_compaction()
+    assert len(index._tombstones) < 60
+    assert len(index.chunks) == 80
+
+
+def test_update_moves_chunk_in_graph(provider, make_chunks, search_vector):
+    """
+    Tests that a chunk whose embedding changes is found at its new position, both
+    from the delta and once inserted back into the graph.
+    """
+    index = HNSWIndex(embedding_provider=provider, M=8, seed=0)
+    chunks = make_chunks(100, provider.dim)
+    index.add(chunks)
+    index.merge()
+    target = np.full(provider.dim, 10.0, dtype=np.float32)
+    index.set_embedding(chunks[0].id, target)
+    assert list(index.delta) == [chunks[0].id]
+    assert search_vector(index, target, 1) == [chunks[0].id]
+    index.merge()
+    assert search_vector(index, target, 1) == [chunks[0].id]
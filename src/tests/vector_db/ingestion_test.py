@@ -0,0 +1,99 @@
+import pytest
+
+from exceptions import DuplicateError
+from utils.embed import HashingEmbeddingProvider
+from vector_db import Library, Document, Chunk
+from vector_db.index import IndexTypes
+
+
+class FakeEmbedder(HashingEmbeddingProvider):
+    """A local stand-in for the embedding API that records every call."""
+    name = "fake"
+    batch_size = 96
+
+    def __init__(self):
+        super().__init__(dim=8)
+        self.calls = []
+
+    def embed(self, texts, input_type="search_document"):
+        self.calls.append(len(texts))
+        return super().embed(texts, input_type=input_type)
+
+
+@pytest.fixture
+def embedder():
+    return FakeEmbedder()
+
+
+@pytest.fixture
+def library(embedder):
+    library = Library(name="test", metadata={}, embedding_provider=embedder)
+    library.add_vector_search_index(IndexTypes.FLATL2)
+    return library
+
+
+def make_chunks(doc, n):
+    return [Chunk(text=f"chunk {i}", metadata={"doc_id": doc.id}) for i in range(n)]
+
+
+def test_add_chunks_embeds_in_batches(embedder, library):
+    """
+    Tests that adding chunks makes one embedding call per batch of 96 texts
+    and writes the embeddings back to the chunks.
+    """
+    doc = library.add_document(Document(name="doc", metadata={}))
+    chunks = make_chunks(doc, 250)
+    library.add_chunks(chunks)
+    assert embedder.calls == [96, 96, 58]
+    assert all(chunk.embedding is not None for chunk in chunks)
+    assert len(library.index.embeddings) == 250
+
+
+def test_add_chunks_skips_embedded_chunks(embedder, library):
+    """
+    Tests that chunks which already carry an embedding are not sent to the embedding API.
+    """
+    doc = library.add_document(Document(name="doc", metadata={}))
+    chunks = make_chunks(doc, 10)
+    for chunk in chunks[:7]:
+        chunk.embedding = [0.0] * embedder.dim
+    library.add_chunks(chunks)
+    assert embedder.calls == [3]
+
+
+def test_failed_add_chunks_adds_nothing(library):
+    """
+    Tests that a batch with a chunk of an unknown document, or a duplicate chunk, raises
+    without adding any of its chunks.
+    """
+    doc = library.add_document(Document(name="doc", metadata={}))
+    library.add_chunks(make_chunks(doc, 3))
+    chunks = make_chunks(doc, 3) + [Chunk(text="orphan", metadata={"doc_id": "missing"})]
+    with pytest.raises(KeyError):
+        library.add_chunks(chunks)
+    chunks = make_chunks(doc, 3)
+    with pytest.raises(DuplicateError):
+        library.add_chunks(chunks + [chunks[0]])
+    assert len(library.get_chunks()) == len(doc.get_chunks()) == len(library.index.embeddings) == 3
+
+
+def test_batch_size_is_configurable(embedder, library):
+    """
+    Tests that the batch size of the index is honoured.
+    """
+    library.index.embed_batch_size = 4
+    doc = library.add_document(Document(name="doc", metadata={}))
+    library.add_chunks(make_chunks(doc, 10))
+    assert embedder.calls == [4, 4, 2]
+
+
+def test_add_document_with_chunks_embeds_in_batches(embedder, library):
+    """
+    Tests that a document added with its chunks goes through the same batched path.
+    """
+    doc = Document(name="doc", metadata={})
+    for chunk in make_chunks(doc, 100):
+        doc.add_chunk(chunk)
+    library.add_document(doc)
+    assert embedder.calls == [96, 4]
+    assert len(library.get_chunks()) == 100
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from vector_db.index import IVFIndex
+
+
+def test_untrained_index_is_exact(provider, make_chunks, search_vector, exact_ids):
+    """
+    Tests that searches scan every chunk until the centroids are trained.
+    """
+    index = IVFIndex(embedding_provider=provider, seed=0)
+    index.add(make_chunks(100, provider.dim))
+    query = np.random.default_rng(1).standard_normal(provider.dim).astype(np.float32)
+    assert not index.is_trained
+    assert search_vector(index, query, 5) == exact_ids(index, query, 5)
+
+
+def test_recall_grows_with_nprobe(provider, make_chunks, search_vector, exact_ids):
+    """
+    Tests that probing every list is exact, and that a few probes already find most
+    of the nearest neighbours.
+    """
+    index = IVFIndex(embedding_provider=provider, n_lists=16, nprobe=16, seed=0)
+    index.add(make_chunks(2000, provider.dim))
+    index.build_index()
+    assert len(index.lists) == 16
+    assert sum(len(chunk_ids) for chunk_ids in index.lists) == 2000
+    queries = np.random.default_rng(1).standard_normal((20, provider.dim)).astype(np.float32)
+    for query in queries:
+        assert search_vector(index, query, 10) == exact_ids(index, query, 10)
+    index.nprobe = 6
+    hits = sum(
+        len(set(search_vector(index, q, 10)) & set(exact_ids(index, q, 10)))
+        for q in queries
+    )
+    assert hits / 200 >= 0.8
+
+
+def test_new_chunks_join_their_nearest_list(provider, make_chunks):
+    """
+    Tests that chunks added, updated or removed after training keep the lists in sync
+    without retraining.
+    """
+    index = IVFIndex(embedding_provider=provider, n_lists=8, seed=0)
+    chunks = make_chunks(400, provider.dim)
+    index.add(chunks[:300])
+    index.build_index()
+    centroids = index.centroids
+    index.add(chunks[300:])
+    assert index.centroids is centroids
+    for chunk in chunks[300:]:
+        label = index._chunk_list[chunk.id]
+        distances = ((centroids - chunk.embedding) ** 2).sum(axis=1)
+        assert label == distances.argmin()
+    index.remove(chunks[0].id)
+    assert chunks[0].id not in index._chunk_list
+    assert sum(len(chunk_ids) for chunk_ids in index.lists) == 399
+    index.set_embedding(chunks[1].id, centroids[3] + 1e-3)
+    assert index._chunk_list[chunks[1].id] == 3
+
+
+def test_build_retrains_unbalanced_lists(provider, make_chunks):
+    """
+    Tests that building a balanced index is a no-op, and that it retrains once a list
+    outgrows the others.
+    """
+    index = IVFIndex(embedding_provider=provider, n_lists=8, imbalance_factor=2.0, seed=0)
+    index.add(make_chunks(400, provider.dim))
+    index.build_index()
+    centroids = index.centroids
+    index.build_index()
+    assert index.centroids is centroids
+    # Pile new chunks right next to a single centroid
+    rng = np.random.default_rng(2)
+    crowded = make_chunks(400, provider.dim, seed=3)
+    for chunk in crowded:
+        chunk.embedding = centroids[0] + 1e-2 * rng.standard_normal(provider.dim)
+    index.add(crowded)
+    assert index.is_unbalanced()
+    index.build_index()
+    assert index.centroids is not centroids
+    assert sum(len(chunk_ids) for chunk_ids in index.lists) == 800
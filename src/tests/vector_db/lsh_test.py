@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from vector_db.index import LSHIndex
+
+
+@pytest.fixture
+def dim():
+    return 32
+
+
+def string_key(embedding, planes):
+    """Reference key built the way the index used to: one "0"/"1" per hyperplane."""
+    bits = []
+    for plane in planes:
+        dot = sum(float(e) * float(p) for e, p in zip(embedding, plane))
+        bits.append("1" if dot > 0 else "0")
+    return "".join(bits)
+
+
+def test_bucket_assignments_match_string_keys(provider, make_chunks):
+    """
+    Tests that the packed integer keys put chunks in the same buckets as the binary string keys.
+    """
+    index = LSHIndex(embedding_provider=provider, tables=1, bits=12, seed=7)
+    chunks = make_chunks(200, provider.dim)
+    index.add(chunks)
+    planes = index.hyperplanes[0]
+    for key, chunk_ids in index.buckets[0].items():
+        for chunk_id in chunk_ids:
+            embedding = index.get_embedding(chunk_id)
+            assert int(string_key(embedding, planes), 2) == key
+
+
+def test_fixed_seed_gives_same_buckets(provider, make_chunks):
+    """
+    Tests that two indexes with the same seed hash the same chunks to the same buckets.
+    """
+    a = LSHIndex(embedding_provider=provider, bits=16, tables=3, seed=1)
+    b = LSHIndex(embedding_provider=provider, bits=16, tables=3, seed=1)
+    a.add(make_chunks(50, provider.dim))
+    b.add(make_chunks(50, provider.dim))
+    for table_a, table_b in zip(a.buckets, b.buckets):
+        assert sorted(table_a) == sorted(table_b)
+        assert sorted(map(len, table_a.values())) == sorted(map(len, table_b.values()))
+
+
+def test_remove_empties_buckets(provider, make_chunks):
+    """
+    Tests that removing every chunk leaves no buckets behind in any table.
+    """
+    index = LSHIndex(embedding_provider=provider, bits=8, tables=2, seed=0)
+    chunks = make_chunks(20, provider.dim)
+    index.add(chunks)
+    for chunk in chunks:
+        index.remove(chunk.id)
+    assert index.buckets == [{}, {}]
+
+
+def recall_at_k(index, chunks, queries, k):
+    """Fraction of the exact k nearest neighbours the index returns."""
+    matrix = np.array([index.get_embedding(chunk.id) for chunk in chunks])
+    hits = 0
+    for query in queries:
+        exact = np.argsort(((matrix - query) ** 2).sum(axis=1))[:k]
+        expected = {chunks[i].id for i in exact}
+        hits += len(expected & {chunk.id for chunk, _ in index.search_by_vector(query, k)})
+    return hits / (k * len(queries))
+
+
+def test_more_tables_and_probes_raise_recall(provider, make_chunks):
+    """
+    Tests that probing neighbouring buckets in several tables finds more of the true neighbours
+    than probing a single bucket of a single table.
+    """
+    chunks = make_chunks(2000, provider.dim)
+    queries = np.random.default_rng(1).standard_normal((20, provider.dim))
+    exact_bucket = LSHIndex(embedding_provider=provider, tables=1, bits=12, probes=1, seed=0)
+    multi_probe = LSHIndex(embedding_provider=provider, tables=8, bits=12, probes=64, seed=0)
+    exact_bucket.add(chunks[:])
+    low = recall_at_k(exact_bucket, chunks, queries, k=10)
+    for chunk in chunks:
+        exact_bucket.remove(chunk.id)
+    multi_probe.add(chunks)
+    high = recall_at_k(multi_probe, chunks, queries, k=10)
+    assert high > low
+    assert high > 0.5
+
+
+def test_candidate_limit_bounds_the_search_space(provider, make_chunks):
+    """
+    Tests that probing stops once the candidate limit is reached.
+    """
+    index = LSHIndex(embedding_provider=provider, tables=4, bits=4, probes=16, candidate_limit=50, seed=0)
+    index.add(make_chunks(1000, provider.dim))
+    query = np.random.default_rng(3).standard_normal(provider.dim)
+    candidates = index._LSHIndex__candidates(query, k=10)
+    # 4 bits make for buckets of ~60 chunks, a round over 4 tables adds at most ~4 buckets
+    assert 50 <= len(candidates) < 1000
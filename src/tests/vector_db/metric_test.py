@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from vector_db.index import FlatL2Index, HNSWIndex, IVFIndex, LSHIndex, PQIndex
+
+
+def exact(embeddings, query, metric, k):
+    X = np.array(embeddings)
+    if metric == "l2":
+        scores = -np.linalg.norm(X - query, axis=1)
+    elif metric == "dot":
+        scores = X @ query
+    else:
+        scores = X @ query / np.linalg.norm(X, axis=1) / np.linalg.norm(query)
+    return np.argsort(-scores, kind="stable")[:5].tolist()
+
+
+# Index, whether it supports the dot metric, and whether its top 5 is exact on this corpus
+INDEXES = [
+    (lambda provider, metric: FlatL2Index(embedding_provider=provider, metric=metric), True, True),
+    (lambda provider, metric: FlatL2Index(embedding_provider=provider, metric=metric, quantization="int8", delta_threshold=10), True, False),
+    (lambda provider, metric: LSHIndex(embedding_provider=provider, metric=metric, bits=4, probes=16, candidate_limit=10_000, seed=0), True, True),
+    (lambda provider, metric: HNSWIndex(embedding_provider=provider, metric=metric, seed=0), False, True),
+    (lambda provider, metric: IVFIndex(embedding_provider=provider, metric=metric, n_lists=4, nprobe=4, seed=0), False, True),
+    (lambda provider, metric: PQIndex(embedding_provider=provider, metric=metric, m=4, seed=0), False, False),
+]
+
+
+@pytest.mark.parametrize("metric", ["l2", "cosine", "dot"])
+@pytest.mark.parametrize("make_index,supports_dot,is_exact", INDEXES)
+def test_metric(provider, make_index, supports_dot, is_exact, metric, make_chunks):
+    """
+    Tests that every index ranks chunks by its metric, or rejects a metric it doesn't support.
+    """
+    if metric == "dot" and not supports_dot:
+        with pytest.raises(ValueError):
+            make_index(provider, metric)
+        return
+    index = make_index(provider, metric)
+    chunks = make_chunks(300, provider.dim, varied_norms=True)
+    embeddings = [np.array(chunk.embedding) for chunk in chunks]
+    index.add(chunks)
+    index.build_index()
+    query = np.random.default_rng(1).standard_normal(provider.dim)
+    positions = {chunk.id: i for i, chunk in enumerate(chunks)}
+    found = [positions[chunk.id] for chunk, _ in index.search_by_vector(query, 5)]
+    expected = exact(embeddings, query, metric, 5)
+    if is_exact:
+        assert found == expected
+    else:
+        # Quantized codes only approximate the ranking
+        assert len(set(found) & set(expected)) >= 3
+
+
+def test_cosine_stores_unit_vectors(provider, make_chunks):
+    """
+    Tests that the cosine metric normalizes embeddings once, when they're written to the store.
+    """
+    index = FlatL2Index(embedding_provider=provider, metric="cosine")
+    chunks = make_chunks(10, provider.dim, varied_norms=True)
+    index.add(chunks)
+    index.set_embedding(chunks[0].id, np.full(provider.dim, 3.0))
+    assert np.allclose(np.linalg.norm(index.embeddings.matrix, axis=1), 1)
+
+
+@pytest.mark.parametrize("metric", ["l2", "cosine", "dot"])
+@pytest.mark.parametrize("make_index,supports_dot,is_exact", INDEXES[:3])
+def test_scores_and_thresholds(provider, make_index, supports_dot, is_exact, metric, make_chunks):
+    """
+    Tests that results come with their exact score, a distance with l2 and a similarity with
+    cosine and dot, and that thresholds leave out the chunks beyond them.
+    """
+    if metric == "dot" and not supports_dot:
+        return
+    index = make_index(provider, metric)
+    chunks = make_chunks(300, provider.dim, varied_norms=True)
+    index.add(chunks)
+    index.build_index()
+    query = np.random.default_rng(1).standard_normal(provider.dim)
+    results = index.search_by_vector(query, 10)
+    X = np.array([chunk.embedding for chunk, _ in results])
+    if metric == "l2":
+        expected = np.linalg.norm(X - query, axis=1)
+    elif metric == "dot":
+        expected = X @ query
+    else:
+        expected = X @ query / np.linalg.norm(X, axis=1) / np.linalg.norm(query)
+    scores = [score for _, score in results]
+    assert np.allclose(scores, expected, atol=1e-4)
+    threshold = scores[4]
+    if metric == "l2":
+        within = index.search_by_vector(query, 10, max_distance=threshold)
+        assert all(score <= threshold for _, score in within)
+        with pytest.raises(ValueError):
+            index.search_by_vector(query, 10, min_score=threshold)
+    else:
+        within = index.search_by_vector(query, 10, min_score=threshold)
+        assert all(score >= threshold for _, score in within)
+        with pytest.raises(ValueError):
+            index.search_by_vector(query, 10, max_distance=threshold)
+    assert [chunk.id for chunk, _ in within] == [chunk.id for chunk, _ in results[:len(within)]]
+    assert len(within) >= 4
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from vector_db.index import IVFIndex, PQIndex
+
+
+@pytest.fixture
+def dim():
+    return 32
+
+
+@pytest.fixture
+def recall(search_vector, exact_ids):
+    def recall(index, queries, k):
+        hits = sum(
+            len(set(search_vector(index, q, k)) & set(exact_ids(index, q, k)))
+            for q in queries
+        )
+        return hits / (len(queries) * k)
+    return recall
+
+
+def test_rerank_recovers_recall(provider, make_chunks, recall):
+    """
+    Tests that the codes alone find most neighbours, and that re-ranking with the full
+    embeddings on disk does better.
+    """
+    index = PQIndex(embedding_provider=provider, m=8, rerank_factor=0, seed=0)
+    index.add(make_chunks(2000, provider.dim))
+    index.build_index()
+    assert index.bytes_per_vector == 8
+    assert index.codes.matrix.shape == (2000, 8)
+    queries = np.random.default_rng(1).standard_normal((20, provider.dim)).astype(np.float32)
+    approximate = recall(index, queries, 10)
+    index.rerank_factor = 10
+    reranked = recall(index, queries, 10)
+    assert approximate >= 0.3
+    assert reranked >= 0.9 and reranked > approximate
+
+
+def test_codes_stay_aligned_with_chunks(provider, make_chunks):
+    """
+    Tests that chunks added, updated or removed after training keep their codes in
+    the row of their embedding.
+    """
+    index = PQIndex(embedding_provider=provider, m=8, seed=0)
+    chunks = make_chunks(300, provider.dim)
+    index.add(chunks[:200])
+    index.build_index()
+    index.add(chunks[200:])
+    for chunk in chunks[:50]:
+        index.remove(chunk.id)
+    index.set_embedding(chunks[60].id, np.ones(provider.dim))
+    assert index.codes.size == index.embeddings.size == 250
+    assert np.array_equal(index.codes.matrix, index.quantizer.encode(index.embeddings.matrix))
+    assert np.allclose(chunks[60].embedding, 1)
+
+
+def test_ivf_with_pq_storage(provider, make_chunks, recall):
+    """
+    Tests that an IVF index can keep its chunks as residual codes and still find the
+    nearest neighbours after re-ranking.
+    """
+    index = IVFIndex(embedding_provider=provider, n_lists=8, nprobe=8, pq_m=8, rerank_factor=10, seed=0)
+    chunks = make_chunks(1500, provider.dim)
+    index.add(chunks[:1000])
+    index.build_index()
+    index.add(chunks[1000:])
+    index.remove(chunks[0].id)
+    assert index.codes.size == index.embeddings.size == 1499
+    assert index.bytes_per_vector == 8
+    queries = np.random.default_rng(1).standard_normal((20, provider.dim)).astype(np.float32)
+    assert recall(index, queries, 10) >= 0.9
+
+
+@pytest.mark.parametrize("make_index", [
+    lambda provider: PQIndex(embedding_provider=provider, m=8, rerank_factor=0, seed=0),
+    lambda provider: IVFIndex(embedding_provider=provider, n_lists=8, pq_m=8, rerank_factor=0, seed=0),
+])
+def test_scores_are_sorted_without_rerank(provider, make_index, make_chunks):
+    """
+    Tests that the results ranked by the approximate distances of the codes alone come back
+    with their exact scores, closest first, and within `max_distance`.
+    """
+    index = make_index(provider)
+    index.add(make_chunks(1000, provider.dim))
+    index.build_index()
+    for query in np.random.default_rng(1).standard_normal((20, provider.dim)):
+        scores = [score for _, score in index.search_by_vector(query, 10)]
+        assert scores == sorted(scores)
+        threshold = scores[4]
+        within = [score for _, score in index.search_by_vector(query, 10, max_distance=threshold)]
+        assert within == sorted(within) and all(score <= threshold for score in within)
@@ -0,0 +1,71 @@
+import pytest
+
+from utils.embed import HashingEmbeddingProvider
+from vector_db import Library, Document, Chunk
+from vector_db.index import CollectionsIndex, IndexTypes
+
+
+class Item:
+    def __init__(self, id):
+        self.id = id
+
+
+def make_collection(n):
+    items = [Item(f"item-{i}") for i in range(n)]
+    index = CollectionsIndex()
+    for i, item in enumerate(items):
+        index.add(id=item.id, value=i)
+    return items, index
+
+
+def test_remove_swaps_last_item():
+    """
+    Tests that removing an item moves the last item into its slot and only fixes the moved item.
+    """
+    items, index = make_collection(5)
+    moved = index.remove(id="item-1", iterable=items, reindex_key="id")
+    assert moved.id == "item-4"
+    assert [item.id for item in items] == ["item-0", "item-4", "item-2", "item-3"]
+    assert index.index == {"item-0": 0, "item-4": 1, "item-2": 2, "item-3": 3}
+    # Removing the last item moves nothing
+    assert index.remove(id="item-3", iterable=items, reindex_key="id") is None
+    assert len(items) == 3
+
+
+def test_remove_many():
+    """
+    Tests that removing many items keeps every remaining item at its indexed position.
+    """
+    items, index = make_collection(100)
+    removed = {f"item-{i}" for i in range(0, 100, 3)}
+    index.remove_many(ids=removed, iterable=items, reindex_key="id")
+    assert len(items) == len(index.index) == 100 - len(removed)
+    assert all(items[index.search(item.id)] is item for item in items)
+    assert not removed & set(index.index)
+
+
+@pytest.mark.parametrize("index_type", [IndexTypes.FLATL2, IndexTypes.LSH, IndexTypes.HNSW, IndexTypes.IVF])
+def test_remove_document(index_type):
+    """
+    Tests that removing a document removes all of its chunks, and leaves the other documents
+    and their chunks searchable.
+    """
+    library = Library(name="test", metadata={}, embedding_provider=HashingEmbeddingProvider(dim=16))
+    library.add_vector_search_index(index_type)
+    docs = [library.add_document(Document(name=f"doc {i}", metadata={})) for i in range(3)]
+    for doc in docs:
+        library.add_chunks([
+            Chunk(text=f"{doc.name} chunk {i}", metadata={"doc_id": doc.id}) for i in range(50)
+        ])
+    library.remove_document(docs[0].id)
+    assert len(library.get_documents()) == 2
+    assert library.get_document(name="doc 2") is docs[2]
+    assert library.get_document(id=docs[1].id) is docs[1]
+    chunks = library.get_chunks()
+    assert len(chunks) == 100
+    assert not docs[0].get_chunks()
+    assert all(library.get_chunk(chunk.id) is chunk for chunk in chunks)
+    results = library.search("doc 2 chunk 7", k=5)
+    assert all(chunk.metadata["doc_id"] != docs[0].id for chunk, _ in results)
+    with pytest.raises(KeyError):
+        library.get_document(name="doc 0")
@@ -0,0 +1,109 @@
+import time
+
+import numpy as np
+
+from vector_db import Database, Library, Document, Chunk, Replica
+from vector_db.index import IndexTypes
+
+
+QUERY = np.random.default_rng(0).standard_normal(1024)
+
+
+def add_library(db, name, n=50):
+    library = Library(name=name, metadata={"description": name}, embedding_provider="hashing")
+    library.add_vector_search_index(IndexTypes.FLATL2)
+    db.add_library(library)
+    doc = library.add_document(Document(name="doc", metadata={}))
+    library.add_chunks([Chunk(text=f"{name} chunk {i}", metadata={"doc_id": doc.id}) for i in range(n)])
+    return library, doc
+
+
+def results(library):
+    return [(chunk.id, round(score, 4)) for chunk, score in library.search_by_vector(QUERY, k=5)]
+
+
+def test_replica_loads_new_versions(tmp_path):
+    """
+    Tests that a replica loads each version of the snapshot once, shares the libraries that
+    weren't written to with the previous version, and that the previous version is unchanged.
+    """
+    db = Database()
+    papers, doc = add_library(db, "papers")
+    add_library(db, "notes")
+    db.save(str(tmp_path))
+    replica = Replica(str(tmp_path))
+    first = replica.db
+    assert results(first.get_library("papers")) == results(papers)
+    assert not replica.refresh()
+
+    papers.add_chunks([Chunk(text="papers chunk 50", metadata={"doc_id": doc.id})])
+    db.remove_library("notes")
+    add_library(db, "books")
+    assert db.dirty
+    db.save(str(tmp_path))
+    assert not db.dirty
+    assert replica.refresh()
+    assert [library.name for library in replica.db.get_libraries()] == ["papers", "books"]
+    assert len(replica.db.get_library("papers").get_chunks()) == 51
+    assert results(replica.db.get_library("papers")) == results(papers)
+    assert len(first.get_library("papers").get_chunks()) == 50
+    assert first.get_library("notes").get_chunks()
+
+    # A rename changes no embeddings, the other libraries are shared with the previous version
+    previous = replica.db
+    db.update_library_name(previous_name="books", new_name="novels")
+    db.save(str(tmp_path))
+    assert replica.refresh()
+    assert replica.db.get_library("papers") is previous.get_library("papers")
+    assert replica.db.get_library("novels").get_chunks()
+
+
+def test_start_publishing(tmp_path):
+    """
+    Tests that a published database is saved once it's written to, and that a replica started
+    beforehand picks the writes up.
+    """
+    db = Database()
+    db.save(str(tmp_path))
+    replica = Replica(str(tmp_path), interval=0.01)
+    replica.start()
+    db.start_publishing(interval=0.01)
+    papers, _ = add_library(db, "papers")
+    expected = results(papers)
+
+    def published():
+        # A save may have caught the library before its chunks were added
+        libraries = replica.db.get_libraries()
+        return bool(libraries) and results(libraries[0]) == expected
+
+    deadline = time.monotonic() + 5
+    while not published() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert published()
+    assert not db.dirty
+
+
+def test_publishing_waits_for_the_bytes_written(tmp_path):
+    """
+    Tests that a save returns the bytes of the library files it wrote, and that publishing
+    waits longer after a large save, at the given write rate.
+    """
+    db = Database()
+    papers, doc = add_library(db, "papers")
+    written = db.save(str(tmp_path))
+    assert written >= 50 * 1024 * 4
+    assert db.save(str(tmp_path)) == 0
+    # About a second per save of the library
+    db.start_publishing(interval=0.01, write_rate=written)
+    papers.add_chunks([Chunk(text="papers chunk 50", metadata={"doc_id": doc.id})])
+    deadline = time.monotonic() + 5
+    while db.dirty and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not db.dirty
+    papers.add_chunks([Chunk(text="papers chunk 51", metadata={"doc_id": doc.id})])
+    time.sleep(0.5)
+    assert db.dirty
+    deadline = time.monotonic() + 5
+    while db.dirty and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not db.dirty
@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import pytest
+
+from vector_db import Database, Library, Document, Chunk
+from vector_db.index import IndexTypes
+
+
+# Seeded, so the saved and the loaded index draw the same levels and centroids. LSH isn't, it
+# keeps the seed it drew for its hyperplanes
+INDEX_PARAMS = {IndexTypes.HNSW: {"seed": 0}, IndexTypes.IVF: {"seed": 0}}
+
+
+def make_database(index_type, metric="l2"):
+    db = Database()
+    library = Library(name="papers", metadata={"description": "test"}, embedding_provider="hashing", metric=metric)
+    library.add_vector_search_index(index_type, **INDEX_PARAMS.get(index_type, {}))
+    db.add_library(library)
+    for d in range(3):
+        doc = library.add_document(Document(name=f"doc {d}", metadata={"source": f"s{d}"}))
+        library.add_chunks([
+            Chunk(text=f"doc {d} chunk {i} topic {i % 5}", metadata={"doc_id": doc.id, "page_number": i})
+            for i in range(40)
+        ])
+    # Removals move rows around, so the store's order differs from the documents'
+    library.remove_chunks([chunk.id for chunk in library.get_document(name="doc 1").get_chunks()[::3]])
+    return db
+
+
+def results(library, query):
+    return [(chunk.id, round(score, 4)) for chunk, score in library.search(query, k=5)]
+
+
+@pytest.mark.parametrize("metric", ["l2", "cosine"])
+@pytest.mark.parametrize("index_type", [IndexTypes.FLATL2, IndexTypes.LSH, IndexTypes.HNSW, IndexTypes.IVF])
+def test_save_and_load(tmp_path, index_type, metric):
+    """
+    Tests that a loaded database has the same libraries, documents, chunks and search results
+    as the saved one, without calling the embedding provider.
+    """
+    db = make_database(index_type, metric)
+    library = db.get_library("papers")
+    library.build_index()
+    expected = results(library, "topic 3 chunk 7")
+    db.save(str(tmp_path))
+    loaded = Database.load(str(tmp_path)).get_library("papers")
+    loaded.index.embed_chunks = None
+    assert loaded.dict() == library.dict()
+    assert [doc.dict() for doc in loaded.get_documents()] == [doc.dict() for doc in library.get_documents()]
+    for chunk in library.get_chunks():
+        restored = loaded.get_chunk(chunk.id)
+        assert (restored.text, restored.metadata) == (chunk.text, chunk.metadata)
+        assert np.allclose(restored.embedding, chunk.embedding)
+    loaded.build_index()
+    if index_type == IndexTypes.HNSW:
+        # The graph is rebuilt in the order of the rows
+        assert len(set(results(loaded, "topic 3 chunk 7")) & set(expected)) >= 4
+    else:
+        assert results(loaded, "topic 3 chunk 7") == expected
+
+
+def test_loaded_library_is_writable(tmp_path):
+    """
+    Tests that the embeddings of a loaded library are memory-mapped from the snapshot, and
+    that writing to the library never changes the snapshot.
+    """
+    db = make_database(IndexTypes.FLATL2)
+    db.save(str(tmp_path))
+    files = {name: (tmp_path / name).read_bytes() for name in os.listdir(tmp_path)}
+    loaded = Database.load(str(tmp_path))
+    library = loaded.get_library("papers")
+    assert isinstance(library.index.embeddings._buffer.base, np.memmap)
+    doc = library.get_document(name="doc 0")
+    chunks = doc.get_chunks()
+    library.update_chunk(chunks[0].id, "a new text")
+    library.remove_chunk(chunks[1].id)
+    library.add_chunks([Chunk(text="a new chunk", metadata={"doc_id": doc.id})])
+    assert library.search("a new chunk", k=1)[0][0].text == "a new chunk"
+    assert {name: (tmp_path / name).read_bytes() for name in os.listdir(tmp_path)} == files
+
+
+def test_save_replaces_previous_snapshot(tmp_path):
+    """
+    Tests that saving again only leaves the files of the new snapshot behind, and that a
+    directory without a snapshot loads as an empty database.
+    """
+    assert Database.load(str(tmp_path)).get_libraries() == []
+    db = make_database(IndexTypes.FLATL2)
+    db.save(str(tmp_path))
+    first = set(os.listdir(tmp_path))
+    db.get_library("papers").remove_document(db.get_library("papers").get_document(name="doc 2").id)
+    db.save(str(tmp_path))
+    second = set(os.listdir(tmp_path))
+    assert first & second == {"manifest.json"}
+    assert len(second) == 4
+    library = Database.load(str(tmp_path)).get_library("papers")
+    assert len(library.get_chunks()) == 40 + 26
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_quantized_round_trip(tmp_path, quantization):
+    """
+    Tests that a loaded quantized FlatL2 index keeps its codes aligned with its rows, so that
+    chunks added and removed after the load are found, and not mistaken for others.
+    """
+    db = Database()
+    library = db.add_library(Library(name="papers", metadata={}, embedding_provider="hashing"))
+    library.add_vector_search_index(IndexTypes.FLATL2, quantization=quantization)
+    doc = library.add_document(Document(name="doc", metadata={}))
+    library.add_chunks([Chunk(text=f"alpha {i} word{i}", metadata={"doc_id": doc.id}) for i in range(20)])
+    library.build_index()
+    db.save(str(tmp_path))
+    library = Database.load(str(tmp_path)).get_library("papers")
+    library.add_chunks([Chunk(text=f"beta {i} zz{i}", metadata={"doc_id": doc.id}) for i in range(5)])
+    texts = [chunk.text for chunk, _ in library.search("beta 3 zz3", k=3)]
+    assert texts[0] == "beta 3 zz3" and len(set(texts)) == 3
+    library.remove_chunk(next(chunk.id for chunk in library.get_chunks() if chunk.text == "alpha 0 word0"))
+    for text in ["beta 3 zz3", "alpha 7 word7", "beta 0 zz0"]:
+        assert library.search(text, k=1)[0][0].text == text
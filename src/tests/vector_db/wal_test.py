@@ -0,0 +1,166 @@
+import threading
+
+import numpy as np
+import pytest
+
+from utils.embed import get_provider
+from vector_db import Database, Library, Document, Chunk
+from vector_db.index import IndexTypes
+from vector_db.wal import WriteAheadLog
+
+
+# Searched by vector, since a text query would call the embedding provider
+QUERY = np.random.default_rng(0).standard_normal(1024)
+
+
+def add_library(db, name):
+    library = Library(name=name, metadata={}, embedding_provider="hashing", metric="cosine")
+    library.add_vector_search_index(IndexTypes.FLATL2)
+    return db.add_library(library)
+
+
+def write(db, library, start, n=20):
+    """A bit of every write of a library: documents with and without chunks, chunk updates and
+    removals."""
+    doc = library.add_document(Document(name=f"doc {start}", metadata={}))
+    chunks = [Chunk(text=f"chunk {i} topic {i % 4}", metadata={"doc_id": doc.id}) for i in range(start, start + n)]
+    library.add_chunks(chunks)
+    library.update_chunk(chunks[0].id, f"updated chunk {start}")
+    library.update_chunks({chunks[1].id: f"bulk updated chunk {start}", chunks[2].id: chunks[2].text})
+    library.remove_chunk(chunks[3].id)
+    library.remove_chunks([chunks[4].id, "missing"])
+    with_chunks = Document(name=f"doc {start} with chunks", metadata={"source": "s"})
+    with_chunks.add_chunk(Chunk(text=f"chunk of a new document {start}", metadata={}))
+    library.add_document(with_chunks)
+
+
+def state(db):
+    return {
+        library.name: (
+            [doc.dict() for doc in library.get_documents()],
+            sorted((chunk.id, chunk.text, np.round(chunk.embedding, 5).tolist()) for chunk in library.get_chunks()),
+            [(chunk.id, round(score, 4)) for chunk, score in library.search_by_vector(QUERY, k=5)]
+        )
+        for library in db.get_libraries()
+    }
+
+
+@pytest.fixture
+def no_embedding(monkeypatch):
+    """Fails any call to the embedding provider, once the writes to replay are made."""
+    def disable():
+        def embed(*args, **kwargs):
+            raise AssertionError("The embedding provider was called during replay.")
+        monkeypatch.setattr(get_provider("hashing"), "embed", embed)
+    return disable
+
+
+def test_replay(tmp_path, no_embedding):
+    """
+    Tests that replaying the log on an empty database restores every write, without calling
+    the embedding provider.
+    """
+    path = str(tmp_path / "wal.log")
+    db = Database()
+    db.open_wal(path)
+    library = add_library(db, "papers")
+    write(db, library, 0)
+    removed = add_library(db, "removed")
+    write(db, removed, 0)
+    db.remove_library("removed")
+    db.update_library_name(previous_name="papers", new_name="articles")
+    write(db, library, 100)
+    expected = state(db)
+    no_embedding()
+    replayed = Database()
+    replayed.open_wal(path)
+    assert state(replayed) == expected
+    # Writes after the replay are appended after the replayed ones
+    lsn = replayed.wal.lsn
+    replayed.get_library("articles").remove_document(replayed.get_library("articles").get_document(name="doc 0").id)
+    assert replayed.wal.lsn == lsn + 1
+
+
+def test_replay_lsh_without_seed(tmp_path, no_embedding):
+    """
+    Tests that an LSH library created without a seed is replayed with the same hyperplanes.
+    """
+    path = str(tmp_path / "wal.log")
+    db = Database()
+    db.open_wal(path)
+    library = Library(name="papers", metadata={}, embedding_provider="hashing")
+    library.add_vector_search_index(IndexTypes.LSH)
+    write(db, db.add_library(library), 0)
+    expected = state(db)
+    no_embedding()
+    replayed = Database()
+    replayed.open_wal(path)
+    assert np.array_equal(replayed.get_library("papers").index.hyperplanes, library.index.hyperplanes)
+    assert state(replayed) == expected
+
+
+def test_snapshot_and_log_tail(tmp_path, no_embedding):
+    """
+    Tests that a snapshot truncates the log, and that loading the snapshot and replaying the
+    log written since restores the database.
+    """
+    snapshot_path, wal_path = str(tmp_path / "snapshot"), str(tmp_path / "wal.log")
+    db = Database()
+    db.open_wal(wal_path)
+    library = add_library(db, "papers")
+    write(db, library, 0)
+    db.save(snapshot_path)
+    assert list(db.wal.records()) == []
+    write(db, library, 100)
+    other = add_library(db, "other")
+    write(db, other, 0)
+    db.update_library_name(previous_name="papers", new_name="articles")
+    expected = state(db)
+    no_embedding()
+    restored = Database.load(snapshot_path)
+    restored.open_wal(wal_path)
+    assert state(restored) == expected
+
+
+def test_torn_record_is_dropped(tmp_path):
+    """
+    Tests that a record torn by a crash is dropped when the log is opened, and that new records
+    follow the last complete one.
+    """
+    path = tmp_path / "wal.log"
+    wal = WriteAheadLog(str(path))
+    for i in range(3):
+        wal.sync(wal.append({"op": "remove_chunks", "library": "papers", "ids": [str(i)]}, np.ones((2, 4))))
+    wal.close()
+    path.write_bytes(path.read_bytes()[:-5])
+    wal = WriteAheadLog(str(path))
+    assert wal.lsn == 2
+    wal.sync(wal.append({"op": "remove_chunks", "library": "papers", "ids": ["3"]}))
+    records = list(wal.records())
+    assert [record["lsn"] for record, _ in records] == [1, 2, 3]
+    assert records[0][1].tolist() == np.ones((2, 4)).tolist()
+    assert records[2][1] is None
+
+
+def test_group_commit(tmp_path):
+    """
+    Tests that concurrent writers share fsyncs, and that every record is durable once its
+    writer's sync returns.
+    """
+    wal = WriteAheadLog(str(tmp_path / "wal.log"), commit_delay=0.005)
+    synced = []
+
+    def writer(i):
+        for j in range(10):
+            lsn = wal.append({"op": "remove_chunks", "library": "papers", "ids": [f"{i}-{j}"]})
+            wal.sync(lsn)
+            synced.append(lsn)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(synced) == list(range(1, 81))
+    assert wal.fsyncs < 80
+    assert len(list(wal.records())) == 80
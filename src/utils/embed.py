@@ -1,25 +1,302 @@
 
 import os
-from typing import List
-import cohere
+import hashlib
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Type
+import numpy as np
 from dotenv import load_dotenv
+from utils.embedding_cache import EmbeddingCache
 
 load_dotenv()
 
 API_KEY = os.getenv("COHERE_API_KEY")
+DEFAULT_EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "cohere")
+EMBED_BATCH_SIZE = 96 # Cohere embeds at most 96 texts per request
+# Megabytes of embeddings the cache keeps in memory, 0 disables the embedding cache
+EMBEDDING_CACHE_MB = float(os.getenv("EMBEDDING_CACHE_MB", "64"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+# Only queries are cached by default: the embeddings of the chunks are stored in their library
+EMBEDDING_CACHE_INPUT_TYPES = os.getenv("EMBEDDING_CACHE_INPUT_TYPES", "search_query").split(",")
 
-co = cohere.ClientV2(
-    api_key=API_KEY
-)
+class EmbeddingProvider:
+    """
+    Interface for the models that turn text into vectors. A provider declares its name, the
+    model it serves, the dimensionality of its vectors and how many texts it can embed per
+    request. Providers are registered by name with `register_provider` so a library can pick
+    one when it's created.
+
+    `input_type` distinguishes documents being indexed (`search_document`) from queries
+    (`search_query`), for the models that embed the two differently. `embed` returns one vector
+    per text, either as a list of lists or as a 2-d float32 array for the local providers.
+    """
+    name: str = None
+    model: str = None
+    batch_size: int = EMBED_BATCH_SIZE
+
+    @property
+    def dim(self) -> int:
+        raise NotImplementedError
+
+    def embed(
+        self,
+        texts: List[str],
+        input_type: str = "search_document"
+    ) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed_in_batches(
+        self,
+        texts: List[str],
+        input_type: str = "search_document",
+        batch_size: Optional[int] = None
+    ) -> List[List[float]]:
+        """
+        Embeds a list of texts with one request per `batch_size` texts, instead of one per text.
+        """
+        batch_size = batch_size or self.batch_size
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            embeddings.extend(self.embed(texts[start: start + batch_size], input_type=input_type))
+        return embeddings
+
+class CachedEmbeddingProvider(EmbeddingProvider):
+    """
+    Wraps a provider with an `EmbeddingCache`. Texts already embedded by the same provider,
+    model and input type are served from the cache, and the rest are embedded in a single
+    request to the wrapped provider. Only the `input_types` given are cached, all of them if
+    None, and texts of the other types always go to the wrapped provider.
+    """
+    def __init__(
+        self,
+        provider: EmbeddingProvider,
+        cache: EmbeddingCache,
+        input_types: Optional[Iterable[str]] = None
+    ):
+        self.provider = provider
+        self.cache = cache
+        self.input_types = None if input_types is None else set(input_types)
+        self.name = provider.name
+        self.model = provider.model
+        self.batch_size = provider.batch_size
+
+    @property
+    def dim(self) -> int:
+        return self.provider.dim
+
+    def embed(
+        self,
+        texts: List[str],
+        input_type: str = "search_document"
+    ) -> np.ndarray:
+        if self.input_types is not None and input_type not in self.input_types:
+            return np.asarray(self.provider.embed(texts, input_type=input_type), dtype=np.float32)
+        keys = [
+            EmbeddingCache.key(self.name, self.model, input_type, text)
+            for text in texts
+        ]
+        cached = self.cache.get_many(keys)
+        # Embed every distinct missing text once
+        missing: Dict[str, int] = {}
+        for text, vector in zip(texts, cached):
+            if vector is None and text not in missing:
+                missing[text] = len(missing)
+        if missing:
+            embedded = np.asarray(
+                self.provider.embed(list(missing), input_type=input_type),
+                dtype=np.float32
+            )
+            self.cache.put_many(
+                (EmbeddingCache.key(self.name, self.model, input_type, text), embedded[i])
+                for text, i in missing.items()
+            )
+        embeddings = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, (text, vector) in enumerate(zip(texts, cached)):
+            embeddings[i] = vector if vector is not None else embedded[missing[text]]
+        return embeddings
+
+EMBEDDING_PROVIDERS: Dict[str, Type[EmbeddingProvider]] = {}
+_providers: Dict[str, EmbeddingProvider] = {}
+embedding_cache: Optional[EmbeddingCache] = None
+if EMBEDDING_CACHE_MB > 0:
+    embedding_cache = EmbeddingCache(
+        max_bytes=int(EMBEDDING_CACHE_MB * 2**20),
+        path=EMBEDDING_CACHE_PATH
+    )
+
+def register_provider(provider: Type[EmbeddingProvider]) -> Type[EmbeddingProvider]:
+    """Class decorator that makes a provider selectable by its name."""
+    EMBEDDING_PROVIDERS[provider.name] = provider
+    return provider
+
+def get_provider(name: Optional[str] = None) -> EmbeddingProvider:
+    """
+    Get the provider registered under `name`, or the default provider. Providers are created
+    once and shared, so that clients and models are only set up the first time they're used,
+    and are wrapped with the shared `embedding_cache` unless it's disabled.
+    """
+    name = name or DEFAULT_EMBEDDING_PROVIDER
+    if name not in EMBEDDING_PROVIDERS:
+        raise KeyError(f'Embedding provider `{name}` does not exist.')
+    if name not in _providers:
+        provider = EMBEDDING_PROVIDERS[name]()
+        if embedding_cache is not None:
+            provider = CachedEmbeddingProvider(
+                provider,
+                cache=embedding_cache,
+                input_types=EMBEDDING_CACHE_INPUT_TYPES
+            )
+        _providers[name] = provider
+    return _providers[name]
+
+@register_provider
+class CohereEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the Cohere API. The client is created on the first request."""
+    name = "cohere"
+    batch_size = EMBED_BATCH_SIZE
+
+    def __init__(
+        self,
+        model: str = "embed-english-v3.0",
+        dim: int = 1024,
+        api_key: Optional[str] = None
+    ):
+        self.model = model
+        self._dim = dim
+        self._api_key = api_key or API_KEY
+        self._client = None
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    @property
+    def client(self):
+        if self._client is None:
+            import cohere
+            self._client = cohere.ClientV2(
+                api_key=self._api_key
+            )
+        return self._client
+
+    def embed(
+        self,
+        texts: List[str],
+        input_type: str = "search_document"
+    ) -> List[List[float]]:
+        response = self.client.embed(
+            texts=texts,
+            model=self.model,
+            input_type=input_type,
+            embedding_types=["float"],
+        )
+        return response.embeddings.float_
+
+@register_provider
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic, offline embeddings for tests and benchmarks. Every token is hashed to a seed
+    that draws a fixed random gaussian vector, and a text is the normalized sum of the vectors
+    of its tokens. This is a random projection of the text's bag of words, so texts sharing
+    words end up close to each other, and the same text always gets the same vector on any
+    machine.
+    """
+    name = "hashing"
+    model = "hashing-random-projection"
+    batch_size = 1024
+
+    def __init__(
+        self,
+        dim: int = 1024,
+        seed: int = 0
+    ):
+        self._dim = dim
+        self.seed = seed
+        self.model = f"hashing-random-projection-{dim}-{seed}"
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    @lru_cache(maxsize=65536)
+    def _token_vector(self, token: str) -> np.ndarray:
+        digest = hashlib.blake2b(
+            token.encode("utf-8"),
+            digest_size=8,
+            key=self.seed.to_bytes(8, "little")
+        ).digest()
+        rng = np.random.default_rng(int.from_bytes(digest, "little"))
+        return rng.standard_normal(self._dim).astype(np.float32)
+
+    def embed(
+        self,
+        texts: List[str],
+        input_type: str = "search_document"
+    ) -> List[List[float]]:
+        embeddings = np.zeros((len(texts), self._dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in text.lower().split():
+                embeddings[i] += self._token_vector(token)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+        return embeddings
+
+@register_provider
+class SentenceTransformerEmbeddingProvider(EmbeddingProvider):
+    """
+    Embeddings from a local sentence-transformers model. The package and the model weights are
+    only loaded on the first request, or when the dimension of an unknown model is needed.
+    """
+    name = "sentence-transformers"
+    batch_size = 64
+    KNOWN_DIMS = {
+        "all-MiniLM-L6-v2": 384,
+        "all-mpnet-base-v2": 768,
+    }
+
+    def __init__(
+        self,
+        model: str = "all-MiniLM-L6-v2",
+        dim: Optional[int] = None
+    ):
+        self.model = model
+        self._dim = dim or self.KNOWN_DIMS.get(model)
+        self._model = None
+
+    @property
+    def dim(self) -> int:
+        if self._dim is None:
+            self._dim = self._load().get_sentence_embedding_dimension()
+        return self._dim
+
+    def _load(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model)
+        return self._model
+
+    def embed(
+        self,
+        texts: List[str],
+        input_type: str = "search_document"
+    ) -> List[List[float]]:
+        embeddings = self._load().encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True
+        )
+        return embeddings.astype(np.float32, copy=False)
 
 def embed(texts: List[str]) -> List[List[float]]:
-  """
-  Embeds a list of texts into a list of vectors.
-  """
-  response = co.embed(
-      texts=texts,
-      model="embed-english-v3.0",
-      input_type="search_document",
-      embedding_types=["float"],
-  )
-  return response.embeddings.float_
+    """
+    Embeds a list of texts into a list of vectors with the default provider.
+    """
+    return get_provider().embed(texts)
+
+def embed_in_batches(
+    texts: List[str],
+    batch_size: int = EMBED_BATCH_SIZE
+) -> List[List[float]]:
+    """
+    Embeds a list of texts with one request per `batch_size` texts, instead of one per text.
+    """
+    return get_provider().embed_in_batches(texts, batch_size=batch_size)
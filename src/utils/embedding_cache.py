@@ -0,0 +1,134 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+CacheKey = Tuple[str, str, str, str]
+
+class EmbeddingCache:
+    """
+    A content-addressed cache of embeddings, keyed by (provider, model, input_type, sha256(text)).
+
+    ## Memory:
+    The most recently used embeddings are kept in memory as float32 arrays, in an LRU holding at
+    most `max_bytes` of them: 64 MB is about 16,000 embeddings of 1024 dimensions. Looking up or
+    inserting an entry moves it to the front, and the least recently used entries are evicted
+    once the LRU is full.
+
+    ## Spill file:
+    If a `path` is given, every embedding is also written to a SQLite file. Entries evicted from
+    the LRU, or cached by a previous process, are read back from it on a miss and promoted to
+    memory again.
+
+    `hits` and `misses` count lookups served from the cache (memory or disk) and lookups that
+    had to go to the provider.
+    """
+    def __init__(
+        self,
+        max_bytes: int = 64 * 2**20,
+        path: Optional[str] = None
+    ):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def key(provider: str, model: str, input_type: str, text: str) -> CacheKey:
+        return (provider, model, input_type, hashlib.sha256(text.encode("utf-8")).hexdigest())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, keys: List[CacheKey]) -> List[Optional[np.ndarray]]:
+        """Look up many keys at once. Misses are returned as None."""
+        with self._lock:
+            results = []
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is None:
+                    vector = self._read(key)
+                    if vector is not None:
+                        self._remember(key, vector)
+                else:
+                    self._entries.move_to_end(key)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                results.append(vector)
+            return results
+
+    def put_many(self, items: Iterable[Tuple[CacheKey, np.ndarray]]):
+        """Insert many embeddings at once, in a single transaction on the spill file."""
+        with self._lock:
+            rows = []
+            for key, vector in items:
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((self._db_key(key), vector.tobytes()))
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key: CacheKey, vector: np.ndarray):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.nbytes -= previous.nbytes
+        self._entries[key] = vector
+        self.nbytes += vector.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def _read(self, key: CacheKey) -> Optional[np.ndarray]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT vector FROM embeddings WHERE key = ?", (self._db_key(key),)
+        ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    @staticmethod
+    def _db_key(key: CacheKey) -> str:
+        return "\x1f".join(key)
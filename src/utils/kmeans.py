@@ -0,0 +1,80 @@
+from typing import Optional, Tuple
+import numpy as np
+
+def squared_distances(X: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Squared L2 distances between every row of X and every centroid, of shape (len(X), len(centroids))."""
+    X_norms = np.einsum('ij,ij->i', X, X)[:, None]
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)[None, :]
+    distances = X_norms - 2 * (X @ centroids.T) + centroid_norms
+    return np.maximum(distances, 0, out=distances)
+
+def _scores(X: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """||c||² - 2x·c, which ranks the centroids of each row of X like the squared distance does,
+    without computing ||x||²."""
+    scores = X @ centroids.T
+    scores *= -2
+    scores += np.einsum('ij,ij->i', centroids, centroids)
+    return scores
+
+def assign(X: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid of every row of X."""
+    if len(X) == 0:
+        return np.empty(0, dtype=np.intp)
+    return _scores(X, centroids).argmin(axis=1)
+
+def kmeans(
+    X,
+    k: int,
+    iterations: int = 20,
+    seed: Optional[int] = None,
+    tolerance: float = 1e-4
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Lloyd's k-means with k-means++ seeding. Returns the centroids, of shape (k, dim), and the
+    index of the centroid every row of X is assigned to. A cluster that ends up empty is
+    re-seeded with the point farthest from its centroid.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    n = len(X)
+    if n == 0:
+        raise ValueError('Cannot run k-means on an empty set of vectors.')
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    # k-means++: every new centroid is drawn with probability proportional to its squared
+    # distance to the closest centroid picked so far
+    centroids = np.empty((k, X.shape[1]), dtype=np.float32)
+    centroids[0] = X[rng.integers(n)]
+    closest = squared_distances(X, centroids[:1])[:, 0]
+    for i in range(1, k):
+        total = closest.sum()
+        if total > 0:
+            centroids[i] = X[rng.choice(n, p=closest / total)]
+        else:
+            centroids[i] = X[rng.integers(n)]
+        closest = np.minimum(closest, squared_distances(X, centroids[i:i + 1])[:, 0])
+
+    X_norms = np.einsum('ij,ij->i', X, X)
+    for _ in range(iterations):
+        scores = _scores(X, centroids)
+        labels = scores.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        # Sum the points of every cluster in one pass over the points sorted by cluster
+        order = np.argsort(labels, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(X[order], starts, axis=0)
+        new_centroids = centroids.copy()
+        new_centroids[filled] = sums[filled] / counts[filled, None]
+        if not filled.all():
+            # Squared distance of every point to its centroid
+            distances = scores[np.arange(n), labels] + X_norms
+            for empty in np.flatnonzero(~filled):
+                farthest = distances.argmax()
+                new_centroids[empty] = X[farthest]
+                distances[farthest] = -np.inf
+        shift = np.abs(new_centroids - centroids).max()
+        centroids = new_centroids
+        if shift <= tolerance:
+            break
+    return centroids, assign(X, centroids)
@@ -1,34 +1,119 @@
-import math
+import numpy as np
+
+METRICS = ('l2', 'cosine', 'dot')
+
+def normalize(X) -> np.ndarray:
+    """Scale vectors, or a single vector, to unit L2 norm. Zero vectors are left as they are."""
+    X = np.array(X, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=-1, keepdims=True)
+    np.divide(X, norms, out=X, where=norms > 0)
+    return X
 
 class KNearNeighbors:
-    """A simple implementation of the K nearest neighbors algorithm."""
-    def __init__(self):
-        self.X = []
-        """X: List of embeddings or the vector space to search in."""
-        
-    def fit(self, X):
+    """
+    K nearest neighbors over a single contiguous float32 matrix.
+
+    With the `l2` metric, distances to every embedding are computed in one matrix-vector
+    product using the expansion ||x - q||² = ||x||² - 2x·q + ||q||², where ||x||² is computed
+    once at fit time. With the `dot` metric, and the `cosine` metric whose embeddings and
+    queries are normalized beforehand, the distance is simply the negated dot product -x·q, so
+    the norms and the square root are skipped altogether.
+
+    The top k are then selected with `argpartition`, so only the k winners get sorted
+    instead of the whole distance array. `predict_many` scores a batch of queries with a single
+    matrix-matrix product instead of one matrix-vector product per query.
+    """
+    # Largest number of query-to-embedding distances computed at once by `predict_many`,
+    # i.e. 64 MB of float32
+    MAX_DISTANCES = 1 << 24
+
+    def __init__(self, metric: str = 'l2'):
+        if metric not in METRICS:
+            raise ValueError(f'Metric `{metric}` is not supported, use one of {", ".join(METRICS)}.')
+        self.metric = metric
+        self.X = np.empty((0, 0), dtype=np.float32)
+        """X: Matrix of embeddings or the vector space to search in."""
+        self.norms = np.empty(0, dtype=np.float32)
+        """norms: Squared L2 norm of every row in X."""
+
+    def fit(self, X, norms=None):
         """
-        Fit the model with a set of embeddings.
+        Fit the model with a set of embeddings. If the squared norms of the embeddings are
+        already known, e.g. tracked by an `EmbeddingStore`, they can be passed in to avoid
+        recomputing them.
         """
-        self.X = X
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(0, 0) if len(X) == 0 else X.reshape(1, -1)
+        self.X = np.ascontiguousarray(X)
+        if self.metric != 'l2':
+            # Only the dot products are needed
+            norms = np.empty(0, dtype=np.float32)
+        elif norms is None:
+            norms = np.einsum('ij,ij->i', self.X, self.X)
+        self.norms = np.asarray(norms, dtype=np.float32)
         return self
-        
+
     def compute_distance(self, query):
-        """Compute the distance between the query and all the embeddings."""
-        dist = []
-        for embedding in self.X:
-            pairwise_sum = 0
-            for i in range(len(embedding)):
-                pairwise_sum+= (embedding[i]-query[i])**2
-            dist.append(math.sqrt(pairwise_sum))
-        return dist
-    
-    def argsort(self, dist):
-        """Simple implementation of argsort."""
-        return sorted(range(len(dist)), key=lambda i: dist[i])
-    
-    def predict(self, query, k):
-        """Predict the k nearest neighbors."""
+        """Compute the distance between the query and all the embeddings: the Euclidean
+        distance with the `l2` metric, and the negated dot product otherwise."""
+        query = np.asarray(query, dtype=np.float32)
+        if self.metric != 'l2':
+            dist = self.X @ query
+            return np.negative(dist, out=dist)
+        dist = self.norms - 2 * (self.X @ query) + query @ query
+        # Rounding in the expansion can push exact matches slightly below zero
+        np.maximum(dist, 0, out=dist)
+        return np.sqrt(dist, out=dist)
+
+    def argsort(self, dist, k, max_distance=None):
+        """Indices of the k smallest distances, in ascending order. Ties are broken
+        by position so the ordering matches a stable full sort. Distances above `max_distance`
+        are dropped before selecting, so only the remaining ones are partitioned and sorted."""
+        if max_distance is not None:
+            positions = np.flatnonzero(dist <= max_distance)
+            return positions[self.argsort(dist[positions], k)]
+        k = min(k, len(dist))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        if k < len(dist):
+            kth = dist[np.argpartition(dist, k - 1)[k - 1]]
+            # Keep every tie of the k-th distance so the lowest positions win
+            candidates = np.flatnonzero(dist <= kth)
+        else:
+            candidates = np.arange(len(dist))
+        order = np.lexsort((candidates, dist[candidates]))
+        return candidates[order[:k]]
+
+    def predict(self, query, k, max_distance=None):
+        """Predict the k nearest neighbors, within `max_distance` if set."""
+        if len(self.X) == 0:
+            return []
         dist = self.compute_distance(query)
-        return self.argsort(dist)[:k]
-        
\ No newline at end of file
+        return self.argsort(dist, k, max_distance).tolist()
+
+    def compute_distances(self, queries):
+        """Compute the distances between every query and all the embeddings, of shape
+        (number of queries, number of embeddings)."""
+        queries = np.asarray(queries, dtype=np.float32)
+        dist = queries @ self.X.T
+        if self.metric != 'l2':
+            return np.negative(dist, out=dist)
+        dist *= -2
+        dist += self.norms
+        dist += np.einsum('ij,ij->i', queries, queries)[:, None]
+        np.maximum(dist, 0, out=dist)
+        return np.sqrt(dist, out=dist)
+
+    def predict_many(self, queries, k, max_distance=None):
+        """Predict the k nearest neighbors of every query, within `max_distance` if set."""
+        queries = np.asarray(queries, dtype=np.float32)
+        if len(self.X) == 0:
+            return [[] for _ in range(len(queries))]
+        # Bound the size of the distance matrix
+        batch_size = max(1, self.MAX_DISTANCES // len(self.X))
+        neighbors = []
+        for start in range(0, len(queries), batch_size):
+            dist = self.compute_distances(queries[start:start + batch_size])
+            neighbors.extend(self.argsort(row, k, max_distance).tolist() for row in dist)
+        return neighbors
@@ -0,0 +1,100 @@
+from typing import Optional
+import numpy as np
+from utils.kmeans import assign, kmeans
+
+class ProductQuantizer:
+    """
+    Product quantization codec. A vector is split into `m` sub-vectors of `dim / m` dimensions,
+    and each sub-vector is replaced by the index of its nearest centroid in the codebook of its
+    subspace. With 256 centroids per codebook, a vector is stored as `m` uint8 codes instead of
+    `dim` floats.
+
+    ## Asymmetric distance computation:
+    The query is never quantized. For a query, `distance_table` computes the squared distance
+    from each of its sub-vectors to every centroid of the matching codebook, and the distance
+    to a stored vector is then `m` table lookups added up (`adc`), with no float vector decoded.
+    """
+    ENCODE_BATCH_SIZE = 65536
+
+    def __init__(
+        self,
+        dim: int,
+        m: int,
+        n_centroids: int = 256,
+        iterations: int = 20,
+        seed: Optional[int] = None
+    ):
+        if m < 1 or dim % m:
+            raise ValueError(f'The dimension {dim} is not divisible by {m} sub-quantizers.')
+        if not 1 <= n_centroids <= 256:
+            raise ValueError('Codes are stored as uint8, so there can be at most 256 centroids.')
+        self.dim = dim
+        self.m = m
+        self.dsub = dim // m
+        self.n_centroids = n_centroids
+        self.iterations = iterations
+        self.seed = seed
+        self.codebooks: Optional[np.ndarray] = None
+        """codebooks: Centroids of every subspace, of shape (m, n_centroids, dim / m)."""
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    @property
+    def code_size(self) -> int:
+        """Number of bytes of an encoded vector."""
+        return self.m
+
+    def _subspaces(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.dim:
+            raise ValueError(f'Expected a 2-d array of vectors of dimension {self.dim}.')
+        return X.reshape(len(X), self.m, self.dsub)
+
+    def train(self, X):
+        """Run k-means in every subspace to learn the codebooks."""
+        subspaces = self._subspaces(X)
+        codebooks = np.empty((self.m, self.n_centroids, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            centroids, _ = kmeans(
+                subspaces[:, j],
+                self.n_centroids,
+                iterations=self.iterations,
+                seed=self.seed
+            )
+            codebooks[j, :len(centroids)] = centroids
+            # Fewer training points than centroids, repeat a centroid in the unused slots
+            codebooks[j, len(centroids):] = centroids[0]
+        self.codebooks = codebooks
+        return self
+
+    def encode(self, X) -> np.ndarray:
+        """Codes of a batch of vectors, of shape (n, m)."""
+        subspaces = self._subspaces(X)
+        codes = np.empty((len(subspaces), self.m), dtype=np.uint8)
+        for start in range(0, len(subspaces), self.ENCODE_BATCH_SIZE):
+            batch = subspaces[start:start + self.ENCODE_BATCH_SIZE]
+            for j in range(self.m):
+                codes[start:start + len(batch), j] = assign(
+                    np.ascontiguousarray(batch[:, j]), self.codebooks[j]
+                )
+        return codes
+
+    def decode(self, codes) -> np.ndarray:
+        """Approximate vectors of a batch of codes, of shape (n, dim)."""
+        codes = np.asarray(codes, dtype=np.intp)
+        return self.codebooks[np.arange(self.m), codes].reshape(len(codes), self.dim)
+
+    def distance_table(self, query) -> np.ndarray:
+        """Squared distances from every sub-vector of the query to every centroid, of shape (m, n_centroids)."""
+        query = np.asarray(query, dtype=np.float32).reshape(self.m, 1, self.dsub)
+        diff = self.codebooks - query
+        return np.einsum('mkd,mkd->mk', diff, diff)
+
+    def adc(self, table: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate squared distances from the query of `table` to a batch of codes."""
+        distances = np.zeros(len(codes), dtype=np.float32)
+        for j in range(self.m):
+            distances += table[j, codes[:, j]]
+        return distances
@@ -0,0 +1,83 @@
+import threading
+from contextlib import contextmanager
+
+class ReadWriteLock:
+    """
+    Lock held either by any number of readers at once, or by a single writer. Searches of an
+    index take the read side, so they run in parallel (numpy releases the GIL while scoring),
+    and only wait for the writes themselves, never for each other.
+
+    ## Fairness:
+    Writers are preferred: once a writer waits, new readers wait behind it, so a steady stream
+    of searches can't starve the writes. A thread already holding the lock can take either side
+    again, except a reader asking for the write side, which would wait for itself forever and
+    raises instead.
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        # Read holds of every thread, and the read holds of the current thread
+        self._readers = 0
+        self._local = threading.local()
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+
+    def _read_depth(self) -> int:
+        return getattr(self._local, 'depth', 0)
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        depth = self._read_depth()
+        with self._condition:
+            # A thread that holds the lock already doesn't wait, or it could wait for itself
+            if not depth and self._writer != me:
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+            self._readers += 1
+        self._local.depth = depth + 1
+
+    def release_read(self):
+        self._local.depth = self._read_depth() - 1
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if self._read_depth():
+                raise RuntimeError('A read lock can not be upgraded to a write lock.')
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer, self._writer_depth = me, 1
+
+    def release_write(self):
+        with self._condition:
+            self._writer_depth -= 1
+            if not self._writer_depth:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,96 @@
+from typing import Optional
+import numpy as np
+
+class ScalarQuantizer:
+    """
+    Scalar quantization codec, which stores every dimension of a vector on fewer bits:
+
+    - `float16`: half precision floats, 2 bytes per dimension. Needs no training.
+    - `int8`: one byte per dimension. Each dimension has its own `scale` and `offset`, learnt
+      from its range in the training vectors, and a value `x` is stored as the integer
+      `round((x - offset) / scale)` in [-128, 127]. Values outside the trained range are clipped.
+
+    ## Distances:
+    `distances` scores a query against the codes without decoding the whole matrix. Since a
+    decoded vector is `offset + scale * code`, its dot product with the query is
+    `offset · q + code · (scale * q)`: the scale is folded into the query once, and the codes
+    are only cast to float32 one block of `SCAN_BATCH_SIZE` rows at a time, into a buffer small
+    enough to stay in cache. `inner_products` returns these dot products, and `distances` turns
+    them into squared L2 distances with the squared norms of the decoded vectors, which are
+    computed at encoding time, see `norms`.
+    """
+    TYPES = ('float16', 'int8')
+    SCAN_BATCH_SIZE = 256
+    ENCODE_BATCH_SIZE = 65536
+
+    def __init__(self, qtype: str = 'int8'):
+        if qtype not in self.TYPES:
+            raise ValueError(f'Quantization `{qtype}` is not supported, use one of {", ".join(self.TYPES)}.')
+        self.qtype = qtype
+        self.dtype = np.dtype(np.float16 if qtype == 'float16' else np.int8)
+        self.scale: Optional[np.ndarray] = None
+        self.offset: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.qtype == 'float16' or self.scale is not None
+
+    def train(self, X):
+        """Learn the scale and offset of every dimension from its range in X."""
+        if self.qtype == 'float16':
+            return self
+        X = np.asarray(X, dtype=np.float32)
+        low, high = X.min(axis=0), X.max(axis=0)
+        scale = (high - low) / 255
+        # A constant dimension is stored exactly as its offset
+        scale[scale == 0] = 1
+        self.scale = scale
+        self.offset = low + 128 * scale
+        return self
+
+    def encode(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if self.qtype == 'float16':
+            return X.astype(np.float16)
+        codes = np.rint((X - self.offset) / self.scale)
+        return np.clip(codes, -128, 127, out=codes).astype(np.int8)
+
+    def decode(self, codes) -> np.ndarray:
+        decoded = np.asarray(codes).astype(np.float32)
+        if self.qtype == 'int8':
+            decoded *= self.scale
+            decoded += self.offset
+        return decoded
+
+    def norms(self, codes) -> np.ndarray:
+        """Squared L2 norms of the decoded vectors of a batch of codes."""
+        codes = np.asarray(codes)
+        if codes.ndim == 1:
+            codes = codes.reshape(1, -1)
+        norms = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), self.ENCODE_BATCH_SIZE):
+            block = self.decode(codes[start:start + self.ENCODE_BATCH_SIZE])
+            norms[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+        return norms
+
+    def inner_products(self, query, codes: np.ndarray) -> np.ndarray:
+        """Dot products of the query with the decoded vectors of the codes."""
+        query = np.asarray(query, dtype=np.float32)
+        if self.qtype == 'float16':
+            weights, base = query, 0.0
+        else:
+            weights, base = self.scale * query, float(self.offset @ query)
+        dots = np.empty(len(codes), dtype=np.float32)
+        buffer = np.empty((min(len(codes), self.SCAN_BATCH_SIZE), codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(codes), self.SCAN_BATCH_SIZE):
+            block = buffer[:len(codes[start:start + self.SCAN_BATCH_SIZE])]
+            np.copyto(block, codes[start:start + len(block)], casting='unsafe')
+            np.dot(block, weights, out=dots[start:start + len(block)])
+        dots += base
+        return dots
+
+    def distances(self, query, codes: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        """Squared L2 distances from the query to the decoded vectors of the codes."""
+        query = np.asarray(query, dtype=np.float32)
+        distances = norms - 2 * self.inner_products(query, codes) + query @ query
+        return np.maximum(distances, 0, out=distances)
@@ -1,4 +1,5 @@
 from .database import Database
 from .library import Library
 from .document import Document
-from .chunk import Chunk
\ No newline at end of file
+from .chunk import Chunk
+from .replica import Replica
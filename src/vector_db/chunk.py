@@ -4,22 +4,39 @@ from typing import Dict, Any
 class Chunk:
     """A chunk is a text segment of a document."""
     def __init__(
-        self, 
+        self,
         text: str,
         metadata: Dict[str, Any]
     ):
         self.id = str(uuid.uuid4())
         self.text = text
-        self.embedding = None
         self.metadata = metadata
-    
+        self._embedding = None
+        self._index = None
+
     def __repr__(self):
         return f"Chunk(id='{self.id}', text='{self.text[:20]}..', metadata={self.metadata})"
-    
+
+    @property
+    def embedding(self):
+        """The chunk's embedding. Once the chunk is added to a vector search index, the embedding
+        lives in the index's `EmbeddingStore` and this returns a zero-copy view of its row."""
+        if self._index is not None:
+            return self._index.get_embedding(self.id)
+        return self._embedding
+
+    @embedding.setter
+    def embedding(self, value):
+        if self._index is not None:
+            self._index.set_embedding(self.id, value)
+        else:
+            self._embedding = value
+
     def dict(self):
+        embedding = self.embedding
         return {
             "id": self.id,
             "text": self.text,
-            "embedding": self.embedding[: 5] if self.embedding else None,
+            "embedding": [float(x) for x in embedding[: 5]] if embedding is not None else None,
             "metadata": self.metadata
-        }
\ No newline at end of file
+        }
@@ -1,13 +1,35 @@
+import logging
+import os
 import threading
 import time
-from typing import List, Dict
+from typing import List, Dict, Optional
 from .library import Library
+from . import snapshot
+from .wal import WriteAheadLog
 from exceptions import DuplicateError
 from .index import SearchIndex, IndexTypes, CollectionsIndex
 
+logger = logging.getLogger(__name__)
+
 class Database:
     """ 
     The database is a collection of libraries.
+    
+    With a write-ahead log opened by `open_wal`, the libraries added, renamed and removed are
+    logged along with every write to the libraries, see `vector_db.wal`. `lsn` is the log
+    sequence number of the last library added or removed.
+    
+    ## Unloading cold libraries:
+    A database loaded with `lazy` only reads the settings of its libraries: each library is
+    loaded from the snapshot the first time its documents, chunks or index are used, so listing
+    the libraries or reading their metadata never reads their vectors. Once `start_eviction` is
+    called, the libraries unused for `idle_timeout` seconds, then the least recently used ones
+    until the rest fit in `memory_budget` bytes, are saved and unloaded again, see `evict`.
+    
+    ## Serving from several processes:
+    A single process, the coordinator, writes to the database and saves it to a snapshot once
+    it's written to, see `start_publishing`. The other processes only read it, from a `Replica`
+    of the snapshot which `reload`s every new version of it.
     """
     def __init__(self):
         self.__lock = threading.Lock()
@@ -15,6 +37,16 @@ class Database:
         self.library_name_index: CollectionsIndex = SearchIndex().initialize_index(
             index_type=IndexTypes.COLLECTIONS_INDEX
         )
+        self.wal: Optional[WriteAheadLog] = None
+        self.lsn = 0
+        # Directory of the last snapshot saved or loaded, where evicted libraries are saved
+        self.path: Optional[str] = None
+        self.idle_timeout: Optional[float] = None
+        self.memory_budget: Optional[int] = None
+        self.__eviction_thread: Optional[threading.Thread] = None
+        self.__publishing_thread: Optional[threading.Thread] = None
+        # Whether libraries were added, renamed or removed since the last save
+        self.__changed = True
         
     def get_libraries(self) -> List[Library]:
         return self.libraries
@@ -32,7 +64,8 @@ class Database:
         self, 
         library: Library
     ) -> Library:
-        
+        """Add a library to the database. With a write-ahead log, only the library's settings
+        are logged, so it should be added before its documents."""
         if library.name in self.library_name_index.index:
             raise DuplicateError(f'Library with name `{library.name}` already exists. Please use a different name.')
         
@@ -42,6 +75,10 @@ class Database:
                 id=library.name, 
                 value=len(self.libraries)-1
             )
+            lsn = self.__log('add_library', settings=library._settings())
+            library._set_wal(self.wal)
+            self.__changed = True
+        self.__sync(lsn)
         return library
     
     def update_library_name(
@@ -57,16 +94,15 @@ class Database:
         with self.__lock:
             # Get reference to the library
             library = self.libraries[self.library_name_index.search(previous_name)]
-            # Update name
-            library.name = new_name
+            # Update name, logged as a write of the library
+            lsn = library.rename(new_name)
             # Update library name index with new name
             self.library_name_index.index[new_name] = self.library_name_index.index[previous_name]
             # Remove previous name from index
-            self.library_name_index.remove(
-                id=previous_name,
-                iterable=self.libraries,
-                reindex_key='name'
-            )
+            del self.library_name_index.index[previous_name]
+            self.__changed = True
+        if lsn:
+            self.wal.sync(lsn)
         return library
     
     def remove_library(
@@ -78,9 +114,215 @@ class Database:
             raise KeyError(f'Library with name `{name}` does not exist.')
         
         with self.__lock:
-            del self.libraries[self.library_name_index.search(name)]
+            library = self.libraries[self.library_name_index.search(name)]
             self.library_name_index.remove(
                 id=name,
                 iterable=self.libraries,
                 reindex_key='name'
-            )
\ No newline at end of file
+            )
+            # Writes still in flight to the removed library aren't logged
+            library._set_wal(None)
+            lsn = self.__log('remove_library', library=name)
+            self.__changed = True
+        self.__sync(lsn)
+
+    def save(self, path: str) -> int:
+        """
+        Write a snapshot of every library to the directory `path`, see `vector_db.snapshot`.
+        Libraries can't be added or removed while saving, and each library's writes wait for
+        its own embeddings to be written. Returns the number of bytes of the library files
+        written, i.e. those of the libraries written to since they were last saved to `path`.
+        """
+        os.makedirs(path, exist_ok=True)
+        generation = snapshot.new_generation()
+        written = 0
+        with self.__lock:
+            # Every write logged up to here is in the libraries saved below
+            lsn = self.wal.lsn if self.wal else self.lsn
+            self.__changed = False
+            entries = []
+            for i, library in enumerate(self.libraries):
+                previous = library._segment
+                entry = library.save(path, prefix=f'{generation}-{i}')
+                # Files saved again are written under the new generation's names
+                if previous is None or previous[1] != path or previous[0]['segment'] != entry['segment']:
+                    written += snapshot.files_nbytes(path, entry)
+                entries.append(entry)
+            snapshot.write_manifest(path, entries, lsn=lsn)
+            if self.wal:
+                self.wal.truncate(lsn)
+            self.path = path
+        return written
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the database was written to since it was last saved, see `save`."""
+        return self.__changed or any(library.dirty for library in self.libraries)
+
+    @classmethod
+    def load(cls, path: str, lazy: bool = False) -> 'Database':
+        """Restore the database from the snapshot in the directory `path`, or an empty database
+        if there's no snapshot there yet. With `lazy`, every library is restored unloaded, and
+        loaded the first time it's used."""
+        return cls().reload(path, lazy=lazy)
+
+    def reload(self, path: str, lazy: bool = False) -> 'Database':
+        """
+        Restore the snapshot in the directory `path` as a new database, e.g. a new version of
+        the snapshot this database was loaded from, saved by another process since. The loaded
+        libraries whose embeddings are the same in both are shared with this database rather
+        than loaded again, so only the libraries written to since are. This database isn't
+        changed: searches still running on it finish on the previous version.
+        """
+        unchanged = {
+            (library.name, library._segment[0]['vectors']): library
+            for library in self.libraries
+            if library.loaded and not library.dirty and library._segment is not None
+            and library._segment[1] == path and library._segment[0]['vectors']
+        }
+        db = type(self)()
+        db.path = path
+        manifest = snapshot.read_manifest(path)
+        if manifest is None:
+            return db
+        for entry in manifest['libraries']:
+            library = unchanged.get((entry['name'], entry['vectors']))
+            db.add_library(library if library is not None else Library.load(entry, path, lazy=lazy))
+        db.lsn = manifest.get('lsn', 0)
+        db.__changed = False
+        return db
+
+    def evict(self) -> List[str]:
+        """
+        Unload the libraries unused for more than `idle_timeout` seconds, then the least recently
+        used libraries until the loaded ones hold at most `memory_budget` bytes of embeddings.
+        The most recently used library is never unloaded to fit the budget. The libraries are
+        saved to the snapshot at `path` first, which only writes those written to since the last
+        save. Returns the names of the libraries unloaded.
+        """
+        if self.path is None:
+            raise ValueError('Libraries can only be unloaded once the database is saved to, or loaded from, a snapshot.')
+        now = time.monotonic()
+        loaded = sorted(
+            (library for library in self.libraries if library.loaded),
+            key=lambda library: library.last_access
+        )
+        victims = []
+        if self.idle_timeout is not None:
+            victims = [library for library in loaded if now - library.last_access > self.idle_timeout]
+            loaded = loaded[len(victims):]
+        if self.memory_budget is not None:
+            nbytes = sum(library.nbytes for library in loaded)
+            while nbytes > self.memory_budget and len(loaded) > 1:
+                library = loaded.pop(0)
+                nbytes -= library.nbytes
+                victims.append(library)
+        if not victims:
+            return []
+        self.save(self.path)
+        # Libraries written to, or used, since the save stay loaded. Unloading waits for any
+        # other save, which may be reading them.
+        with self.__lock:
+            return [library.name for library in victims if library.unload()]
+
+    def start_eviction(
+        self,
+        idle_timeout: Optional[float] = None,
+        memory_budget: Optional[int] = None,
+        interval: float = 10.0
+    ):
+        """Call `evict` every `interval` seconds in the background, with the given idle timeout
+        and memory budget. A failed eviction is logged, and tried again at the next interval."""
+        self.idle_timeout = idle_timeout
+        self.memory_budget = memory_budget
+        if self.__eviction_thread is not None:
+            return
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.evict()
+                except Exception:
+                    logger.exception('Evicting the idle libraries failed.')
+        self.__eviction_thread = threading.Thread(target=run, daemon=True)
+        self.__eviction_thread.start()
+
+    def start_publishing(self, interval: float = 1.0, write_rate: float = 64 * 2**20):
+        """
+        Save the database to the snapshot at `path` every `interval` seconds in the background,
+        if it was written to since the last save, so that the processes reading the snapshot
+        with a `Replica` pick up the writes. A failed save is logged, and tried again at the
+        next interval.
+
+        Only the libraries written to are saved again, but each of them is saved whole: a
+        single chunk written to a library rewrites its segment, all of its embeddings and their
+        norms, and every replica maps the new files again. So that a steady trickle of writes
+        to a large library doesn't rewrite it every `interval`, the next save waits until the
+        bytes written by the last one, at `write_rate` bytes per second, are paid for: after
+        writing a library of 1 GB, the default 64 MB per second publishes it again in 16 seconds
+        at the earliest.
+        """
+        if self.path is None:
+            raise ValueError('The database can only be published once it\'s saved to, or loaded from, a snapshot.')
+        if self.__publishing_thread is not None:
+            return
+        def run():
+            wait = interval
+            while True:
+                time.sleep(wait)
+                wait = interval
+                try:
+                    if self.dirty:
+                        wait = max(interval, self.save(self.path) / write_rate)
+                except Exception:
+                    logger.exception('Publishing the database to `%s` failed.', self.path)
+        self.__publishing_thread = threading.Thread(target=run, daemon=True)
+        self.__publishing_thread.start()
+
+    def open_wal(self, path: str, commit_delay: float = 0.0):
+        """
+        Replay the writes logged to the write-ahead log at `path` that the database doesn't
+        hold yet, e.g. those made since the snapshot it was loaded from, then log every write
+        to it from now on. The replay never calls the embedding providers: the embeddings are
+        read back from the log.
+        """
+        wal = WriteAheadLog(path, commit_delay=commit_delay)
+        for record, vectors in wal.records():
+            self.__replay(record, vectors)
+        with self.__lock:
+            # New writes must come after everything the snapshot and the log hold
+            wal.lsn = max([wal.lsn, self.lsn] + [library.lsn for library in self.libraries])
+            self.wal = wal
+            for library in self.libraries:
+                library._set_wal(wal)
+
+    def __replay(self, record: Dict, vectors):
+        op, lsn = record['op'], record['lsn']
+        if op in ('add_library', 'remove_library'):
+            # Skip the writes the database already holds
+            if lsn <= self.lsn:
+                return
+            if op == 'add_library':
+                self.add_library(Library._from_settings(record['settings']))
+            else:
+                self.remove_library(record['library'])
+            self.lsn = lsn
+            return
+        library = self.get_library(record['library'])
+        if lsn <= library.lsn:
+            return
+        if op == 'rename':
+            self.update_library_name(previous_name=record['library'], new_name=record['new_name'])
+            library.lsn = lsn
+        else:
+            library._replay(record, vectors)
+
+    def __log(self, op: str, **args) -> int:
+        if self.wal is None:
+            return 0
+        self.lsn = self.wal.append({'op': op, **args})
+        return self.lsn
+
+    def __sync(self, lsn: int):
+        if lsn:
+            self.wal.sync(lsn)
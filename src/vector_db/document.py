@@ -3,7 +3,6 @@ from typing import List, Dict, Any
 from .chunk import Chunk
 
 from exceptions import DuplicateError
-from utils.embed import embed
 from .index import (
     SearchIndex, 
     IndexTypes, 
@@ -54,19 +53,24 @@ class Document:
     )-> Chunk:
         chunk_index = self.__chunk_id_index.search(chunk_id)
         chunk = self.chunks[chunk_index]
+        # The embedding is owned by the library's vector search index, which re-embeds the text
         chunk.text = text
-        if chunk.embedding:
-            chunk.embedding = embed([chunk.text])[0]
         return chunk
             
     def _remove_chunk(self, chunk_id: str):
-        chunk_index = self.__chunk_id_index.search(chunk_id)
-        del self.chunks[chunk_index]
+        # Swaps the last chunk into the removed chunk's slot
         self.__chunk_id_index.remove(
             id=chunk_id,
             iterable=self.chunks,
             reindex_key='id'
         )
+        
+    def _remove_chunks(self, chunk_ids: List[str]):
+        self.__chunk_id_index.remove_many(
+            ids=chunk_ids,
+            iterable=self.chunks,
+            reindex_key='id'
+        )
     
     def get_chunks(self):
         return self.chunks
@@ -1,16 +1,28 @@
 from .base import BaseIndex, BaseVectorSearchIndex
 from .flatl2 import FlatL2Index
 from .lsh import LSHIndex
+from .hnsw import HNSWIndex
+from .ivf import IVFIndex
+from .pq import PQIndex
 from .collections_index import CollectionsIndex
+from .metadata_index import MetadataIndex
 from .types import IndexTypes
 
 class SearchIndex:
     
-    def initialize_index(self, index_type: IndexTypes) -> BaseIndex:
+    def initialize_index(self, index_type: IndexTypes, **kwargs) -> BaseIndex:
+        """Create an index. Keyword arguments, e.g. the `embedding_provider`, are passed on to
+        the vector search indexes."""
         if index_type == IndexTypes.FLATL2:
-            return FlatL2Index()
+            return FlatL2Index(**kwargs)
         elif index_type == IndexTypes.LSH:
-            return LSHIndex()
+            return LSHIndex(**kwargs)
+        elif index_type == IndexTypes.HNSW:
+            return HNSWIndex(**kwargs)
+        elif index_type == IndexTypes.IVF:
+            return IVFIndex(**kwargs)
+        elif index_type == IndexTypes.PQ:
+            return PQIndex(**kwargs)
         elif index_type == IndexTypes.COLLECTIONS_INDEX:
             return CollectionsIndex()
         else:
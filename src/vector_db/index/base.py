@@ -1,28 +1,455 @@
-from typing import List
+import math
+import threading
+from itertools import islice
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+from utils.embed import EmbeddingProvider, get_provider
+from utils.knn import KNearNeighbors, normalize
+from utils.rwlock import ReadWriteLock
 from ..chunk import Chunk
+from .embedding_store import EmbeddingStore
 
 class BaseIndex:
     def __init__(self):
         pass
-    
+
     def add(self):
         pass
-    
+
     def update(self):
         pass
-    
+
     def remove(self):
         pass
-    
+
     def search(self):
         pass
-    
+
     def build_index(self):
         pass
-    
+
 class BaseVectorSearchIndex(BaseIndex):
-    def __init__(self):
+    """
+    Base class for the vector search indexes. It keeps the indexed chunks, and their embeddings
+    in an `EmbeddingStore`, aligned row by row: the chunk at `self.chunks[i]` has its embedding
+    at row `i` of `self.embeddings`. `self.chunks_index` maps a chunk id to that row.
+
+    ## Delta segment:
+    Chunks whose insertion into the index's own structure is expensive, e.g. into an HNSW graph,
+    or not possible yet, e.g. before an IVF index has centroids, are only appended to the store
+    and kept in `self.delta`. A search scores the delta exactly and merges it with the results
+    of the main structure, so every chunk is searchable as soon as it's added. Once the delta
+    holds `delta_threshold` chunks, a background thread merges it into the main structure,
+    `merge_batch_size` chunks at a time, and `build_index` merges whatever is left.
+
+    Subclasses implement `_search_index`, the search of the main structure, and `_merge`, which
+    moves chunks from the delta into it. Searches hold the read side of `self._lock`, a
+    `ReadWriteLock`, and run concurrently; writes hold its write side. Subclasses keep their
+    searches free of writes to shared state, and do the long part of a rebuild, e.g. training
+    centroids, outside the lock, only holding it to swap the result in.
+
+    ## Metrics:
+    Chunks are ranked by the `metric` of the index: `l2`, the Euclidean distance, `dot`, the dot
+    product, or `cosine`, the cosine similarity. With `cosine`, the embeddings are normalized
+    once when they're written to the store and the queries when they're searched, so ranking
+    is a dot product and, for unit vectors, the same as ranking by `l2`. Indexes whose
+    structure relies on Euclidean geometry only support the metrics in their `METRICS`.
+
+    ## Filtering:
+    The metadata of the chunks is indexed in a `MetadataIndex`, and a search can be given a
+    filter expression over it. If the filter matches at most `prefilter_ratio` of the chunks,
+    only the matching chunks are scored, exactly. Otherwise the index is searched for more than
+    k chunks, doubling until k of them match the filter, and the others are dropped.
+    """
+    METRICS = ('l2', 'cosine', 'dot')
+
+    def __init__(
+        self,
+        embedding_provider: EmbeddingProvider = None,
+        metric: str = 'l2',
+        delta_threshold: int = 1024,
+        merge_batch_size: int = 256,
+        background_merge: bool = True
+    ):
+        if metric not in self.METRICS:
+            raise ValueError(f'The {type(self).__name__} does not support the `{metric}` metric, use one of {", ".join(self.METRICS)}.')
+        self.metric = metric
+        # Imported here since the CollectionsIndex and MetadataIndex themselves subclass BaseIndex
+        from .collections_index import CollectionsIndex
+        from .metadata_index import MetadataIndex
+        self.embedding_provider = embedding_provider or get_provider()
         self.chunks: List[Chunk] = []
-        
+        self.chunks_index = CollectionsIndex()
+        self.metadata_index = MetadataIndex()
+        # Largest share of the chunks a filter can match to be searched by scoring only its matches
+        self.prefilter_ratio = 0.1
+        self.embeddings = EmbeddingStore()
+        self.embed_batch_size = self.embedding_provider.batch_size
+        # Ids of the chunks that are in the store but not in the main structure, in insertion order
+        self.delta: Dict[str, None] = {}
+        self.delta_threshold = delta_threshold
+        self.merge_batch_size = merge_batch_size
+        self.background_merge = background_merge
+        self._lock = ReadWriteLock()
+        self._merge_thread: Optional[threading.Thread] = None
+
     def get_chunks(self):
-        return self.chunks
\ No newline at end of file
+        return self.chunks
+
+    def get_embedding(self, chunk_id: str) -> np.ndarray:
+        """Zero-copy view of a chunk's embedding."""
+        return self.embeddings.get(self.chunks_index.search(chunk_id))
+
+    def set_embedding(self, chunk_id: str, embedding):
+        """Overwrite a chunk's embedding in place."""
+        self.embeddings.set(self.chunks_index.search(chunk_id), self._normalized(embedding))
+
+    def _normalized(self, vector):
+        """A vector, or a batch of vectors, as stored and searched: scaled to unit norm with the
+        cosine metric."""
+        return normalize(vector) if self.metric == 'cosine' else vector
+
+    def _knn(self) -> KNearNeighbors:
+        """An exact nearest neighbors engine with the metric of the index."""
+        return KNearNeighbors(metric=self.metric)
+
+    def embed_chunks(self, chunks: List[Chunk]):
+        """
+        Embed the chunks that don't have an embedding yet, `embed_batch_size` texts per
+        request, and write the embeddings back to the chunks.
+        """
+        pending = [chunk for chunk in chunks if chunk.embedding is None]
+        embeddings = self.embedding_provider.embed_in_batches(
+            [chunk.text for chunk in pending],
+            batch_size=self.embed_batch_size
+        )
+        for chunk, embedding in zip(pending, embeddings):
+            chunk.embedding = embedding
+
+    def embed_text(self, text: str) -> List[float]:
+        """Embed the new text of a chunk."""
+        return self.embedding_provider.embed([text], input_type="search_document")[0]
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embed the new texts of chunks, `embed_batch_size` per request."""
+        return self.embedding_provider.embed_in_batches(texts, batch_size=self.embed_batch_size)
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a search query."""
+        return self.embedding_provider.embed([query], input_type="search_query")[0]
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed search queries, `embed_batch_size` per request."""
+        embeddings = self.embedding_provider.embed_in_batches(
+            queries,
+            input_type="search_query",
+            batch_size=self.embed_batch_size
+        )
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(queries), -1)
+
+    def _add_chunk(self, chunk: Chunk) -> int:
+        """Append a chunk and its embedding, and hand the ownership of the embedding to the store."""
+        row = self.embeddings.append(self._normalized(chunk.embedding))
+        self.chunks.append(chunk)
+        self.chunks_index.add(id=chunk.id, value=row)
+        self.metadata_index.add(id=chunk.id, metadata=chunk.metadata)
+        chunk._embedding = None
+        chunk._index = self
+        return row
+
+    def _remove_chunk(self, chunk_id: str) -> Chunk:
+        """
+        Remove a chunk by swapping the last chunk (and its embedding) into its row. This is O(1);
+        only the moved chunk needs its row fixed in `self.chunks_index`. The removed chunk gets
+        a copy of its embedding back, since it no longer lives in the store, and leaves the delta.
+        """
+        row = self.chunks_index.search(chunk_id)
+        chunk = self.chunks[row]
+        self.delta.pop(chunk_id, None)
+        self.metadata_index.remove(id=chunk_id, metadata=chunk.metadata)
+        chunk._embedding = self.embeddings.get(row).copy()
+        chunk._index = None
+        moved = self.embeddings.remove(row)
+        last_chunk = self.chunks.pop()
+        if moved is not None:
+            self.chunks[row] = last_chunk
+            self.chunks_index.add(id=last_chunk.id, value=row)
+        del self.chunks_index.index[chunk_id]
+        return chunk
+
+    def load(self, chunks: List[Chunk], embeddings: np.ndarray, norms: Optional[np.ndarray] = None):
+        """
+        Index chunks along with their embeddings as stored, e.g. memory-mapped from a snapshot by
+        `Database.load`: already normalized, and never sent to the embedding provider again.
+        `embeddings[i]` is the embedding of `chunks[i]`, and backs the store without being copied
+        (see `EmbeddingStore.attach`). Only an empty index can be loaded.
+        """
+        with self._lock.write():
+            if self.chunks:
+                raise ValueError('Only an empty index can be loaded.')
+            self.embeddings.attach(embeddings, norms=norms)
+            for row, chunk in enumerate(chunks):
+                self.chunks.append(chunk)
+                self.chunks_index.add(id=chunk.id, value=row)
+                self.metadata_index.add(id=chunk.id, metadata=chunk.metadata)
+                chunk._embedding = None
+                chunk._index = self
+            self._load(range(len(chunks)))
+
+    def _load(self, rows: range):
+        """Insert the loaded rows into the main structure. By default they go to the delta, and
+        are searched exactly until they're merged."""
+        self._add_to_delta([self.chunks[row].id for row in rows])
+
+    def remove_many(self, chunk_ids: List[str]):
+        """Remove chunks with a single acquisition of the lock. Every removal is O(1)."""
+        with self._lock.write():
+            for chunk_id in chunk_ids:
+                self.remove(chunk_id)
+
+    def update_many(self, texts: Dict[str, str], embeddings=None):
+        """
+        Update the text of many chunks. The texts are embedded `embed_batch_size` at a time,
+        unless their `embeddings` are given in the same order, e.g. replayed from the
+        write-ahead log, and the embeddings are written with a single acquisition of the lock.
+        """
+        chunk_ids = list(texts)
+        if embeddings is None:
+            embeddings = self.embed_texts([texts[chunk_id] for chunk_id in chunk_ids])
+        with self._lock.write():
+            for chunk_id, embedding in zip(chunk_ids, embeddings):
+                self.chunks[self.chunks_index.search(chunk_id)].text = texts[chunk_id]
+                self.set_embedding(chunk_id, embedding)
+
+    def _add_to_delta(self, chunk_ids: List[str]):
+        """Keep chunks out of the main structure for now, and merge them in the background once
+        the delta is large enough."""
+        self.delta.update(dict.fromkeys(chunk_ids))
+        if self.background_merge and len(self.delta) >= self.delta_threshold:
+            self.__start_merge()
+
+    def __start_merge(self):
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return
+        self._merge_thread = threading.Thread(target=self.merge, daemon=True)
+        self._merge_thread.start()
+
+    def wait_for_merge(self):
+        """Block until the background merge, if any, is done."""
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    def merge(self):
+        """
+        Merge the delta into the main structure, one batch at a time. The lock is released
+        between batches, so searches and writes are never blocked for more than one batch.
+        """
+        while True:
+            with self._lock.write():
+                if not self.delta:
+                    return
+                batch = list(islice(self.delta, self.merge_batch_size))
+                self._merge(batch)
+                for chunk_id in batch:
+                    self.delta.pop(chunk_id, None)
+
+    def _merge(self, chunk_ids: List[str]):
+        """Insert chunks of the delta into the main structure."""
+        raise NotImplementedError
+
+    def _search_index(self, query_embedding: np.ndarray, k: int, max_distance: Optional[float] = None) -> List[int]:
+        """Rows of the k nearest chunks in the main structure, closest first. Indexes that compute
+        exact distances can drop the chunks farther than `max_distance` while selecting them; any
+        left over are dropped by the caller."""
+        raise NotImplementedError
+
+    def _search_index_many(self, query_embeddings: np.ndarray, k: int, max_distance: Optional[float] = None) -> List[List[int]]:
+        """Rows of the k nearest chunks in the main structure for every query. Indexes that can
+        score many queries at once, e.g. with one matrix product, override this."""
+        return [
+            self._search_index(query_embedding, k, max_distance)
+            for query_embedding in query_embeddings
+        ]
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        max_distance: Optional[float] = None,
+        min_score: Optional[float] = None
+    ) -> List[Tuple[Chunk, float]]:
+        """
+        The k nearest chunks to the query, with their scores, among the chunks matching the
+        `filter` expression if one is given (see `MetadataIndex`).
+
+        The score is the Euclidean distance with the `l2` metric, lower is closer, and the
+        cosine similarity or the dot product with the `cosine` and `dot` metrics, higher is
+        closer. Chunks farther than `max_distance` (`l2`), or scoring less than `min_score`
+        (`cosine` and `dot`), are left out, so fewer than k chunks may be returned.
+        """
+        # embed the query
+        query_embedding = self._normalized(np.asarray(self.embed_query(query), dtype=np.float32))
+        return self._search_embeddings(
+            query_embedding.reshape(1, -1), k, filter, self._max_distance(max_distance, min_score)
+        )[0]
+
+    def search_many(
+        self,
+        queries: List[str],
+        k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        max_distance: Optional[float] = None,
+        min_score: Optional[float] = None
+    ) -> List[List[Tuple[Chunk, float]]]:
+        """The k nearest chunks to every query, see `search`. The queries are embedded together,
+        and scored together by the indexes that override `_search_index_many`."""
+        return self._search_embeddings(
+            self._normalized(self.embed_queries(queries)), k, filter, self._max_distance(max_distance, min_score)
+        )
+
+    def search_by_vector(
+        self,
+        vector,
+        k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        max_distance: Optional[float] = None,
+        min_score: Optional[float] = None
+    ) -> List[Tuple[Chunk, float]]:
+        """The k nearest chunks to a query vector, see `search`, without calling the embedding provider."""
+        query_embedding = np.asarray(vector, dtype=np.float32)
+        if query_embedding.shape != (self.embedding_provider.dim,):
+            raise ValueError(f'Expected a vector of dimension {self.embedding_provider.dim}, got shape {query_embedding.shape}.')
+        query_embedding = self._normalized(query_embedding)
+        return self._search_embeddings(
+            query_embedding.reshape(1, -1), k, filter, self._max_distance(max_distance, min_score)
+        )[0]
+
+    def search_many_by_vector(
+        self,
+        vectors,
+        k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        max_distance: Optional[float] = None,
+        min_score: Optional[float] = None
+    ) -> List[List[Tuple[Chunk, float]]]:
+        """The k nearest chunks to every query vector, see `search_many`, without calling the embedding provider."""
+        query_embeddings = np.asarray(vectors, dtype=np.float32)
+        if query_embeddings.ndim != 2 or query_embeddings.shape[1] != self.embedding_provider.dim:
+            raise ValueError(f'Expected vectors of dimension {self.embedding_provider.dim}, got shape {query_embeddings.shape}.')
+        return self._search_embeddings(
+            self._normalized(query_embeddings), k, filter, self._max_distance(max_distance, min_score)
+        )
+
+    def search_by_chunk(
+        self,
+        chunk_id: str,
+        k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        max_distance: Optional[float] = None,
+        min_score: Optional[float] = None
+    ) -> List[Tuple[Chunk, float]]:
+        """
+        The k nearest chunks to an indexed chunk, see `search`, the chunk itself excluded. The
+        query is a zero-copy view of the chunk's row in the store, already normalized with the
+        cosine metric, so the read lock is held for the whole search to keep the row from being
+        overwritten or moved.
+        """
+        max_distance = self._max_distance(max_distance, min_score)
+        with self._lock.read():
+            row = self.chunks_index.search(chunk_id)
+            if row is None:
+                raise KeyError(f'Chunk with id `{chunk_id}` not found.')
+            query_embedding = self.embeddings.get(row).reshape(1, -1)
+            results = self._search_embeddings(query_embedding, k + 1, filter, max_distance)[0]
+        return [(chunk, score) for chunk, score in results if chunk.id != chunk_id][:k]
+
+    def _max_distance(self, max_distance: Optional[float], min_score: Optional[float]) -> Optional[float]:
+        """The threshold of a search as a distance of the `KNearNeighbors` of the index."""
+        if self.metric == 'l2':
+            if min_score is not None:
+                raise ValueError('Scores of the `l2` metric are distances, use `max_distance` instead of `min_score`.')
+            return max_distance
+        if max_distance is not None:
+            raise ValueError(f'Scores of the `{self.metric}` metric are similarities, use `min_score` instead of `max_distance`.')
+        # Distances are negated dot products
+        return -min_score if min_score is not None else None
+
+    def _search_embeddings(
+        self,
+        query_embeddings: np.ndarray,
+        k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        max_distance: Optional[float] = None
+    ) -> List[List[Tuple[Chunk, float]]]:
+        with self._lock.read():
+            if filter is None:
+                rows = self.__search_rows(query_embeddings, k, max_distance)
+            else:
+                chunk_ids = self.metadata_index.select(filter)
+                rows = [
+                    self.__search_filtered(query_embedding, k, chunk_ids, max_distance)
+                    for query_embedding in query_embeddings
+                ]
+            return [
+                self.__scored(query_embedding, query_rows, max_distance)
+                for query_embedding, query_rows in zip(query_embeddings, rows)
+            ]
+
+    def __scored(self, query_embedding: np.ndarray, rows: List[int], max_distance: Optional[float]) -> List[Tuple[Chunk, float]]:
+        """The chunks of the result rows with their exact scores, within `max_distance`, closest
+        first. The rows are sorted again since indexes ranking them by approximate distances,
+        e.g. those of quantized codes without re-ranking, return them out of exact order."""
+        if not rows:
+            return []
+        distances = self._knn().fit(self.embeddings.matrix[rows]).compute_distance(query_embedding)
+        scores = distances if self.metric == 'l2' else -distances
+        return [
+            (self.chunks[rows[i]], float(scores[i]))
+            for i in np.argsort(distances, kind='stable').tolist()
+            if max_distance is None or distances[i] <= max_distance
+        ]
+
+    def __search_rows(self, query_embeddings: np.ndarray, k: int, max_distance: Optional[float] = None) -> List[List[int]]:
+        rows = [[] for _ in range(len(query_embeddings))]
+        if len(self.delta) < len(self.chunks):
+            rows = self._search_index_many(query_embeddings, k, max_distance)
+        if self.delta:
+            rows = [
+                self.__merge_delta(query_embedding, query_rows, k, max_distance)
+                for query_embedding, query_rows in zip(query_embeddings, rows)
+            ]
+        return rows
+
+    def __search_filtered(
+        self,
+        query_embedding: np.ndarray,
+        k: int,
+        chunk_ids: Set[str],
+        max_distance: Optional[float] = None
+    ) -> List[int]:
+        """The k nearest chunks among the given chunks, the ones matching a filter."""
+        if len(chunk_ids) > self.prefilter_ratio * len(self.chunks):
+            # Broad filter, search the index for enough chunks that k of them are likely to match
+            fetch = k * math.ceil(len(self.chunks) / len(chunk_ids))
+            while fetch < len(self.chunks):
+                candidates = self.__search_rows(query_embedding.reshape(1, -1), fetch, max_distance)[0]
+                rows = [row for row in candidates if self.chunks[row].id in chunk_ids]
+                # Fewer candidates than fetched means none are left within the threshold
+                if len(rows) >= k or len(candidates) < fetch and max_distance is not None:
+                    return rows[:k]
+                fetch *= 2
+        # Selective filter, or the index couldn't find k matches: score only the matching chunks
+        rows = [self.chunks_index.search(chunk_id) for chunk_id in chunk_ids]
+        return self.__exact_search(query_embedding, rows, k, max_distance)
+
+    def __merge_delta(self, query_embedding: np.ndarray, rows: List[int], k: int, max_distance: Optional[float] = None) -> List[int]:
+        """Score the delta exactly along with the results of the main structure."""
+        candidates = list(rows) + [self.chunks_index.search(chunk_id) for chunk_id in self.delta]
+        return self.__exact_search(query_embedding, candidates, k, max_distance)
+
+    def __exact_search(self, query_embedding: np.ndarray, rows: List[int], k: int, max_distance: Optional[float] = None) -> List[int]:
+        """The k nearest of the given rows, by their exact distance to the query."""
+        knn_engine = self._knn().fit(self.embeddings.matrix[rows])
+        return [rows[i] for i in knn_engine.predict(query_embedding, k, max_distance)]
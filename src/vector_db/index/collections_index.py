@@ -1,4 +1,4 @@
-from typing import Dict, List, Union
+from typing import Any, Dict, Iterable, List, Optional, Union
 from .base import BaseIndex
 
 class CollectionsIndex(BaseIndex):
@@ -18,9 +18,9 @@ class CollectionsIndex(BaseIndex):
     The search operation is also an O(1) operation since the accessing a hashmap is an O(1) operation.
     
     ## Removing:
-    The remove operation however would mean that we need to recompute the index once an object is evited from the list.
-    This is an O(n) operation. But we are okay with this since the main objective of the retrieval system is to provide
-    fast retrieval/search for the user.
+    Removing an object swaps the last object of the list into its slot and pops the list, so only the
+    moved object needs its index fixed. This is an O(1) operation, and `remove_many` removes k objects
+    in O(k). The catch is that the list doesn't keep the insertion order of its objects.
     
     Index: dict of {
         key(some identifier, id): value(index in the list)
@@ -39,13 +39,24 @@ class CollectionsIndex(BaseIndex):
     def add(self, id: str, value: int):
         self.index[id] = value
     
-    def remove(self, id: str, iterable: List, reindex_key: str):
-        del self.index[id]
-        # Recompute index
-        self.index = self.build_index(
-            iterable=iterable,
-            key=reindex_key
-        )
+    def remove(self, id: str, iterable: List, reindex_key: str) -> Optional[Any]:
+        """
+        Remove an object from the list by swapping the last object into its slot, and fix the
+        moved object's index with its `reindex_key` attribute. Returns the moved object, if any,
+        so other indexes over the same list can be fixed as well.
+        """
+        position = self.index.pop(id)
+        last = iterable.pop()
+        if position == len(iterable):
+            return None
+        iterable[position] = last
+        self.index[getattr(last, reindex_key)] = position
+        return last
+    
+    def remove_many(self, ids: Iterable[str], iterable: List, reindex_key: str):
+        """Remove k objects from the list in O(k)."""
+        for id in ids:
+            self.remove(id=id, iterable=iterable, reindex_key=reindex_key)
     
     def build_index(
         self,
@@ -0,0 +1,278 @@
+import tempfile
+from typing import Iterable, Optional, Union
+import numpy as np
+
+class EmbeddingStore:
+    """
+    A contiguous, growable store of fixed size vectors, shared by the vector search indexes.
+
+    Vectors are packed row by row in a single preallocated NumPy buffer. A python list of lists
+    holding a 1024 dim embedding costs a pointer plus a boxed float per dimension, whereas a row in
+    the store costs exactly 4 bytes per dimension for float32.
+
+    ## Appending:
+    Appending writes into the next free row. When the buffer is full, it is reallocated with
+    `growth_factor` times the capacity, so appends are amortized O(1).
+
+    ## Removing:
+    Removing a row copies the last row into the freed slot (swap-with-last), which is O(1) but
+    means the last row changes position. `remove` returns the old position of the row that moved
+    so that callers can fix up whatever they keep aligned with the rows.
+
+    ## Reading:
+    `get` and `matrix` return views into the buffer, not copies. A view is only valid until the
+    next write that grows the buffer or moves rows around.
+
+    The squared L2 norm of every row is tracked alongside the buffer, which lets the distance
+    engine skip recomputing them on every query. Writes take the norms as an argument when they
+    aren't those of the stored values, e.g. for quantized codes that stand for other vectors.
+    """
+    def __init__(
+        self,
+        dim: Optional[int] = None,
+        capacity: int = 16,
+        dtype: Union[str, np.dtype] = np.float32,
+        growth_factor: float = 2.0,
+        track_norms: bool = True
+    ):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.growth_factor = growth_factor
+        self.track_norms = track_norms
+        self.size = 0
+        self._initial_capacity = max(1, capacity)
+        self._buffer: Optional[np.ndarray] = None
+        self._norms: Optional[np.ndarray] = None
+        if dim is not None:
+            self._allocate(self._initial_capacity)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._buffer is None else len(self._buffer)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Zero-copy view of the stored vectors, one per row."""
+        if self._buffer is None:
+            return np.empty((0, self.dim or 0), dtype=self.dtype)
+        return self._buffer[:self.size]
+
+    @property
+    def norms(self) -> np.ndarray:
+        """Zero-copy view of the squared L2 norm of every stored vector."""
+        if self._norms is None:
+            return np.empty(0, dtype=np.float32)
+        return self._norms[:self.size]
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes held by the store, including unused capacity."""
+        nbytes = 0 if self._buffer is None else self._buffer.nbytes
+        if self._norms is not None:
+            nbytes += self._norms.nbytes
+        return nbytes
+
+    def get(self, row: int) -> np.ndarray:
+        """Zero-copy view of a single row."""
+        self._check_row(row)
+        return self._buffer[row]
+
+    def append(self, vector: Iterable[float]) -> int:
+        """Append a vector and return its row."""
+        vector = self._as_row(vector)
+        self._reserve(self.size + 1)
+        row = self.size
+        self._write(row, vector)
+        self.size += 1
+        return row
+
+    def extend(self, vectors, norms=None) -> range:
+        """Append many vectors in a single copy and return their rows."""
+        vectors = np.asarray(vectors, dtype=self.dtype)
+        if vectors.ndim != 2:
+            raise ValueError('Expected a 2-d array of vectors.')
+        if len(vectors) == 0:
+            return range(self.size, self.size)
+        self._set_dim(vectors.shape[1])
+        self._reserve(self.size + len(vectors))
+        start, end = self.size, self.size + len(vectors)
+        self._buffer[start:end] = vectors
+        if self.track_norms:
+            if norms is None:
+                block = self._buffer[start:end].astype(np.float32, copy=False)
+                norms = np.einsum('ij,ij->i', block, block)
+            self._norms[start:end] = norms
+        self.size = end
+        return range(start, end)
+
+    def set(self, row: int, vector: Iterable[float], norm: Optional[float] = None):
+        """Overwrite a row in place."""
+        self._check_row(row)
+        self._write(row, self._as_row(vector), norm)
+
+    def remove(self, row: int) -> Optional[int]:
+        """
+        Remove a row by moving the last row into its place. Returns the previous position of
+        the row that was moved, or None if the removed row was the last one.
+        """
+        self._check_row(row)
+        last = self.size - 1
+        moved = None
+        if row != last:
+            self._buffer[row] = self._buffer[last]
+            if self.track_norms:
+                self._norms[row] = self._norms[last]
+            moved = last
+        self.size -= 1
+        return moved
+
+    def clear(self):
+        self.size = 0
+
+    def attach(self, vectors: np.ndarray, norms: Optional[np.ndarray] = None):
+        """
+        Replace the stored vectors with an existing 2-d array, e.g. a memory-mapped file, without
+        copying it. Rows are only read, and paged in, when they're searched; the first write that
+        grows the store copies them into a buffer of its own. The norms are computed if they're
+        tracked and not given.
+        """
+        vectors = np.asarray(vectors)
+        if vectors.ndim != 2 or vectors.dtype != self.dtype:
+            raise ValueError(f'Expected a 2-d array of {self.dtype} vectors.')
+        self._set_dim(vectors.shape[1])
+        self._buffer = vectors
+        self.size = len(vectors)
+        if self.track_norms:
+            if norms is None:
+                norms = np.einsum('ij,ij->i', vectors, vectors)
+            self._norms = np.array(norms, dtype=np.float32)
+
+    def _as_row(self, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=self.dtype)
+        if vector.ndim != 1:
+            raise ValueError('Expected a 1-d vector.')
+        self._set_dim(len(vector))
+        return vector
+
+    def _set_dim(self, dim: int):
+        if self.dim is None:
+            self.dim = dim
+        elif dim != self.dim:
+            raise ValueError(f'Expected vectors of dimension {self.dim}, got {dim}.')
+
+    def _write(self, row: int, vector: np.ndarray, norm: Optional[float] = None):
+        self._buffer[row] = vector
+        if self.track_norms:
+            if norm is None:
+                as_float = self._buffer[row].astype(np.float32, copy=False)
+                norm = as_float @ as_float
+            self._norms[row] = norm
+
+    def _check_row(self, row: int):
+        if not 0 <= row < self.size:
+            raise IndexError(f'Row {row} is out of range for a store of size {self.size}.')
+
+    def _reserve(self, size: int):
+        if self._buffer is None:
+            self._allocate(max(self._initial_capacity, size))
+        elif size > len(self._buffer):
+            capacity = len(self._buffer)
+            while capacity < size:
+                capacity = int(capacity * self.growth_factor) + 1
+            self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        buffer = np.empty((capacity, self.dim), dtype=self.dtype)
+        norms = np.empty(capacity, dtype=np.float32) if self.track_norms else None
+        if self._buffer is not None:
+            buffer[:self.size] = self._buffer[:self.size]
+            if self.track_norms:
+                norms[:self.size] = self._norms[:self.size]
+        self._buffer = buffer
+        self._norms = norms
+
+
+class MemmapEmbeddingStore(EmbeddingStore):
+    """
+    An `EmbeddingStore` whose rows live in a memory-mapped file instead of process memory, for
+    the indexes that search compressed codes and only read full vectors to re-rank a few
+    candidates. The operating system pages rows in when they're read, and can drop them again
+    under memory pressure.
+
+    The file is at `path`, or an anonymous temporary file that's deleted once the store is
+    closed or garbage collected. Growing the store extends the file and maps it again, so
+    existing rows are never copied. Norms, if tracked, are kept in memory.
+
+    An attached array, e.g. the copy-on-write map of a snapshot's vectors, backs the store
+    instead of the file until the store grows, see `attach`.
+    """
+    def __init__(
+        self,
+        dim: Optional[int] = None,
+        capacity: int = 16,
+        dtype: Union[str, np.dtype] = np.float32,
+        growth_factor: float = 2.0,
+        track_norms: bool = False,
+        path: Optional[str] = None
+    ):
+        self.path = path
+        self._file = open(path, 'w+b') if path else tempfile.TemporaryFile()
+        # Whether the rows are in an attached array rather than in the file
+        self._attached = False
+        super().__init__(
+            dim=dim,
+            capacity=capacity,
+            dtype=dtype,
+            growth_factor=growth_factor,
+            track_norms=track_norms
+        )
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return np.asarray(super().matrix)
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes held in memory, i.e. the norms. The vectors are in the file."""
+        return 0 if self._norms is None else self._norms.nbytes
+
+    @property
+    def file_nbytes(self) -> int:
+        return 0 if self._buffer is None else self._buffer.nbytes
+
+    def get(self, row: int) -> np.ndarray:
+        return np.asarray(super().get(row))
+
+    def flush(self):
+        if self._buffer is not None and not self._attached:
+            self._buffer.flush()
+
+    def close(self):
+        self._buffer = None
+        self._file.close()
+
+    def attach(self, vectors: np.ndarray, norms: Optional[np.ndarray] = None):
+        """
+        Replace the stored vectors with an existing 2-d array without copying it into the file,
+        see `EmbeddingStore.attach`. Processes attaching the map of the same snapshot share its
+        pages. The first write that grows the store copies the rows into the file.
+        """
+        super().attach(vectors, norms=norms)
+        self._attached = True
+
+    def _allocate(self, capacity: int):
+        # The store only grows, and extending the file keeps the rows already written
+        attached = self._buffer if self._attached else None
+        self._file.truncate(capacity * self.dim * self.dtype.itemsize)
+        self._buffer = np.memmap(self._file, dtype=self.dtype, mode='r+', shape=(capacity, self.dim))
+        if attached is not None:
+            self._buffer[:self.size] = attached[:self.size]
+            self._attached = False
+        if self.track_norms:
+            norms = np.empty(capacity, dtype=np.float32)
+            if self._norms is not None:
+                norms[:self.size] = self._norms[:self.size]
+            self._norms = norms
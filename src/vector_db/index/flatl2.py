@@ -1,51 +1,175 @@
-from typing import List
-from utils.embed import embed
+from typing import List, Optional
+import numpy as np
+from utils.embed import EmbeddingProvider
 from utils.knn import KNearNeighbors
+from utils.scalar_quantizer import ScalarQuantizer
 from .base import BaseVectorSearchIndex
-from .collections_index import CollectionsIndex
+from .embedding_store import EmbeddingStore, MemmapEmbeddingStore
 from ..chunk import Chunk
 
 class FlatL2Index(BaseVectorSearchIndex):
-    """ 
+    """
     The FlatL2Index is a simple and rather brute force implementation of searching within
     a vector space. It's brute force because we're searching the entire vector space for any
     given query. This means that the search is a O(n) operation, where n is the number of
-    chunks in library.
+    chunks in library. The distance engine works on views of the embedding store, so it's
+    refitted in O(1) after every write and there's nothing to build.
+
+    ## Quantization:
+    With `quantization` set to `float16` or `int8`, the scanned matrix holds the embeddings
+    compressed by a `ScalarQuantizer`, 2 or 1 bytes per dimension instead of 4, and the
+    distances are computed on it directly. The full float32 embeddings are kept in a
+    memory-mapped file, and if `rerank_factor` is set the `k * rerank_factor` closest chunks are
+    re-ranked with them. The int8 scales and offsets are learnt once the delta holds
+    `delta_threshold` chunks, or by `build_index`, which learns them again from every chunk;
+    until then, searches scan the full embeddings. With the `cosine` and `dot` metrics, only
+    the dot products with the codes are computed.
     """
-    def __init__(self):
-        super().__init__()
-        self.embeddings: List[List[float]] = []
-        self.knn_engine = None
-        self.chunks_index = CollectionsIndex()
-        
+    def __init__(
+        self,
+        embedding_provider: EmbeddingProvider = None,
+        metric: str = 'l2',
+        quantization: Optional[str] = None,
+        rerank_factor: int = 4,
+        vectors_path: Optional[str] = None,
+        delta_threshold: int = 1024,
+        background_merge: bool = True
+    ):
+        super().__init__(
+            embedding_provider=embedding_provider,
+            metric=metric,
+            delta_threshold=delta_threshold,
+            background_merge=background_merge
+        )
+        self.knn_engine = self._knn()
+        self.quantizer: Optional[ScalarQuantizer] = None
+        self.rerank_factor = rerank_factor
+        if quantization is not None:
+            self.quantizer = ScalarQuantizer(quantization)
+            self.embeddings = MemmapEmbeddingStore(path=vectors_path)
+            # Quantized embeddings, aligned row by row with the full ones once trained
+            self.codes = EmbeddingStore(dtype=self.quantizer.dtype)
+
+    @property
+    def bytes_per_vector(self) -> int:
+        """Number of bytes kept in memory for each chunk's embedding."""
+        dtype = self.quantizer.dtype if self.quantizer is not None else self.embeddings.dtype
+        return dtype.itemsize * self.embedding_provider.dim
+
+    def __quantized(self) -> bool:
+        return self.quantizer is not None and self.quantizer.is_trained
+
+    def __encode(self, rows) -> np.ndarray:
+        return self.quantizer.encode(self.embeddings.matrix[rows])
+
     def add(self, chunks: List[Chunk]):
-        for chunk in chunks:
-            self.chunks.append(chunk)
-            if not chunk.embedding:
-                chunk.embedding = embed([chunk.text])[0]
-            self.embeddings.append(chunk.embedding)
-            self.chunks_index.add(id=chunk.id, value=len(self.chunks)-1)
-            
+        self.embed_chunks(chunks)
+        with self._lock.write():
+            rows = [self._add_chunk(chunk) for chunk in chunks]
+            if self.quantizer is None:
+                self.__refit()
+            elif self.__quantized():
+                if rows:
+                    codes = self.__encode(rows)
+                    self.codes.extend(codes, norms=self.quantizer.norms(codes))
+            else:
+                # Wait for enough chunks to learn the int8 ranges from
+                self._add_to_delta([chunk.id for chunk in chunks])
+
+    def _load(self, rows: range):
+        if self.quantizer is None:
+            self.__refit()
+        elif self.__quantized():
+            # float16 needs no training, so the loaded rows are quantized like added ones
+            self.__extend_codes(rows)
+        else:
+            super()._load(rows)
+
     def remove(self, chunk_id: str):
-        chunk_index = self.chunks_index.search(chunk_id)
-        del self.chunks[chunk_index]
-        del self.embeddings[chunk_index]
-        self.chunks_index.remove(id=chunk_id, iterable=self.chunks, reindex_key='id')
-        
+        with self._lock.write():
+            row = self.chunks_index.search(chunk_id)
+            self._remove_chunk(chunk_id)
+            # The codes are swap-removed like the embeddings, so they stay aligned
+            if self.__quantized():
+                self.codes.remove(row)
+            self.__refit()
+
     def update(self, chunk_id: str, text: str):
-        chunk_index = self.chunks_index.search(chunk_id)
-        self.chunks[chunk_index].text = text
-        self.embeddings[chunk_index] = embed([text])[0]
-            
+        embedding = self.embed_text(text)
+        with self._lock.write():
+            chunk_index = self.chunks_index.search(chunk_id)
+            self.chunks[chunk_index].text = text
+            self.set_embedding(chunk_id, embedding)
+
+    def set_embedding(self, chunk_id: str, embedding):
+        with self._lock.write():
+            super().set_embedding(chunk_id, embedding)
+            if self.__quantized():
+                row = self.chunks_index.search(chunk_id)
+                code = self.__encode(slice(row, row + 1))
+                self.codes.set(row, code[0], norm=self.quantizer.norms(code)[0])
+            self.__refit()
+
+    def merge(self):
+        # Only chunks added before the int8 ranges are learnt are in the delta, and training
+        # quantizes every chunk
+        with self._lock.read():
+            if not self.delta:
+                return
+        self.__train()
+
+    def __train(self):
+        """
+        Learn the int8 ranges from every chunk, and quantize them all again. The ranges are
+        learnt by a new quantizer under the read lock, so searches go on meanwhile; the
+        embeddings aren't copied first, which would read them all into memory. Only quantizing
+        the chunks with it holds the write lock.
+        """
+        with self._lock.read():
+            if not self.embeddings.size:
+                return
+            quantizer = ScalarQuantizer(self.quantizer.qtype).train(self.embeddings.matrix)
+        with self._lock.write():
+            self.quantizer = quantizer
+            self.codes.clear()
+            self.__extend_codes(range(self.embeddings.size))
+            self.delta.clear()
+
+    def __extend_codes(self, rows: range):
+        """Quantize the embeddings of `rows`, which follow the rows already quantized."""
+        for start in range(rows.start, rows.stop, self.quantizer.ENCODE_BATCH_SIZE):
+            codes = self.__encode(slice(start, min(start + self.quantizer.ENCODE_BATCH_SIZE, rows.stop)))
+            self.codes.extend(codes, norms=self.quantizer.norms(codes))
+
     def build_index(self):
-        self.knn_engine = KNearNeighbors().fit(self.embeddings)
-        
-    def search(self, query, k):
-        # embed the query
-        query_embedding = embed([query])[0]
-        # Get the k nearest neighbors
-        neighbors = self.knn_engine.predict(query_embedding, k)
-        # Get the chunks
-        return [self.chunks[i] for i in neighbors]
-        
-    
\ No newline at end of file
+        if self.quantizer is not None:
+            self.__train()
+            return
+        with self._lock.write():
+            self.__refit()
+
+    def __refit(self):
+        # The engine holds views of the store, so keep it in sync with every write. This is
+        # O(1) since the store already tracks the norms.
+        if self.quantizer is None:
+            self.knn_engine.fit(self.embeddings.matrix, norms=self.embeddings.norms)
+
+    def _search_index_many(self, query_embeddings: np.ndarray, k: int, max_distance: Optional[float] = None) -> List[List[int]]:
+        if self.quantizer is None:
+            # A single matrix product for all the queries
+            return self.knn_engine.predict_many(query_embeddings, k, max_distance)
+        return super()._search_index_many(query_embeddings, k, max_distance)
+
+    def _search_index(self, query_embedding: np.ndarray, k: int, max_distance: Optional[float] = None) -> List[int]:
+        if self.quantizer is None:
+            return self.knn_engine.predict(query_embedding, k, max_distance)
+        if self.metric == 'l2':
+            distances = self.quantizer.distances(query_embedding, self.codes.matrix, self.codes.norms)
+        else:
+            distances = -self.quantizer.inner_products(query_embedding, self.codes.matrix)
+        if not self.rerank_factor:
+            return KNearNeighbors().argsort(distances, k).tolist()
+        # Re-rank the closest candidates with their full embeddings
+        rows = KNearNeighbors().argsort(distances, k * self.rerank_factor)
+        knn_engine = self._knn().fit(self.embeddings.matrix[rows])
+        return [int(rows[neighbor]) for neighbor in knn_engine.predict(query_embedding, k, max_distance)]
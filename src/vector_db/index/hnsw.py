@@ -0,0 +1,329 @@
+import math
+import random
+import threading
+from heapq import heapify, heappop, heappush
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from utils.embed import EmbeddingProvider
+from .base import BaseVectorSearchIndex
+from ..chunk import Chunk
+
+class HNSWIndex(BaseVectorSearchIndex):
+    """
+    Hierarchical Navigable Small World graph. Every chunk is a node of a proximity graph
+    organized in layers: all nodes live in layer 0, and each node is also part of every layer up
+    to a random level drawn from an exponentially decaying distribution, so upper layers are
+    sparser and work as express lanes. A search greedily descends from the entry point at the top
+    layer down to layer 0, where a beam of `ef_search` candidates is expanded through the graph.
+    The search is sub-linear, and more candidates (`ef_search`) means higher recall.
+
+    ## Building the index:
+    Inserting a node costs a search of the graph, so added chunks first go to the delta, where
+    they're searched exactly, and are inserted into the graph by a background merge (see
+    `BaseVectorSearchIndex`). An inserted node is linked to up to `M` neighbours per layer
+    (`2 * M` in layer 0), picked among the `ef_construction` closest nodes with the neighbour
+    selection heuristic, which favours neighbours in different directions over a cluster of
+    near duplicates.
+
+    ## Removing:
+    Removing a chunk only tombstones its node: the node stays in the graph so that searches can
+    still route through it, with a copy of its embedding, but it's never returned. Once more
+    than `max_tombstone_ratio` of the nodes are tombstones, the graph is compacted: rebuilt from
+    the live chunks in the background, or by `build_index` without a background merge. Updating
+    a chunk's embedding tombstones its node and moves the chunk to the delta.
+
+    The compacted graph is built outside the lock, from a copy of the embeddings of the nodes,
+    so searches go on through the current graph meanwhile, and only swapping the new graph in
+    holds the write lock. The chunks removed, updated or inserted from the delta during the
+    rebuild are tombstoned in the new graph, and go back to the delta if they're still there.
+    """
+    # The graph is built on Euclidean distances, which rank unit vectors like cosine
+    METRICS = ('l2', 'cosine')
+
+    def __init__(
+        self,
+        embedding_provider: EmbeddingProvider = None,
+        metric: str = 'l2',
+        M: int = 16,
+        ef_construction: int = 100,
+        ef_search: int = 64,
+        max_tombstone_ratio: float = 0.25,
+        seed: Optional[int] = None,
+        delta_threshold: int = 1024,
+        background_merge: bool = True
+    ):
+        super().__init__(
+            embedding_provider=embedding_provider,
+            metric=metric,
+            delta_threshold=delta_threshold,
+            background_merge=background_merge
+        )
+        if M < 2:
+            raise ValueError('M must be at least 2.')
+        self.M = M
+        self.M0 = 2 * M
+        self.ef_construction = max(ef_construction, M)
+        self.ef_search = ef_search
+        self.max_tombstone_ratio = max_tombstone_ratio
+        self.level_multiplier = 1 / math.log(M)
+        self._rng = random.Random(seed)
+        self.__reset_graph()
+        # Chunks written to during a compaction, None when there's none running
+        self.__compacting: Optional[set] = None
+        self._compact_thread: Optional[threading.Thread] = None
+
+    def __reset_graph(self):
+        # Chunk id of every node, None for tombstones
+        self._node_chunk: List[Optional[str]] = []
+        self._chunk_node: Dict[str, int] = {}
+        # Neighbours of every node, for each layer the node is part of
+        self._neighbors: List[List[List[int]]] = []
+        self._tombstones: Dict[int, np.ndarray] = {}
+        self._entry_point: Optional[int] = None
+        self._max_level = -1
+
+    def __vectors(self, nodes: List[int]) -> np.ndarray:
+        rows, positions = [], []
+        vectors = np.empty((len(nodes), self.embeddings.dim), dtype=np.float32)
+        for i, node in enumerate(nodes):
+            chunk_id = self._node_chunk[node]
+            if chunk_id is None:
+                vectors[i] = self._tombstones[node]
+            else:
+                rows.append(self.chunks_index.search(chunk_id))
+                positions.append(i)
+        vectors[positions] = self.embeddings.matrix[rows]
+        return vectors
+
+    def __distances(self, query: np.ndarray, nodes: List[int]) -> np.ndarray:
+        diff = self.__vectors(nodes) - query
+        return np.einsum('ij,ij->i', diff, diff)
+
+    def __search_layer(
+        self,
+        query: np.ndarray,
+        entry_points: List[int],
+        ef: int,
+        level: int
+    ) -> List[Tuple[float, int]]:
+        """Beam search of a layer. Returns the `ef` closest nodes found as (distance, node), closest first."""
+        visited = set(entry_points)
+        distances = self.__distances(query, entry_points).tolist()
+        candidates = list(zip(distances, entry_points))
+        heapify(candidates)
+        # Max heap of the best nodes found so far
+        results = [(-d, node) for d, node in candidates]
+        heapify(results)
+        while len(results) > ef:
+            heappop(results)
+        while candidates:
+            distance, node = heappop(candidates)
+            if distance > -results[0][0]:
+                break
+            neighbors = [n for n in self._neighbors[node][level] if n not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            for neighbor_distance, neighbor in zip(self.__distances(query, neighbors).tolist(), neighbors):
+                if len(results) < ef or neighbor_distance < -results[0][0]:
+                    heappush(candidates, (neighbor_distance, neighbor))
+                    heappush(results, (-neighbor_distance, neighbor))
+                    if len(results) > ef:
+                        heappop(results)
+        return sorted((-d, node) for d, node in results)
+
+    def __select_neighbors(self, candidates: List[Tuple[float, int]], m: int) -> List[int]:
+        """
+        Neighbour selection heuristic: going from the closest candidate, keep a candidate only if
+        it's closer to the node than to any neighbour kept so far. Pruned candidates fill the
+        remaining slots, closest first, to keep the graph well connected.
+        """
+        if len(candidates) <= m:
+            return [node for _, node in candidates]
+        nodes = [node for _, node in candidates]
+        vectors = self.__vectors(nodes)
+        selected, pruned = [], []
+        for i, (distance, node) in enumerate(candidates):
+            if selected:
+                diff = vectors[selected] - vectors[i]
+                if np.einsum('ij,ij->i', diff, diff).min() < distance:
+                    pruned.append(node)
+                    continue
+            selected.append(i)
+            if len(selected) == m:
+                break
+        return [nodes[i] for i in selected] + pruned[:m - len(selected)]
+
+    def __descend(self, query: np.ndarray, down_to: int) -> List[int]:
+        """Greedy search from the entry point down to the layer `down_to`."""
+        entry_points = [self._entry_point]
+        for level in range(self._max_level, down_to, -1):
+            entry_points = [self.__search_layer(query, entry_points, 1, level)[0][1]]
+        return entry_points
+
+    def __insert(self, chunk_id: str):
+        """Insert the node of a chunk that's already in the embedding store."""
+        node = len(self._node_chunk)
+        level = int(-math.log(1 - self._rng.random()) * self.level_multiplier)
+        self._node_chunk.append(chunk_id)
+        self._chunk_node[chunk_id] = node
+        self._neighbors.append([[] for _ in range(level + 1)])
+        if self._entry_point is None:
+            self._entry_point, self._max_level = node, level
+            return
+        query = self.__vectors([node])[0]
+        entry_points = self.__descend(query, down_to=level)
+        for lc in range(min(level, self._max_level), -1, -1):
+            candidates = self.__search_layer(query, entry_points, self.ef_construction, lc)
+            self._neighbors[node][lc] = self.__select_neighbors(candidates, self.M)
+            max_neighbors = self.M0 if lc == 0 else self.M
+            for neighbor in self._neighbors[node][lc]:
+                links = self._neighbors[neighbor][lc] + [node]
+                if len(links) > max_neighbors:
+                    distances = self.__distances(self.__vectors([neighbor])[0], links).tolist()
+                    links = self.__select_neighbors(sorted(zip(distances, links)), max_neighbors)
+                self._neighbors[neighbor][lc] = links
+            entry_points = [node for _, node in candidates]
+        if level > self._max_level:
+            self._entry_point, self._max_level = node, level
+
+    def __tombstone(self, chunk_id: str, embedding):
+        node = self._chunk_node.pop(chunk_id)
+        self._tombstones[node] = np.array(embedding, dtype=np.float32)
+        self._node_chunk[node] = None
+
+    def __maybe_compact(self):
+        if not self.background_merge or self.__compacting is not None:
+            return
+        if len(self._tombstones) > self.max_tombstone_ratio * len(self._node_chunk):
+            if self._compact_thread is None or not self._compact_thread.is_alive():
+                self._compact_thread = threading.Thread(target=self.__compact, daemon=True)
+                self._compact_thread.start()
+
+    def wait_for_compaction(self):
+        """Block until the background compaction, if any, is done."""
+        thread = self._compact_thread
+        if thread is not None:
+            thread.join()
+
+    def __written(self, chunk_id: str):
+        # The nodes copied by a running compaction may no longer match the chunk
+        if self.__compacting is not None:
+            self.__compacting.add(chunk_id)
+
+    def __compact(self):
+        """Rebuild the graph without its tombstones, see the class docstring."""
+        with self._lock.write():
+            if self.__compacting is not None:
+                return
+            chunk_ids = list(self._chunk_node)
+            vectors = self.embeddings.matrix[[self.chunks_index.search(chunk_id) for chunk_id in chunk_ids]]
+            seed = self._rng.random()
+            self.__compacting = set()
+        try:
+            # A graph of its own, over the copied embeddings
+            graph = HNSWIndex(
+                embedding_provider=self.embedding_provider,
+                metric=self.metric,
+                M=self.M,
+                ef_construction=self.ef_construction,
+                seed=seed,
+                background_merge=False
+            )
+            if chunk_ids:
+                graph.embeddings.attach(vectors)
+            for row, chunk_id in enumerate(chunk_ids):
+                graph.chunks_index.add(id=chunk_id, value=row)
+            for chunk_id in chunk_ids:
+                graph.__insert(chunk_id)
+        except BaseException:
+            with self._lock.write():
+                self.__compacting = None
+            raise
+        with self._lock.write():
+            written, self.__compacting = self.__compacting, None
+            self._node_chunk, self._chunk_node = graph._node_chunk, graph._chunk_node
+            self._neighbors, self._tombstones = graph._neighbors, {}
+            self._entry_point, self._max_level = graph._entry_point, graph._max_level
+            back_to_delta = []
+            for chunk_id in written:
+                if chunk_id in self._chunk_node:
+                    self.__tombstone(chunk_id, vectors[graph.chunks_index.search(chunk_id)])
+                if chunk_id in self.chunks_index.index and chunk_id not in self.delta:
+                    back_to_delta.append(chunk_id)
+            self._add_to_delta(back_to_delta)
+
+    def add(self, chunks: List[Chunk]):
+        self.embed_chunks(chunks)
+        with self._lock.write():
+            for chunk in chunks:
+                self._add_chunk(chunk)
+            self._add_to_delta([chunk.id for chunk in chunks])
+
+    def _merge(self, chunk_ids: List[str]):
+        for chunk_id in chunk_ids:
+            self.__insert(chunk_id)
+            self.__written(chunk_id)
+
+    def __remove(self, chunk_id: str):
+        self.__written(chunk_id)
+        in_graph = chunk_id not in self.delta
+        chunk = self._remove_chunk(chunk_id)
+        if in_graph:
+            self.__tombstone(chunk_id, chunk.embedding)
+
+    def remove(self, chunk_id: str):
+        with self._lock.write():
+            self.__remove(chunk_id)
+            self.__maybe_compact()
+
+    def remove_many(self, chunk_ids: List[str]):
+        # Tombstone every chunk first, so the graph is rebuilt at most once
+        with self._lock.write():
+            for chunk_id in chunk_ids:
+                self.__remove(chunk_id)
+            self.__maybe_compact()
+
+    def update(self, chunk_id: str, text: str):
+        embedding = self.embed_text(text)
+        with self._lock.write():
+            chunk_index = self.chunks_index.search(chunk_id)
+            self.chunks[chunk_index].text = text
+            self.set_embedding(chunk_id, embedding)
+
+    def set_embedding(self, chunk_id: str, embedding):
+        with self._lock.write():
+            self.__written(chunk_id)
+            if chunk_id not in self.delta:
+                self.__tombstone(chunk_id, self.get_embedding(chunk_id))
+                self._add_to_delta([chunk_id])
+            super().set_embedding(chunk_id, embedding)
+            self.__maybe_compact()
+
+    def build_index(self):
+        """Merge the delta into the graph, and rebuild the graph if it has tombstones to purge."""
+        self.merge()
+        self.wait_for_compaction()
+        with self._lock.read():
+            if not self._tombstones:
+                return
+        self.__compact()
+        # Chunks written to during the rebuild
+        self.merge()
+
+    def _search_index(self, query_embedding: np.ndarray, k: int, max_distance: Optional[float] = None) -> List[int]:
+        if self._entry_point is None:
+            return []
+        entry_points = self.__descend(query_embedding, down_to=0)
+        candidates = self.__search_layer(
+            query_embedding, entry_points, max(self.ef_search, k), 0
+        )
+        # Get the rows of the chunks, skipping tombstones
+        rows = []
+        for _, node in candidates:
+            chunk_id = self._node_chunk[node]
+            if chunk_id is not None:
+                rows.append(self.chunks_index.search(chunk_id))
+            if len(rows) == k:
+                break
+        return rows
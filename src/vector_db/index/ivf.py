@@ -0,0 +1,307 @@
+import math
+from typing import Dict, List, Optional
+import numpy as np
+from utils.embed import EmbeddingProvider
+from utils.kmeans import assign, kmeans, squared_distances
+from utils.knn import KNearNeighbors
+from utils.pq import ProductQuantizer
+from .base import BaseVectorSearchIndex
+from .embedding_store import EmbeddingStore, MemmapEmbeddingStore
+from ..chunk import Chunk
+
+class IVFIndex(BaseVectorSearchIndex):
+    """
+    Inverted file index. The vector space is partitioned into `n_lists` cells with k-means, and
+    every chunk is kept in the posting list of its nearest centroid. A search only scores the
+    chunks of the `nprobe` lists whose centroids are closest to the query, so it looks at about
+    `nprobe / n_lists` of the library instead of all of it. More probes means higher recall.
+
+    ## Building the index:
+    Until the index is trained, added chunks are kept in the delta and searched exactly, like
+    the FlatL2 index. Once the delta holds `delta_threshold` chunks, the centroids are trained
+    in the background on (a sample of) the library's embeddings, and every chunk is assigned to
+    a list. Chunks added afterwards go to their nearest centroid without retraining.
+
+    Since the centroids don't move, the lists drift out of balance as the library changes, so
+    `build_index` retrains once the longest list holds more than `imbalance_factor` times the
+    average, and does nothing otherwise. If `n_lists` isn't set, it's picked at training time as
+    the square root of the number of chunks, and `build_index` also retrains once the library
+    has outgrown it four times over.
+
+    ## Product quantized storage:
+    If `pq_m` is set, chunks are kept in memory as product quantization codes of their residual
+    to the centroid of their list, and the full embeddings are kept on disk (see `PQIndex`).
+    The codebooks are trained along with the centroids. Each probed list is scored with a
+    lookup table for the query's residual to its centroid, and the `k * rerank_factor` closest
+    chunks are re-ranked with their full embeddings, if `rerank_factor` is set.
+    """
+    # The centroids are trained on Euclidean distances, which rank unit vectors like cosine
+    METRICS = ('l2', 'cosine')
+    # Largest number of vectors assigned to the centroids at once, to bound the size of the
+    # distance matrix
+    ASSIGN_BATCH_SIZE = 65536
+
+    def __init__(
+        self,
+        embedding_provider: EmbeddingProvider = None,
+        metric: str = 'l2',
+        n_lists: Optional[int] = None,
+        nprobe: int = 8,
+        imbalance_factor: float = 3.0,
+        training_points_per_list: int = 256,
+        kmeans_iterations: int = 20,
+        pq_m: Optional[int] = None,
+        rerank_factor: int = 4,
+        vectors_path: Optional[str] = None,
+        seed: Optional[int] = None,
+        delta_threshold: int = 1024,
+        background_merge: bool = True
+    ):
+        super().__init__(
+            embedding_provider=embedding_provider,
+            metric=metric,
+            delta_threshold=delta_threshold,
+            background_merge=background_merge
+        )
+        if n_lists is not None and n_lists < 1:
+            raise ValueError('There must be at least one list.')
+        if nprobe < 1:
+            raise ValueError('At least one list must be probed.')
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.imbalance_factor = imbalance_factor
+        self.training_points_per_list = training_points_per_list
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        # Chunk ids of every posting list, kept as dict keys so a chunk is removed in O(1)
+        self.lists: List[Dict[str, None]] = []
+        # Posting list of every chunk
+        self._chunk_list: Dict[str, int] = {}
+        self.quantizer: Optional[ProductQuantizer] = None
+        self.rerank_factor = rerank_factor
+        if pq_m is not None:
+            self.quantizer = ProductQuantizer(
+                dim=self.embedding_provider.dim,
+                m=pq_m,
+                iterations=kmeans_iterations,
+                seed=seed
+            )
+            self.embeddings = MemmapEmbeddingStore(path=vectors_path)
+            # Residual codes of every chunk, aligned row by row with the embeddings once trained
+            self.codes = EmbeddingStore(dim=pq_m, dtype=np.uint8, track_norms=False)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def is_unbalanced(self) -> bool:
+        """
+        Whether the longest posting list holds more than `imbalance_factor` times the average,
+        or, without a set `n_lists`, the library has grown to 4 times the square of the lists.
+        """
+        if not self.is_trained or not self._chunk_list:
+            return False
+        if self.n_lists is None and len(self._chunk_list) > 4 * len(self.lists) ** 2:
+            return True
+        average = len(self._chunk_list) / len(self.lists)
+        return max(len(chunk_ids) for chunk_ids in self.lists) > self.imbalance_factor * max(average, 1)
+
+    def __assign(self, embeddings: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(embeddings), dtype=np.intp)
+        for start in range(0, len(embeddings), self.ASSIGN_BATCH_SIZE):
+            end = start + self.ASSIGN_BATCH_SIZE
+            labels[start:end] = assign(embeddings[start:end], self.centroids)
+        return labels
+
+    @property
+    def bytes_per_vector(self) -> int:
+        """Number of bytes kept in memory for each chunk's embedding."""
+        if self.quantizer is not None:
+            return self.quantizer.code_size
+        return self.embeddings.dtype.itemsize * self.embedding_provider.dim
+
+    def __add_to_lists(self, chunk_ids: List[str], embeddings: np.ndarray) -> np.ndarray:
+        """Add chunks to the list of their nearest centroid, and return the lists."""
+        if not self.is_trained:
+            return np.empty(0, dtype=np.intp)
+        labels = self.__assign(embeddings)
+        for chunk_id, label in zip(chunk_ids, labels.tolist()):
+            self.lists[label][chunk_id] = None
+            self._chunk_list[chunk_id] = label
+        return labels
+
+    def __remove_from_lists(self, chunk_id: str):
+        label = self._chunk_list.pop(chunk_id, None)
+        if label is not None:
+            del self.lists[label][chunk_id]
+
+    def __encode(self, embeddings: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        """Codes of the residuals of embeddings to the centroids of their lists."""
+        return self.quantizer.encode(embeddings - self.centroids[labels])
+
+    def train(self):
+        """
+        Train the centroids, and the codebooks, and assign every chunk to its posting list. The
+        training vectors are copied under the read lock, and trained on without any lock, so
+        searches and writes go on meanwhile; only the assignment of the chunks to the new lists
+        holds the write lock.
+        """
+        with self._lock.read():
+            n = self.embeddings.size
+            if n:
+                n_lists = min(self.n_lists or max(1, round(math.sqrt(n))), n)
+                # A few hundred points per centroid are enough to place it
+                max_training_points = n_lists * self.training_points_per_list
+                if n > max_training_points:
+                    rng = np.random.default_rng(self.seed)
+                    sample = np.sort(rng.choice(n, size=max_training_points, replace=False))
+                    training_vectors = self.embeddings.matrix[sample]
+                else:
+                    training_vectors = np.array(self.embeddings.matrix)
+        if n == 0:
+            with self._lock.write():
+                self.centroids = None
+                self.lists, self._chunk_list = [], {}
+            return
+        centroids, training_labels = kmeans(
+            training_vectors,
+            n_lists,
+            iterations=self.kmeans_iterations,
+            seed=self.seed
+        )
+        quantizer = None
+        if self.quantizer is not None:
+            quantizer = ProductQuantizer(
+                dim=self.embedding_provider.dim,
+                m=self.quantizer.m,
+                iterations=self.kmeans_iterations,
+                seed=self.seed
+            )
+            quantizer.train(training_vectors - centroids[training_labels])
+        with self._lock.write():
+            self.centroids = centroids
+            if quantizer is not None:
+                self.quantizer = quantizer
+                self.codes.clear()
+            self.lists = [{} for _ in range(len(self.centroids))]
+            self._chunk_list = {}
+            # The chunks written during the training are assigned too
+            n = self.embeddings.size
+            vectors = self.embeddings.matrix
+            for start in range(0, n, self.ASSIGN_BATCH_SIZE):
+                end = min(start + self.ASSIGN_BATCH_SIZE, n)
+                batch = vectors[start:end]
+                labels = self.__add_to_lists([chunk.id for chunk in self.chunks[start:end]], batch)
+                if self.quantizer is not None:
+                    self.codes.extend(self.__encode(batch, labels))
+            self.delta.clear()
+
+    def build_index(self):
+        """Train the index if it isn't trained yet, or retrain it if its lists are unbalanced."""
+        with self._lock.read():
+            if self.is_trained and not self.is_unbalanced():
+                return
+        self.train()
+
+    def add(self, chunks: List[Chunk]):
+        self.embed_chunks(chunks)
+        with self._lock.write():
+            rows = [self._add_chunk(chunk) for chunk in chunks]
+            if not self.is_trained:
+                self._add_to_delta([chunk.id for chunk in chunks])
+                return
+            embeddings = self.embeddings.matrix[rows]
+            labels = self.__add_to_lists([chunk.id for chunk in chunks], embeddings)
+            if self.quantizer is not None and rows:
+                self.codes.extend(self.__encode(embeddings, labels))
+
+    def merge(self):
+        # Only chunks added before the centroids are trained are in the delta, and training
+        # assigns every chunk
+        with self._lock.read():
+            if not self.delta:
+                return
+        self.train()
+
+    def __probed_lists(self, query_embedding: np.ndarray, k: int) -> List[int]:
+        """The `nprobe` closest lists, and further lists if they hold fewer than k chunks."""
+        distances = squared_distances(query_embedding.reshape(1, -1), self.centroids)[0]
+        probed, size = [], 0
+        for label in np.argsort(distances, kind='stable').tolist():
+            if len(probed) >= self.nprobe and size >= k:
+                break
+            probed.append(label)
+            size += len(self.lists[label])
+        return probed
+
+    def __list_rows(self, label: int) -> List[int]:
+        """Rows of the chunks of a list in the embedding store."""
+        return [self.chunks_index.search(chunk_id) for chunk_id in self.lists[label]]
+
+    def __search_codes(self, query_embedding: np.ndarray, k: int, max_distance: Optional[float] = None) -> List[int]:
+        """Rows of the nearest chunks by the approximate distances of their codes, re-ranked if enabled."""
+        rows, distances = [], []
+        for label in self.__probed_lists(query_embedding, k):
+            list_rows = self.__list_rows(label)
+            if not list_rows:
+                continue
+            table = self.quantizer.distance_table(query_embedding - self.centroids[label])
+            rows.extend(list_rows)
+            distances.append(self.quantizer.adc(table, self.codes.matrix[list_rows]))
+        if not rows:
+            return []
+        distances = np.concatenate(distances)
+        if not self.rerank_factor:
+            return [rows[i] for i in KNearNeighbors().argsort(distances, k).tolist()]
+        # Re-rank the closest candidates with their full embeddings
+        candidates = [rows[i] for i in KNearNeighbors().argsort(distances, k * self.rerank_factor).tolist()]
+        knn_engine = self._knn().fit(self.embeddings.matrix[candidates])
+        return [candidates[i] for i in knn_engine.predict(query_embedding, k, max_distance)]
+
+    def _search_index(self, query_embedding: np.ndarray, k: int, max_distance: Optional[float] = None) -> List[int]:
+        if self.quantizer is not None:
+            return self.__search_codes(query_embedding, k, max_distance)
+        # Rows of the candidate chunks in the embedding store
+        rows = [
+            row
+            for label in self.__probed_lists(query_embedding, k)
+            for row in self.__list_rows(label)
+        ]
+        # Get the k nearest neighbors
+        knn_engine = self._knn().fit(
+            self.embeddings.matrix[rows],
+            norms=self.embeddings.norms[rows]
+        )
+        neighbors = knn_engine.predict(query_embedding, k, max_distance)
+        return [rows[neighbor] for neighbor in neighbors]
+
+    def remove(self, chunk_id: str):
+        with self._lock.write():
+            row = self.chunks_index.search(chunk_id)
+            self._remove_chunk(chunk_id)
+            self.__remove_from_lists(chunk_id)
+            # The codes are swap-removed like the embeddings, so they stay aligned
+            if self.quantizer is not None and self.is_trained:
+                self.codes.remove(row)
+
+    def update(self, chunk_id: str, text: str):
+        embedding = self.embed_text(text)
+        with self._lock.write():
+            chunk_index = self.chunks_index.search(chunk_id)
+            # Update chunk
+            self.chunks[chunk_index].text = text
+            self.set_embedding(chunk_id, embedding)
+
+    def set_embedding(self, chunk_id: str, embedding):
+        with self._lock.write():
+            super().set_embedding(chunk_id, embedding)
+            if not self.is_trained:
+                return
+            # Move the chunk to the list of its new nearest centroid
+            row = self.chunks_index.search(chunk_id)
+            embeddings = self.embeddings.matrix[row:row + 1]
+            self.__remove_from_lists(chunk_id)
+            labels = self.__add_to_lists([chunk_id], embeddings)
+            if self.quantizer is not None:
+                self.codes.set(row, self.__encode(embeddings, labels)[0])
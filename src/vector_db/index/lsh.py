@@ -1,111 +1,198 @@
-import random
-from typing import List
-from utils.embed import embed
-from utils.knn import KNearNeighbors
+from functools import reduce
+from itertools import combinations
+from operator import or_
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+from utils.embed import EmbeddingProvider
 from .base import BaseVectorSearchIndex
-from .collections_index import CollectionsIndex
 from ..chunk import Chunk
 
 class LSHIndex(BaseVectorSearchIndex):
-    def __init__(self):
-        super().__init__()
-        self.embeddings: List[List[float]] = []
-        self.chunks_index = CollectionsIndex()
-        self.hyperplanes = self.__generate_random_hyperplanes()
-        self.buckets = {}
-        
-    def __generate_random_hyperplanes(
-        self, 
-        n_planes: int = 20, 
-        dim: int = 1024 # hardcoding for now assuming only Cohere embeddings
+    """
+    Locality Sensitive Hashing with random hyperplanes. Each of the `tables` hash tables has
+    `bits` hyperplanes of its own, and a vector's key in a table has one bit per hyperplane, set
+    when the vector lies on the positive side of it. The first hyperplane is the most significant
+    bit, so a key is the integer value of the binary string "0101..." the bits spell out.
+
+    Keys are computed for a whole batch of embeddings with a single matrix multiply against the
+    hyperplanes, and packed into uint64 integers. The Hamming distance between two keys is the
+    popcount of their XOR.
+
+    ## Multi-probe search:
+    A query probes up to `probes` buckets per table: its own bucket first, then the buckets whose
+    keys differ from it in 1 bit, then 2 bits, and so on. Within a radius, the bits whose
+    hyperplanes the query is closest to are flipped first, since those are the bits a near
+    neighbour most likely disagrees on. Probing stops as soon as `candidate_limit` candidates
+    are gathered across tables, and only the candidates are scored exactly. More tables and
+    probes raise recall, a lower candidate limit bounds latency.
+
+    The hyperplanes are drawn from `seed`. Without one, a seed is drawn and kept in `seed`, so
+    that a restored index, created again with it, hashes chunks to the same buckets.
+    """
+    MAX_PLANES = 64
+
+    def __init__(
+        self,
+        embedding_provider: EmbeddingProvider = None,
+        metric: str = 'l2',
+        tables: int = 4,
+        bits: int = 16,
+        probes: int = 8,
+        candidate_limit: int = 2000,
+        seed: Optional[int] = None
     ):
-        hyperplanes = []
-        for _ in range(n_planes):
-            plane = [random.gauss(0, 1) for _ in range(dim)]
-            hyperplanes.append(plane)
-        return hyperplanes
-    
-    def __hash(self, embedding: List[float]):
-        hash_bits = []
-        for plane in self.hyperplanes:
-            dot = sum(e*p for e, p in zip(embedding, plane))
-            hash_bits.append("1" if dot > 0 else "0")
-        return "".join(hash_bits)
-    
-    def __hamming_distance(self, s1: str, s2: str):
-        return sum(x != y for x, y in zip(s1, s2))
-    
+        super().__init__(embedding_provider=embedding_provider, metric=metric)
+        if not 0 < bits <= self.MAX_PLANES:
+            raise ValueError(f'The number of bits must be between 1 and {self.MAX_PLANES}.')
+        if tables < 1:
+            raise ValueError('There must be at least one hash table.')
+        if probes < 1:
+            raise ValueError('At least one bucket must be probed per table.')
+        self.tables = tables
+        self.bits = bits
+        self.probes = probes
+        self.candidate_limit = candidate_limit
+        if seed is None:
+            seed = int(np.random.default_rng().integers(2**32))
+        self.seed = seed
+        self.hyperplanes = self.__generate_random_hyperplanes(
+            n_planes=bits,
+            dim=self.embedding_provider.dim,
+            n_tables=tables,
+            seed=seed
+        )
+        # Value of each bit of a key, most significant bit first
+        self.__bit_values = np.left_shift(
+            np.uint64(1), np.arange(bits - 1, -1, -1, dtype=np.uint64)
+        )
+        # Chunk ids of every bucket, kept as dict keys so a chunk is removed in O(1)
+        self.buckets: List[Dict[int, Dict[str, None]]] = [{} for _ in range(tables)]
+
+    def __generate_random_hyperplanes(
+        self,
+        n_planes: int = 20,
+        dim: int = 1024,
+        n_tables: int = 1,
+        seed: Optional[int] = None
+    ) -> np.ndarray:
+        """Gaussian hyperplanes of shape (n_tables, n_planes, dim)."""
+        rng = np.random.default_rng(seed)
+        return rng.standard_normal((n_tables, n_planes, dim)).astype(np.float32)
+
+    def __project(self, embeddings) -> np.ndarray:
+        """Signed distances of a batch of embeddings to every hyperplane, of shape (tables, bits, n)."""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.hyperplanes.shape[-1])
+        return self.hyperplanes @ embeddings.T
+
+    def __keys(self, projections: np.ndarray) -> np.ndarray:
+        bits = projections > 0
+        return np.einsum('tpn,p->tn', bits.astype(np.uint64), self.__bit_values)
+
+    def __hash(self, embeddings) -> np.ndarray:
+        """Keys of a batch of embeddings, of shape (tables, n)."""
+        return self.__keys(self.__project(embeddings))
+
+    def __probe_sequence(self, key: int, margins: np.ndarray) -> Iterator[int]:
+        """
+        Keys to probe around `key`, by increasing Hamming radius. `margins` holds how far the
+        query is from each hyperplane; bits with smaller margins are flipped first.
+        """
+        # Bit masks ordered from the least to the most confident bit
+        masks = [int(self.__bit_values[bit]) for bit in np.argsort(np.abs(margins), kind='stable')]
+        yield key
+        for radius in range(1, self.bits + 1):
+            for flipped in combinations(masks, radius):
+                yield key ^ reduce(or_, flipped)
+
+    def __hamming_distance(self, keys: np.ndarray, key: int) -> np.ndarray:
+        return np.bitwise_count(keys ^ np.uint64(key))
+
+    def __add_to_buckets(self, chunk_ids: List[str], keys: np.ndarray):
+        for table, table_keys in zip(self.buckets, keys):
+            for chunk_id, key in zip(chunk_ids, table_keys.tolist()):
+                table.setdefault(key, {})[chunk_id] = None
+
+    def __remove_from_buckets(self, chunk_id: str, keys: np.ndarray):
+        for table, key in zip(self.buckets, keys[:, 0].tolist()):
+            del table[key][chunk_id]
+            if not table[key]:
+                del table[key]
+
     def add(self, chunks: List[Chunk]):
-        for chunk in chunks:
-            self.chunks.append(chunk)
-            chunk_index = len(self.chunks)-1
-            if not chunk.embedding:
-                chunk.embedding = embed([chunk.text])[0]
-            self.embeddings.append(chunk.embedding)
-            self.chunks_index.add(id=chunk.id, value=chunk_index)
+        self.embed_chunks(chunks)
+        with self._lock.write():
+            rows = [self._add_chunk(chunk) for chunk in chunks]
             # Add to LSH Index
-            key = self.__hash(chunk.embedding)
-            if key not in self.buckets:
-                self.buckets[key] = []
-            self.buckets[key].append(chunk.id)
-            
-    def search(self, query: str, k: int):
-        # embed the query
-        query_embedding = embed([query])[0]
-        # Hash the query embedding
-        key = self.__hash(query_embedding)
-        # Check to see if the key exists in the buckets
-        search_space = self.buckets.get(key, [])
-        if not search_space:
-            # If no match was found, get the N nearest buckets
-            n_probe = 4
-            all_keys = list(self.buckets.keys())
-            n_closest_keys = sorted(all_keys, key=lambda k: self.__hamming_distance(key, k))[:n_probe]
-            for closest_key in n_closest_keys:
-                search_space.extend(self.buckets[closest_key])
-        # Tuple to store the embedding and chunk id
-        embeddings_idx = [
-            ( self.embeddings[ self.chunks_index.search(chunk_id) ], chunk_id ) 
-            for chunk_id in search_space
+            keys = self.__hash(self.embeddings.matrix[rows])
+            self.__add_to_buckets([chunk.id for chunk in chunks], keys)
+
+    def _load(self, rows: range):
+        keys = self.__hash(self.embeddings.matrix[rows.start:rows.stop])
+        self.__add_to_buckets([self.chunks[row].id for row in rows], keys)
+
+    def __candidates(self, query_embedding, k: int) -> List[str]:
+        """Multi-probe the tables for the ids of the chunks to score."""
+        projections = self.__project(query_embedding)
+        query_keys = self.__keys(projections)[:, 0].tolist()
+        sequences = [
+            self.__probe_sequence(key, projections[table, :, 0])
+            for table, key in enumerate(query_keys)
+        ]
+        # Probe the tables round robin, so every table gets to probe its closest buckets first
+        candidates: Dict[str, None] = {}
+        for _ in range(self.probes):
+            for table, sequence in zip(self.buckets, sequences):
+                key = next(sequence, None)
+                if key is not None:
+                    candidates.update(table.get(key, {}))
+            if len(candidates) >= self.candidate_limit:
+                break
+        if len(candidates) < k:
+            # Too few candidates around the query, take the nearest buckets that exist instead
+            for table, key in zip(self.buckets, query_keys):
+                if not table or len(candidates) >= k:
+                    continue
+                all_keys = np.fromiter(table.keys(), dtype=np.uint64, count=len(table))
+                distances = self.__hamming_distance(all_keys, key)
+                # Ties are broken by key, so the candidates don't depend on the order chunks were added in
+                for closest_key in all_keys[np.lexsort((all_keys, distances))].tolist():
+                    candidates.update(table[closest_key])
+                    if len(candidates) >= k:
+                        break
+        return list(candidates)
+
+    def _search_index(self, query_embedding: np.ndarray, k: int, max_distance: Optional[float] = None) -> List[int]:
+        # Rows of the candidate chunks in the embedding store
+        rows = [
+            self.chunks_index.search(chunk_id)
+            for chunk_id in self.__candidates(query_embedding, k)
         ]
         # Get the k nearest neighbors
-        knn_engine = KNearNeighbors().fit([embedding for embedding, _ in embeddings_idx])
-        neighbors = knn_engine.predict(query_embedding, k)
-        # Get the chunks
-        chunks = []
-        for neighbor in neighbors:
-            chunk_id = embeddings_idx[neighbor][1]
-            chunks.append(
-                self.chunks[ self.chunks_index.search(chunk_id) ]
-            )
-        return chunks
-        
-    def remove(self, chunk_id: str):
-        chunk_index = self.chunks_index.search(chunk_id)
-        embedding_to_remove = self.embeddings[chunk_index]
-        del self.chunks[chunk_index]
-        del self.embeddings[chunk_index]
-        self.chunks_index.remove(
-            id=chunk_id, 
-            iterable=self.chunks, 
-            reindex_key='id'
+        knn_engine = self._knn().fit(
+            self.embeddings.matrix[rows],
+            norms=self.embeddings.norms[rows]
         )
-        # Remove chunk from LSH Index
-        key = self.__hash(embedding_to_remove)
-        self.buckets[key].remove(chunk_id)
-        
+        neighbors = knn_engine.predict(query_embedding, k, max_distance)
+        return [rows[neighbor] for neighbor in neighbors]
+
+    def remove(self, chunk_id: str):
+        with self._lock.write():
+            chunk = self._remove_chunk(chunk_id)
+            # Remove chunk from LSH Index
+            self.__remove_from_buckets(chunk_id, self.__hash(chunk.embedding))
+
     def update(self, chunk_id: str, text: str):
-        chunk_index = self.chunks_index.search(chunk_id)
-        # Remove chunk from LSH Index
-        key = self.__hash(self.embeddings[chunk_index])
-        self.buckets[key].remove(chunk_id)
-        # Update chunk
-        self.chunks[chunk_index].text = text
-        self.embeddings[chunk_index] = embed([text])[0]
-        # Add chunk to LSH Index
-        key = self.__hash(self.embeddings[chunk_index])
-        if key not in self.buckets:
-            self.buckets[key] = []
-        self.buckets[key].append(chunk_id)
-        
+        embedding = self.embed_text(text)
+        with self._lock.write():
+            chunk_index = self.chunks_index.search(chunk_id)
+            # Update chunk
+            self.chunks[chunk_index].text = text
+            self.set_embedding(chunk_id, embedding)
 
+    def set_embedding(self, chunk_id: str, embedding):
+        with self._lock.write():
+            # Remove chunk from LSH Index
+            self.__remove_from_buckets(chunk_id, self.__hash(self.get_embedding(chunk_id)))
+            super().set_embedding(chunk_id, embedding)
+            # Add chunk to LSH Index
+            self.__add_to_buckets([chunk_id], self.__hash(self.get_embedding(chunk_id)))
@@ -0,0 +1,123 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, List, Set, Tuple
+from .base import BaseIndex
+
+RANGE_OPERATORS = ('gt', 'gte', 'lt', 'lte')
+FIELD_OPERATORS = ('eq', 'in') + RANGE_OPERATORS
+
+class MetadataIndex(BaseIndex):
+    """
+    Secondary index over the metadata of the chunks of a vector search index, used to filter
+    searches.
+
+    ## Building the index:
+    Every scalar metadata value (str, int, float or bool) of a chunk is indexed when the chunk is
+    added. Each field has an inverted index, mapping a value to the ids of the chunks holding
+    it, and the distinct values of the field kept sorted, so a range of values is found with a
+    binary search. Adding or removing a chunk is O(1) per field, plus a shift of the sorted
+    values when a value appears or disappears.
+
+    ## Filter expressions:
+    A filter is a dict, either on a single field:
+
+    - `{"field": "doc_id", "eq": "..."}`
+    - `{"field": "doc_id", "in": ["...", "..."]}`
+    - `{"field": "page_number", "gte": 1, "lt": 5}`, with any of `gt`, `gte`, `lt` and `lte`
+
+    or combining filters with `{"and": [...]}` and `{"or": [...]}`. `select` returns the ids of
+    the matching chunks, in O(m) for m matches, plus a binary search per range.
+
+    Index: dict of {
+        field: dict of {value: dict of {chunk_id: None}}
+    }
+    """
+    def __init__(self):
+        self.index: Dict[str, Dict[Any, Dict[str, None]]] = {}
+        # Distinct values of every field, sorted by `_sort_key`
+        self.sorted_values: Dict[str, List[Tuple]] = {}
+
+    @staticmethod
+    def _sort_key(value) -> Tuple:
+        # Numbers sort before strings, so a field holding both can still be kept sorted
+        return (1, value) if isinstance(value, str) else (0, value)
+
+    @staticmethod
+    def _is_indexed(value) -> bool:
+        return isinstance(value, (str, int, float))
+
+    def add(self, id: str, metadata: Dict[str, Any]):
+        for field, value in (metadata or {}).items():
+            if not self._is_indexed(value):
+                continue
+            postings = self.index.setdefault(field, {})
+            if value not in postings:
+                postings[value] = {}
+                insort(self.sorted_values.setdefault(field, []), self._sort_key(value))
+            postings[value][id] = None
+
+    def remove(self, id: str, metadata: Dict[str, Any]):
+        for field, value in (metadata or {}).items():
+            if not self._is_indexed(value):
+                continue
+            chunk_ids = self.index[field][value]
+            del chunk_ids[id]
+            if not chunk_ids:
+                del self.index[field][value]
+                values = self.sorted_values[field]
+                del values[bisect_left(values, self._sort_key(value))]
+
+    def search(self, query: Dict[str, Any]) -> Set[str]:
+        return self.select(query)
+
+    def select(self, expression: Dict[str, Any]) -> Set[str]:
+        """Ids of the chunks matching a filter expression."""
+        if not isinstance(expression, dict):
+            raise ValueError(f'A filter must be a dict, got `{expression}`.')
+        if 'and' in expression:
+            selections = sorted((self.select(e) for e in expression['and']), key=len)
+            if not selections:
+                raise ValueError('`and` needs at least one filter.')
+            # Intersect starting from the smallest selection
+            return selections[0].intersection(*selections[1:])
+        if 'or' in expression:
+            if not expression['or']:
+                raise ValueError('`or` needs at least one filter.')
+            return set().union(*(self.select(e) for e in expression['or']))
+        # Operators set to None are ignored
+        expression = {key: value for key, value in expression.items() if value is not None}
+        field = expression.get('field')
+        operators = [op for op in expression if op != 'field']
+        if field is None or not operators:
+            raise ValueError(f'A filter needs a field and an operator, got `{expression}`.')
+        unknown = [op for op in operators if op not in FIELD_OPERATORS]
+        if unknown:
+            raise ValueError(f'Unknown filter operator(s) {", ".join(unknown)}, use one of {", ".join(FIELD_OPERATORS)}.')
+        postings = self.index.get(field, {})
+        selections = []
+        if 'eq' in expression:
+            selections.append(set(postings.get(expression['eq'], ())))
+        if 'in' in expression:
+            selections.append({
+                chunk_id for value in expression['in'] for chunk_id in postings.get(value, ())
+            })
+        if any(op in expression for op in RANGE_OPERATORS):
+            selections.append(self.__select_range(field, expression))
+        selections.sort(key=len)
+        return selections[0].intersection(*selections[1:])
+
+    def __select_range(self, field: str, expression: Dict[str, Any]) -> Set[str]:
+        values = self.sorted_values.get(field, [])
+        bounds = [expression[op] for op in RANGE_OPERATORS if op in expression]
+        # Only compare values of the same kind as the bounds, numbers or strings
+        kind = self._sort_key(bounds[0])[0]
+        start, end = bisect_left(values, (kind,)), bisect_left(values, (kind + 1,))
+        if 'gte' in expression:
+            start = max(start, bisect_left(values, self._sort_key(expression['gte'])))
+        if 'gt' in expression:
+            start = max(start, bisect_right(values, self._sort_key(expression['gt'])))
+        if 'lte' in expression:
+            end = min(end, bisect_right(values, self._sort_key(expression['lte'])))
+        if 'lt' in expression:
+            end = min(end, bisect_left(values, self._sort_key(expression['lt'])))
+        postings = self.index[field] if values else {}
+        return {chunk_id for _, value in values[start:end] for chunk_id in postings[value]}
@@ -0,0 +1,159 @@
+from typing import List, Optional
+import numpy as np
+from utils.embed import EmbeddingProvider
+from utils.knn import KNearNeighbors
+from utils.pq import ProductQuantizer
+from .base import BaseVectorSearchIndex
+from .embedding_store import EmbeddingStore, MemmapEmbeddingStore
+from ..chunk import Chunk
+
+class PQIndex(BaseVectorSearchIndex):
+    """
+    Product quantized index. Every chunk is kept in memory as `m` uint8 codes, e.g. 64 bytes for
+    a 1024 dim embedding instead of 4096, while the full float32 embeddings are kept in a
+    memory-mapped file on disk.
+
+    ## Building the index:
+    Until the index is trained, added chunks are kept in the delta and searched exactly, like
+    the FlatL2 index. Once the delta holds `delta_threshold` chunks, the codebooks of the
+    `ProductQuantizer` are trained in the background on (a sample of) the library's
+    embeddings, and every chunk is encoded. Chunks added afterwards are encoded with the
+    trained codebooks. `build_index` trains the codebooks again on the current chunks.
+
+    ## Searching:
+    The approximate distance from the query to every chunk is computed from the codes with a
+    per-query lookup table. If `rerank_factor` is set, the `k * rerank_factor` closest chunks
+    are then re-ranked with the exact distance to their full embeddings, read from disk.
+    """
+    # The codebooks are trained on Euclidean distances, which rank unit vectors like cosine
+    METRICS = ('l2', 'cosine')
+
+    def __init__(
+        self,
+        embedding_provider: EmbeddingProvider = None,
+        metric: str = 'l2',
+        m: int = 64,
+        rerank_factor: int = 4,
+        training_points: int = 25_600,
+        kmeans_iterations: int = 20,
+        vectors_path: Optional[str] = None,
+        seed: Optional[int] = None,
+        delta_threshold: int = 10_000,
+        background_merge: bool = True
+    ):
+        # The codebooks need some ten thousand embeddings to place 256 centroids in each subspace
+        super().__init__(
+            embedding_provider=embedding_provider,
+            metric=metric,
+            delta_threshold=delta_threshold,
+            background_merge=background_merge
+        )
+        self.quantizer = ProductQuantizer(
+            dim=self.embedding_provider.dim,
+            m=m,
+            iterations=kmeans_iterations,
+            seed=seed
+        )
+        self.rerank_factor = rerank_factor
+        self.training_points = training_points
+        self.seed = seed
+        self.embeddings = MemmapEmbeddingStore(path=vectors_path)
+        # Codes of every chunk, aligned row by row with the embeddings once trained
+        self.codes = EmbeddingStore(dim=m, dtype=np.uint8, track_norms=False)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.quantizer.is_trained
+
+    @property
+    def bytes_per_vector(self) -> int:
+        """Number of bytes kept in memory for each chunk's embedding."""
+        return self.quantizer.code_size
+
+    def build_index(self):
+        self.__train()
+
+    def __train(self):
+        """
+        Train the codebooks and encode every chunk. New codebooks are trained without any lock,
+        on embeddings copied under the read lock, so searches keep using the previous ones
+        meanwhile; only encoding the chunks with them holds the write lock.
+        """
+        with self._lock.read():
+            n = self.embeddings.size
+            if not n:
+                return
+            if n > self.training_points:
+                rng = np.random.default_rng(self.seed)
+                sample = np.sort(rng.choice(n, size=self.training_points, replace=False))
+                training_vectors = self.embeddings.matrix[sample]
+            else:
+                training_vectors = np.array(self.embeddings.matrix)
+        quantizer = ProductQuantizer(
+            dim=self.embedding_provider.dim,
+            m=self.quantizer.m,
+            iterations=self.quantizer.iterations,
+            seed=self.seed
+        )
+        quantizer.train(training_vectors)
+        with self._lock.write():
+            self.quantizer = quantizer
+            self.codes.clear()
+            # The chunks written during the training are encoded too
+            n = self.embeddings.size
+            vectors = self.embeddings.matrix
+            for start in range(0, n, self.quantizer.ENCODE_BATCH_SIZE):
+                self.codes.extend(self.quantizer.encode(vectors[start:start + self.quantizer.ENCODE_BATCH_SIZE]))
+            self.delta.clear()
+
+    def add(self, chunks: List[Chunk]):
+        self.embed_chunks(chunks)
+        with self._lock.write():
+            rows = [self._add_chunk(chunk) for chunk in chunks]
+            if not self.is_trained:
+                self._add_to_delta([chunk.id for chunk in chunks])
+            elif rows:
+                self.codes.extend(self.quantizer.encode(self.embeddings.matrix[rows]))
+
+    def merge(self):
+        # Only chunks added before the codebooks are trained are in the delta, and training
+        # encodes every chunk
+        with self._lock.read():
+            if not self.delta:
+                return
+        self.__train()
+
+    def _search_index(self, query_embedding: np.ndarray, k: int, max_distance: Optional[float] = None) -> List[int]:
+        # Approximate distances from the codes
+        table = self.quantizer.distance_table(query_embedding)
+        distances = self.quantizer.adc(table, self.codes.matrix)
+        if not self.rerank_factor:
+            return KNearNeighbors().argsort(distances, k).tolist()
+        # Re-rank the closest candidates with their full embeddings
+        rows = KNearNeighbors().argsort(distances, k * self.rerank_factor)
+        knn_engine = self._knn().fit(self.embeddings.matrix[rows])
+        neighbors = knn_engine.predict(query_embedding, k, max_distance)
+        return [int(rows[neighbor]) for neighbor in neighbors]
+
+    def remove(self, chunk_id: str):
+        with self._lock.write():
+            row = self.chunks_index.search(chunk_id)
+            self._remove_chunk(chunk_id)
+            # The codes are swap-removed like the embeddings, so they stay aligned
+            if self.is_trained:
+                self.codes.remove(row)
+
+    def update(self, chunk_id: str, text: str):
+        embedding = self.embed_text(text)
+        with self._lock.write():
+            chunk_index = self.chunks_index.search(chunk_id)
+            # Update chunk
+            self.chunks[chunk_index].text = text
+            self.set_embedding(chunk_id, embedding)
+
+    def set_embedding(self, chunk_id: str, embedding):
+        with self._lock.write():
+            super().set_embedding(chunk_id, embedding)
+            if self.is_trained:
+                row = self.chunks_index.search(chunk_id)
+                self.codes.set(row, self.quantizer.encode(self.embeddings.matrix[row:row + 1])[0])
@@ -3,4 +3,7 @@
 class IndexTypes:
     FLATL2 = 'flatl2'
     LSH = 'lsh'
+    HNSW = 'hnsw'
+    IVF = 'ivf'
+    PQ = 'pq'
     COLLECTIONS_INDEX = 'collections_index'
\ No newline at end of file
@@ -1,7 +1,12 @@
+import functools
 import threading
-from typing import List, Dict, Any, Union
+import time
+from typing import List, Dict, Any, Optional, Tuple, Union
+import numpy as np
 from .document import Document
 from .chunk import Chunk
+from . import snapshot
+from .wal import WriteAheadLog
 from .index import (
     SearchIndex, 
     IndexTypes, 
@@ -10,6 +15,20 @@ from .index import (
     CollectionsIndex
 )
 from exceptions import DuplicateError
+from utils.embed import EmbeddingProvider, get_provider
+from utils.rwlock import ReadWriteLock
+
+def _loaded(method):
+    """Load an unloaded library before `method` uses its documents, chunks or index, and keep
+    it from being unloaded until `method` returns. See `Library.unload`."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._use()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._release()
+    return wrapper
 
 class Library:
     """ 
@@ -22,17 +41,41 @@ class Library:
     that indexes the chunks, which is used by the vector search index to do RAG stuff.
     
     One thing to note about Documents within a library is that it's name is unique.
+    
+    Once the library is in a database with a write-ahead log, every write is logged, embeddings
+    included, and only returns once its record is on disk (see `vector_db.wal`). `lsn` is the
+    log sequence number of the library's last write.
+    
+    A library saved to a snapshot can be unloaded, keeping only its settings in memory, and is
+    loaded back from the snapshot the next time its documents, chunks or index are used, see
+    `unload`. `dict` and `rename` never load it.
+    
+    ## Concurrency:
+    Reads of the documents and chunks hold the read side of the library's `ReadWriteLock`, and
+    run concurrently; writes hold its write side. Searches only hold the read lock of the vector
+    search index. Embeddings are computed before taking any lock, so a slow embedding request
+    never blocks the readers, nor the other writers.
     """
     def __init__(
         self, 
         name: str,
-        metadata: Dict[str, Any]
+        metadata: Dict[str, Any],
+        embedding_provider: Union[str, EmbeddingProvider, None] = None,
+        metric: str = 'l2'
     ):
-        self.__lock = threading.Lock()
+        self.__lock = ReadWriteLock()
         self.name = name
         self.metadata = metadata
+        # Metric the chunks are ranked by, one of l2, cosine or dot
+        self.metric = metric
+        # Either a registered provider name, or a provider instance
+        if not isinstance(embedding_provider, EmbeddingProvider):
+            embedding_provider = get_provider(embedding_provider)
+        self.embedding_provider: EmbeddingProvider = embedding_provider
         self.documents: List[Document] = []
         self.index: Union[BaseVectorSearchIndex, None] = None
+        self.index_type: Union[IndexTypes, None] = None
+        self.index_params: Dict[str, Any] = {}
         # Document relted index
         self.__doc_name_index: CollectionsIndex = SearchIndex().initialize_index(
             index_type=IndexTypes.COLLECTIONS_INDEX
@@ -42,40 +85,104 @@ class Library:
         )
         # Chunk related index
         self.__chunk_id_to_doc_id: Dict[str, str] = {}
+        self._wal: Optional[WriteAheadLog] = None
+        self.lsn = 0
+        # Snapshot the library was last saved to or loaded from, as its manifest entry and
+        # directory, and whether the library was written to since
+        self._segment: Optional[Tuple[Dict[str, Any], str]] = None
+        self.__dirty = True
+        self.loaded = True
+        # Number of calls using the library's data, which keep it from being unloaded
+        self.__users = 0
+        self.__users_lock = threading.Lock()
+        self.last_access = time.monotonic()
         
-    def add_vector_search_index(self, index_type: IndexTypes):
+    def add_vector_search_index(self, index_type: IndexTypes, **index_params):
+        """Create the library's vector search index, ranking chunks by the library's metric.
+        `index_params` are passed on to the index, e.g. the number of tables and probes of an
+        LSH index."""
         self.index = SearchIndex().initialize_index(
-            index_type=index_type
+            index_type=index_type,
+            embedding_provider=self.embedding_provider,
+            metric=self.metric,
+            **index_params
         )
+        if index_type == IndexTypes.LSH:
+            # The hyperplanes are drawn from the seed, the library is created again with them
+            index_params = {**index_params, 'seed': self.index.seed}
+        self.index_type = index_type
+        self.index_params = index_params
         
+    @_loaded
     def build_index(self):
         self.index.build_index()
         
-    def search(self, query, k):
-        return self.index.search(query=query, k=k)
+    @_loaded
+    def search(self, query, k, filter=None, max_distance=None, min_score=None):
+        return self.index.search(
+            query=query, k=k, filter=filter, max_distance=max_distance, min_score=min_score
+        )
+    
+    @_loaded
+    def search_many(self, queries, k, filter=None, max_distance=None, min_score=None):
+        return self.index.search_many(
+            queries=queries, k=k, filter=filter, max_distance=max_distance, min_score=min_score
+        )
+    
+    @_loaded
+    def search_by_vector(self, vector, k, filter=None, max_distance=None, min_score=None):
+        return self.index.search_by_vector(
+            vector=vector, k=k, filter=filter, max_distance=max_distance, min_score=min_score
+        )
+    
+    @_loaded
+    def search_many_by_vector(self, vectors, k, filter=None, max_distance=None, min_score=None):
+        return self.index.search_many_by_vector(
+            vectors=vectors, k=k, filter=filter, max_distance=max_distance, min_score=min_score
+        )
+    
+    @_loaded
+    def search_by_chunk(self, chunk_id, k, filter=None, max_distance=None, min_score=None):
+        return self.index.search_by_chunk(
+            chunk_id=chunk_id, k=k, filter=filter, max_distance=max_distance, min_score=min_score
+        )
         
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a search query with the library's provider, e.g. to embed it apart from
+        searching with `search_by_vector`. Doesn't load the library."""
+        return self.embedding_provider.embed([query], input_type="search_query")[0]
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed search queries, see `embed_query`, in batches."""
+        return self.embedding_provider.embed_in_batches(queries, input_type="search_query")
+        
+    @_loaded
     def add_chunks(self, chunks: List[Chunk]):
-        with self.__lock:
-            chunks_added = []
+        """Add chunks to their documents and to the vector search index. Chunks without an
+        embedding are embedded in batches before anything is added, and every chunk is checked
+        before any is added, so a failing embedding request, an unknown document or a duplicate
+        chunk leaves the library untouched."""
+        self.index.embed_chunks(chunks)
+        with self.__lock.write():
+            docs = []
+            chunk_ids = set()
             for chunk in chunks:
-                chunk_meta = chunk.metadata
-                doc_id = chunk_meta.get('doc_id')
+                doc_id = chunk.metadata.get('doc_id')
                 try:
-                    doc = self.get_document(id=doc_id)
+                    docs.append(self.get_document(id=doc_id))
                 except KeyError:
-                    for added_chunk in chunks_added:
-                        self.remove_chunk(added_chunk.id)
                     raise KeyError(f'Document with id `{doc_id}` does not exist.')
-                try:
-                    doc.add_chunk(chunk)
-                except DuplicateError as e:
-                    for added_chunk in chunks_added:
-                        self.remove_chunk(added_chunk.id)
-                    raise DuplicateError(f'Chunk with id `{chunk.id}` already exists. Removing all previous chunks already added.')
-                chunks_added.append(chunk)
+                if chunk.id in self.__chunk_id_to_doc_id or chunk.id in chunk_ids:
+                    raise DuplicateError(f'Chunk with id `{chunk.id}` already exists. No chunk was added.')
+                chunk_ids.add(chunk.id)
+            for chunk, doc in zip(chunks, docs):
+                doc.add_chunk(chunk)
                 self.__chunk_id_to_doc_id[chunk.id] = doc.id
             self.index.add(chunks=chunks)
+            lsn = self.__log('add_chunks', chunks=self.__chunk_records(chunks), vectors=self.__embeddings(chunks))
+        self.__sync(lsn)
     
+    @_loaded
     def get_chunk(self, chunk_id: str) -> Chunk:
         """Get a chunk from the library. This is an O(1) operation since
         we have indexed both a chunk_id to doc_id mapping, and a doc_id to its
@@ -83,65 +190,157 @@ class Library:
         operation since inside the document, we have a list of chunks indexed
         by its id.
         """
-        doc_id = self.__chunk_id_to_doc_id.get(chunk_id)
-        if not doc_id:
-            raise KeyError(f'Chunk with id `{chunk_id}` not found. There is no document associated with this chunk.')
-        doc = self.get_document(id=doc_id)
-        return doc.get_chunk(chunk_id)
+        with self.__lock.read():
+            doc_id = self.__chunk_id_to_doc_id.get(chunk_id)
+            if not doc_id:
+                raise KeyError(f'Chunk with id `{chunk_id}` not found. There is no document associated with this chunk.')
+            doc = self.get_document(id=doc_id)
+            return doc.get_chunk(chunk_id)
     
+    @_loaded
     def get_chunks(self) -> List[Chunk]:
         """Get all chunks from the library. If index is not built, 
         then go over every document to get the chunks. Time complexity: O(D),
         where D is the number of documents in the library.
         
-        However, if the index is built, then time complexity: O(1).
+        However, if the index is built, then time complexity: O(n), to copy the chunks.
         """
-        if not self.index:
-            chunks = []
-            docs = self.get_documents()
-            for doc in docs:
-                chunks.extend(doc.get_chunks())
-            return chunks
-        return self.index.get_chunks()
+        with self.__lock.read():
+            if not self.index:
+                chunks = []
+                docs = self.get_documents()
+                for doc in docs:
+                    chunks.extend(doc.get_chunks())
+                return chunks
+            with self.index._lock.read():
+                return list(self.index.get_chunks())
     
+    @_loaded
     def update_chunk(
         self, 
         chunk_id: str, 
         text: str
     ) -> Chunk:
         """Update the text of a chunk and update the vector search index."""
-        with self.__lock:
+        # Nothing to re-embed if the text didn't change
+        if self.get_chunk(chunk_id).text == text:
+            return
+        embedding = self.index.embed_text(text)
+        with self.__lock.write():
+            # The chunk may have been removed while its text was embedded
             doc_id = self.__chunk_id_to_doc_id.get(chunk_id)
             if not doc_id:
                 raise KeyError(f'Chunk with id `{chunk_id}` not found. There is no document associated with this chunk.')
             doc = self.get_document(id=doc_id)
             doc._update_chunk_text(chunk_id=chunk_id, text=text)
             # update vector search index
-            self.index.update(chunk_id=chunk_id, text=text)
+            self.index.update_many({chunk_id: text}, embeddings=[embedding])
+            lsn = self.__log(
+                'update_chunks',
+                texts={chunk_id: text},
+                vectors=self.__embeddings([doc.get_chunk(chunk_id)])
+            )
+        self.__sync(lsn)
         
     
+    @_loaded
     def remove_chunk(self, chunk_id: str):
         """Remove a chunk from the library."""
-        with self.__lock:
-            # Get the document the chunk is associated with
-            doc_id = self.__chunk_id_to_doc_id.get(chunk_id)
-            if not doc_id:
-                raise KeyError(f'Chunk with id `{chunk_id}` not found. There is no document associated with this chunk.')
-            # Delete the chunk from the __chunk_id_to_doc
-            del self.__chunk_id_to_doc_id[chunk_id]
-            # Get the document
-            doc = self.get_document(id=doc_id)
-            # Remove the chunk from the document
-            doc._remove_chunk(chunk_id)
-            # update vector search index
-            self.index.remove(chunk_id=chunk_id)
+        with self.__lock.write():
+            self.__remove_chunk(chunk_id)
+            lsn = self.__log('remove_chunks', ids=[chunk_id])
+        self.__sync(lsn)
+        
+    def __remove_chunk(self, chunk_id: str):
+        # Get the document the chunk is associated with
+        doc_id = self.__chunk_id_to_doc_id.get(chunk_id)
+        if not doc_id:
+            raise KeyError(f'Chunk with id `{chunk_id}` not found. There is no document associated with this chunk.')
+        # Delete the chunk from the __chunk_id_to_doc
+        del self.__chunk_id_to_doc_id[chunk_id]
+        # Get the document
+        doc = self.get_document(id=doc_id)
+        # Remove the chunk from the document
+        doc._remove_chunk(chunk_id)
+        # update vector search index
+        self.index.remove(chunk_id=chunk_id)
+        
+    @_loaded
+    def update_chunks(self, texts: Dict[str, str]) -> Dict[str, str]:
+        """
+        Update the text of many chunks, given as a mapping of chunk id to text. The changed texts
+        are re-embedded in batches and written to the vector search index in one pass. Returns
+        the status of every chunk: `updated`, `unchanged` if the text didn't change, or
+        `not_found`.
+        """
+        statuses: Dict[str, str] = {}
+        changed: Dict[str, str] = {}
+        with self.__lock.read():
+            for chunk_id, text in texts.items():
+                try:
+                    chunk = self.get_chunk(chunk_id)
+                except KeyError:
+                    statuses[chunk_id] = 'not_found'
+                    continue
+                if chunk.text == text:
+                    statuses[chunk_id] = 'unchanged'
+                    continue
+                changed[chunk_id] = text
+                statuses[chunk_id] = 'updated'
+        embeddings = dict(zip(changed, self.index.embed_texts(list(changed.values()))))
+        with self.__lock.write():
+            # Chunks may have been removed while their texts were embedded
+            for chunk_id in list(changed):
+                if chunk_id not in self.__chunk_id_to_doc_id:
+                    del changed[chunk_id]
+                    statuses[chunk_id] = 'not_found'
+            lsn = 0
+            if changed:
+                self.index.update_many(changed, embeddings=[embeddings[chunk_id] for chunk_id in changed])
+                lsn = self.__log(
+                    'update_chunks',
+                    texts=changed,
+                    vectors=self.__embeddings([self.get_chunk(chunk_id) for chunk_id in changed])
+                )
+        self.__sync(lsn)
+        return statuses
+    
+    @_loaded
+    def remove_chunks(self, chunk_ids: List[str]) -> Dict[str, str]:
+        """
+        Remove many chunks from the library in one pass over the vector search index. Returns
+        the status of every chunk: `removed`, or `not_found`.
+        """
+        statuses: Dict[str, str] = {}
+        with self.__lock.write():
+            # Chunks to remove, grouped by document
+            doc_chunk_ids: Dict[str, List[str]] = {}
+            for chunk_id in dict.fromkeys(chunk_ids):
+                doc_id = self.__chunk_id_to_doc_id.pop(chunk_id, None)
+                if not doc_id:
+                    statuses[chunk_id] = 'not_found'
+                    continue
+                doc_chunk_ids.setdefault(doc_id, []).append(chunk_id)
+                statuses[chunk_id] = 'removed'
+            for doc_id, ids in doc_chunk_ids.items():
+                self.get_document(id=doc_id)._remove_chunks(ids)
+            removed = [chunk_id for ids in doc_chunk_ids.values() for chunk_id in ids]
+            self.index.remove_many(chunk_ids=removed)
+            lsn = self.__log('remove_chunks', ids=removed) if removed else 0
+        self.__sync(lsn)
+        return statuses
         
+    @_loaded
     def get_documents(self) -> List[Document]:
-        return self.documents
+        with self.__lock.read():
+            return list(self.documents)
     
+    @_loaded
     def add_document(self, document: Document) -> Document:
         """ Add a document to the library. If the document already exists, then raise an error."""
-        with self.__lock:
+        # Embed chunks the document came with before touching the library
+        self.index.embed_chunks(document.chunks)
+        with self.__lock.write():
             # Check if the doc already exists
             if document.name in self.__doc_name_index.index:
                 raise DuplicateError(f'Document with name `{document.name}` already exists.')
@@ -149,12 +348,21 @@ class Library:
             self.__doc_name_index.add(id=document.name, value=len(self.documents)-1)
             self.__doc_id_index.add(id=document.id, value=len(self.documents)-1)
             
-            # If chunks were already added
+            # If chunks were already added to the document, only index them
             if document.chunks:
-                self.add_chunks(document.chunks)
-        
+                for chunk in document.chunks:
+                    self.__chunk_id_to_doc_id[chunk.id] = document.id
+                self.index.add(chunks=document.chunks)
+            lsn = self.__log(
+                'add_document',
+                document={'id': document.id, 'name': document.name, 'metadata': document.metadata},
+                chunks=self.__chunk_records(document.chunks),
+                vectors=self.__embeddings(document.chunks) if document.chunks else None
+            )
+        self.__sync(lsn)
         return document
         
+    @_loaded
     def get_document(
         self, 
         name: str = None,
@@ -163,42 +371,310 @@ class Library:
         """ Get a document from the library. If both name and id are provided, then raise an error. """
         if id and name:
             raise ValueError('Only one of `name` or `id` can be provided at a time.')
-        if id:
-            if not id in self.__doc_id_index.index:
-                raise KeyError(f'Document with id `{id}` does not exist.')
-            return self.documents[self.__doc_id_index.search(id)]
-        if name:
-            if not name in self.__doc_name_index.index:
-                raise KeyError(f'Document with name `{name}` does not exist.')
-        return self.documents[self.__doc_name_index.search(name)]
+        with self.__lock.read():
+            if id:
+                if not id in self.__doc_id_index.index:
+                    raise KeyError(f'Document with id `{id}` does not exist.')
+                return self.documents[self.__doc_id_index.search(id)]
+            if name:
+                if not name in self.__doc_name_index.index:
+                    raise KeyError(f'Document with name `{name}` does not exist.')
+            return self.documents[self.__doc_name_index.search(name)]
         
+    @_loaded
     def remove_document(self, id: str):
-        """ Remove a document from the library. """
-        if not id in self.__doc_id_index.index:
-            raise KeyError(f'Document with id `{id}` does not exist.')
-        
-        doc = self.get_document(id=id)
-        
-        with self.__lock:
-            for chunk in doc.get_chunks():
-                self.remove_chunk(chunk_id=chunk.id)
+        """ Remove a document and all of its chunks from the library. This is O(k), where k is
+        the number of chunks in the document, since every removal swaps the last item of a list
+        into the removed item's slot instead of reindexing the list."""
+        with self.__lock.write():
+            if not id in self.__doc_id_index.index:
+                raise KeyError(f'Document with id `{id}` does not exist.')
+            doc = self.get_document(id=id)
+            chunk_ids = [chunk.id for chunk in doc.get_chunks()]
+            for chunk_id in chunk_ids:
+                del self.__chunk_id_to_doc_id[chunk_id]
+            doc._remove_chunks(chunk_ids)
+            self.index.remove_many(chunk_ids=chunk_ids)
             doc_index = self.__doc_id_index.search(id)
-            del self.documents[doc_index]
-            self.__doc_id_index.remove(
+            moved = self.__doc_id_index.remove(
                 id=doc.id,
                 iterable=self.documents,
                 reindex_key='id'
             )
-            self.__doc_name_index.remove(
-                id=doc.name,
-                iterable=self.documents,
-                reindex_key='name'
+            # The documents list was already updated, only fix the name index
+            del self.__doc_name_index.index[doc.name]
+            if moved is not None:
+                self.__doc_name_index.add(id=moved.name, value=doc_index)
+            lsn = self.__log('remove_document', id=id)
+        self.__sync(lsn)
+
+    def save(self, directory: str, prefix: str) -> Dict[str, Any]:
+        """
+        Write the documents and chunks of the library to `<prefix>.segment` in `directory`, the
+        embeddings of its chunks to `<prefix>.vectors` and their squared norms to
+        `<prefix>.norms`, and return the library's entry in the snapshot manifest: its settings
+        and the names of its files. The save holds the read lock, so writes to the library wait
+        for it to finish, while reads don't. See `Database.save`.
+        
+        A library that wasn't written to since it was last saved to, or loaded from, `directory`
+        writes nothing: its entry refers to the files already there.
+        """
+        with self.__lock.write():
+            # An unloaded library saved elsewhere is copied from its snapshot
+            if not self.loaded and self._segment[1] != directory:
+                self.__load_segment()
+        with self.__lock.read():
+            if not self.__dirty and self._segment is not None and self._segment[1] == directory:
+                entry = {**self._segment[0], **self._settings(), 'lsn': self.lsn}
+                self._segment = (entry, directory)
+                return entry
+            entry = {
+                **self._settings(),
+                'lsn': self.lsn,
+                'num_of_chunks': 0,
+                'segment': None,
+                'vectors': None,
+                'norms': None
+            }
+            if self.index is None:
+                return entry
+            with self.index._lock.read():
+                # Chunks in the order of the rows of the embedding store
+                chunks = self.index.get_chunks()
+                rows = {chunk.id: row for row, chunk in enumerate(chunks)}
+                entry['num_of_chunks'] = len(chunks)
+                entry['segment'] = snapshot.write_segment(directory, f'{prefix}.segment', {
+                    'chunks': self.__chunk_records(chunks),
+                    'documents': [
+                        {
+                            'id': doc.id,
+                            'name': doc.name,
+                            'metadata': doc.metadata,
+                            'chunks': [rows[chunk.id] for chunk in doc.get_chunks()]
+                        }
+                        for doc in self.documents
+                    ]
+                })
+                embeddings = self.index.embeddings
+                entry['vectors'] = snapshot.write_array(directory, f'{prefix}.vectors', embeddings.matrix)
+                if embeddings.track_norms:
+                    entry['norms'] = snapshot.write_array(directory, f'{prefix}.norms', embeddings.norms)
+            self._segment = (entry, directory)
+            self.__dirty = False
+        return entry
+
+    @classmethod
+    def load(cls, entry: Dict[str, Any], directory: str, lazy: bool = False) -> 'Library':
+        """
+        Restore a library from its entry in a snapshot manifest. Its documents and chunks are
+        read from its segment, its embeddings are memory-mapped from the snapshot, not embedded
+        again, and the index's structure is rebuilt from them. With `lazy`, the library is
+        restored unloaded: only the entry is kept, and the segment and embeddings are read the
+        first time they're used. See `Database.load`.
+        """
+        library = cls._from_settings(entry)
+        library.lsn = entry.get('lsn', 0)
+        library._segment = (entry, directory)
+        library.__dirty = False
+        if lazy:
+            library.__release()
+        else:
+            library.__load_segment()
+        return library
+
+    def unload(self) -> bool:
+        """
+        Release the library's documents, chunks and index, keeping only its settings in memory.
+        They're loaded back from the snapshot the library was last saved to the next time they're
+        used. Returns whether the library was unloaded: it isn't if it was never saved, was
+        written to since, or is in use. See `Database.evict`.
+        """
+        with self.__lock.write(), self.__users_lock:
+            if not self.loaded or self.__dirty or self._segment is None or self.__users:
+                return False
+            self.__release()
+            return True
+
+    def __release(self):
+        self.documents = []
+        self.index = None
+        self.__doc_name_index = SearchIndex().initialize_index(index_type=IndexTypes.COLLECTIONS_INDEX)
+        self.__doc_id_index = SearchIndex().initialize_index(index_type=IndexTypes.COLLECTIONS_INDEX)
+        self.__chunk_id_to_doc_id = {}
+        self.loaded = False
+
+    def __load_segment(self):
+        """Restore the documents, chunks and index of an unloaded library from `_segment`."""
+        entry, directory = self._segment
+        if self.index_type is not None:
+            if self.index is None:
+                self.add_vector_search_index(self.index_type, **self.index_params)
+            segment = snapshot.read_segment(directory, entry['segment'])
+            chunks = self.__restore_chunks(segment['chunks'])
+            for doc_entry in segment['documents']:
+                doc = Document(name=doc_entry['name'], metadata=doc_entry['metadata'])
+                doc.id = doc_entry['id']
+                for row in doc_entry['chunks']:
+                    doc.add_chunk(chunks[row])
+                    self.__chunk_id_to_doc_id[chunks[row].id] = doc.id
+                self.documents.append(doc)
+                self.__doc_name_index.add(id=doc.name, value=len(self.documents)-1)
+                self.__doc_id_index.add(id=doc.id, value=len(self.documents)-1)
+            shape = (len(chunks), entry['dim'])
+            self.index.load(
+                chunks,
+                snapshot.read_array(directory, entry['vectors'], shape),
+                norms=snapshot.read_array(directory, entry['norms'], shape[:1]) if entry['norms'] else None
             )
+        self.loaded = True
+
+    def _use(self):
+        """Mark the library in use, and load it if it's unloaded, see `_loaded`."""
+        with self.__users_lock:
+            self.__users += 1
+            self.last_access = time.monotonic()
+            if self.loaded:
+                return
+        try:
+            with self.__lock.write():
+                if not self.loaded:
+                    self.__load_segment()
+        except BaseException:
+            self._release()
+            raise
+
+    def _release(self):
+        with self.__users_lock:
+            self.__users -= 1
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the library was written to since it was last saved, see `save`."""
+        return self.__dirty
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes the library's embeddings, and their codes if any, hold in memory.
+        0 once unloaded."""
+        index = self.index
+        if index is None:
+            return 0
+        codes = getattr(index, 'codes', None)
+        return index.embeddings.nbytes + (codes.nbytes if codes is not None else 0)
+
+    @property
+    def num_of_chunks(self) -> int:
+        """Number of chunks in the library, without loading it."""
+        index = self.index
+        if index is not None:
+            return len(index.chunks)
+        return self._segment[0]['num_of_chunks'] if self._segment is not None else 0
+
+    def _settings(self) -> Dict[str, Any]:
+        """What it takes to create the library again, empty: see `_from_settings`."""
+        return {
+            **self.dict(),
+            'index_type': self.index_type,
+            'index_params': self.index_params,
+            'dim': self.embedding_provider.dim
+        }
+
+    @classmethod
+    def _from_settings(cls, settings: Dict[str, Any]) -> 'Library':
+        library = cls(
+            name=settings['name'],
+            metadata=settings['metadata'],
+            embedding_provider=settings['embedding_provider'],
+            metric=settings['metric']
+        )
+        if library.embedding_provider.dim != settings['dim']:
+            raise ValueError(f'Library `{library.name}` was saved with {settings["dim"]} dim embeddings, but its provider `{library.embedding_provider.name}` has {library.embedding_provider.dim}.')
+        if settings['index_type'] is not None:
+            library.add_vector_search_index(settings['index_type'], **settings['index_params'])
+        return library
+
+    @staticmethod
+    def __chunk_records(chunks: List[Chunk]) -> List[Dict[str, Any]]:
+        return [{'id': chunk.id, 'text': chunk.text, 'metadata': chunk.metadata} for chunk in chunks]
+
+    @staticmethod
+    def __restore_chunks(records: List[Dict[str, Any]], embeddings=None) -> List[Chunk]:
+        chunks = []
+        for i, record in enumerate(records):
+            chunk = Chunk(text=record['text'], metadata=record['metadata'])
+            chunk.id = record['id']
+            if embeddings is not None:
+                chunk.embedding = embeddings[i]
+            chunks.append(chunk)
+        return chunks
+
+    def __embeddings(self, chunks: List[Chunk]) -> np.ndarray:
+        """The embeddings of chunks as stored by the index, to be logged."""
+        return np.array(
+            [chunk.embedding for chunk in chunks],
+            dtype=np.float32
+        ).reshape(len(chunks), self.embedding_provider.dim)
+
+    def __log(self, op: str, vectors: Optional[np.ndarray] = None, **args) -> int:
+        """Append a write, applied under the library's lock, to the write-ahead log. Returns its
+        log sequence number, or 0 without a log."""
+        # A rename doesn't change what the library's snapshot arrays hold
+        if op != 'rename':
+            self.__dirty = True
+        if self._wal is None:
+            return 0
+        self.lsn = self._wal.append({'op': op, 'library': self.name, **args}, vectors)
+        return self.lsn
+
+    def __sync(self, lsn: int):
+        """Wait for a logged write to be on disk. Called once the lock is released, so that
+        concurrent writes share fsyncs."""
+        if lsn:
+            self._wal.sync(lsn)
+
+    def _set_wal(self, wal: Optional[WriteAheadLog]):
+        """Log every write from now on to `wal`, or stop logging with None."""
+        with self.__lock.write():
+            self._wal = wal
+
+    def rename(self, name: str) -> int:
+        """Rename the library, see `Database.update_library_name`, and return the log sequence
+        number of the rename, to be synced by the caller."""
+        with self.__lock.write():
+            previous_name, self.name = self.name, name
+            return self.__log('rename', library=previous_name, new_name=name)
+
+    @_loaded
+    def _replay(self, record: Dict[str, Any], vectors: Optional[np.ndarray]):
+        """Apply a write of the library read back from the write-ahead log, with the embeddings
+        it logged. See `Database.open_wal`."""
+        op = record['op']
+        if op == 'add_chunks':
+            self.add_chunks(self.__restore_chunks(record['chunks'], vectors))
+        elif op == 'add_document':
+            doc = Document(name=record['document']['name'], metadata=record['document']['metadata'])
+            doc.id = record['document']['id']
+            for chunk in self.__restore_chunks(record['chunks'], vectors):
+                doc.add_chunk(chunk)
+            self.add_document(doc)
+        elif op == 'remove_document':
+            self.remove_document(record['id'])
+        elif op == 'update_chunks':
+            with self.__lock.write():
+                self.index.update_many(record['texts'], embeddings=vectors)
+        elif op == 'remove_chunks':
+            self.remove_chunks(record['ids'])
+        else:
+            raise ValueError(f'Unknown write-ahead log operation `{op}`.')
+        self.lsn = record['lsn']
+        self.__dirty = True
 
     def dict(self):
         return {
             'name': self.name,
-            'metadata': self.metadata
+            'metadata': self.metadata,
+            'embedding_provider': self.embedding_provider.name,
+            'metric': self.metric
         }
     
     def json(self):
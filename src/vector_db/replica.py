@@ -0,0 +1,85 @@
+"""
+Read-only replicas of a database, to serve it from several processes. A single process, the
+coordinator, takes every write and saves the database to a snapshot directory whenever it's
+written to (see `Database.start_publishing`), and every other process follows that directory
+with a `Replica`.
+
+The embeddings of a snapshot are memory-mapped from its files, which are never written to once
+saved (see `vector_db.snapshot`), so the replicas on a host all read the same pages of the page
+cache: serving from N processes keeps a single copy of the embeddings in memory, not N. Only
+the structures rebuilt from them, e.g. the HNSW graph or the LSH buckets, are per process.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Optional, Tuple
+from .database import Database
+from . import snapshot
+
+logger = logging.getLogger(__name__)
+
+class Replica:
+    """
+    Follows the snapshot in the directory `path`: every `interval` seconds, once `start` is
+    called, checks whether a new version was saved, and if so loads it and swaps it in as `db`.
+    Only the libraries written to since the previous version are loaded again, see
+    `Database.reload`, and searches running meanwhile finish on the previous version.
+
+    The replica is only read from. Writes must go to the coordinator.
+    """
+    def __init__(
+        self,
+        path: str,
+        interval: float = 0.5
+    ):
+        self.path = path
+        self.interval = interval
+        self.db = Database()
+        self.db.path = path
+        # Identity of the manifest `db` was loaded from, None before there's a snapshot
+        self.version: Optional[Tuple[int, int, int]] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Load the latest version of the snapshot, if it's not the one loaded already. Returns
+        whether a new version was loaded."""
+        while True:
+            version = self.__version()
+            if version == self.version:
+                return False
+            try:
+                db = self.db.reload(self.path)
+            except FileNotFoundError:
+                # The coordinator saved a newer version while this one was loaded, and deleted
+                # the files it no longer refers to
+                if self.__version() == version:
+                    raise
+                continue
+            self.db, self.version = db, version
+            return True
+
+    def start(self):
+        """Call `refresh` every `interval` seconds in the background. A failed refresh is logged,
+        and the replica keeps serving the version it holds until the next one succeeds."""
+        if self.__thread is not None:
+            return
+        def run():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception('Loading the snapshot at `%s` failed.', self.path)
+        self.__thread = threading.Thread(target=run, daemon=True)
+        self.__thread.start()
+
+    def __version(self) -> Optional[Tuple[int, int, int]]:
+        # The manifest is replaced, never written in place, so a new version is a new file
+        try:
+            stat = os.stat(os.path.join(self.path, snapshot.MANIFEST))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
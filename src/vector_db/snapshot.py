@@ -0,0 +1,112 @@
+"""
+Snapshots of a database on disk, written by `Database.save` and read by `Database.load`.
+
+A snapshot is a directory holding a JSON manifest, with the settings of every library and the
+names of its files, and three files per library: a JSON segment with its documents and chunks
+(text and metadata), the embeddings of its chunks as raw float32, one row per chunk in the
+order of the segment, and their squared norms. The arrays have no header, so loading maps them
+with `np.memmap` as they are: startup doesn't read the vectors, and their pages are only read
+from disk when they're searched. Neither is the segment read before the library is loaded, so
+the manifest stays small however many chunks the libraries hold. The manifest also records the
+last write of the write-ahead log each library holds, so the writes logged after the snapshot
+can be replayed on top of it (see `vector_db.wal`).
+
+## Saving:
+Every save writes the files of the libraries written to under new names, then replaces the
+manifest atomically, and only then deletes the files of the previous snapshot. A crash during a
+save leaves the previous snapshot untouched.
+"""
+
+import json
+import os
+import uuid
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 2
+# Files of a library, by the key of the manifest entry naming them
+FILE_KEYS = ('segment', 'vectors', 'norms')
+# Extensions of the files written next to the manifest, the only files a save cleans up
+FILE_EXTENSIONS = tuple(f'.{key}' for key in FILE_KEYS)
+
+def files_nbytes(directory: str, entry: Dict[str, Any]) -> int:
+    """Number of bytes of the files of a library, named by its manifest entry."""
+    return sum(os.path.getsize(os.path.join(directory, entry[key])) for key in FILE_KEYS if entry.get(key))
+
+def new_generation() -> str:
+    """Prefix of the files of a new snapshot."""
+    return uuid.uuid4().hex[:12]
+
+def write_array(directory: str, name: str, array: np.ndarray) -> str:
+    """Write an array as raw bytes, flushed to disk, and return the name of its file."""
+    with open(os.path.join(directory, name), 'wb') as f:
+        # Written in blocks, so a memory-mapped array isn't paged in all at once
+        for start in range(0, len(array), 4096):
+            f.write(np.ascontiguousarray(array[start:start + 4096]).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    return name
+
+def read_array(directory: str, name: str, shape, dtype=np.float32) -> np.ndarray:
+    """
+    Map an array written by `write_array`. The map is copy-on-write: the array can be written
+    to in memory, but the file itself never changes.
+    """
+    if not shape[0]:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(os.path.join(directory, name), dtype=dtype, mode='c', shape=tuple(shape))
+
+def write_segment(directory: str, name: str, segment: Dict[str, Any]) -> str:
+    """Write the documents and chunks of a library as JSON, flushed to disk, and return the name
+    of its file."""
+    with open(os.path.join(directory, name), 'w') as f:
+        json.dump(segment, f, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    return name
+
+def read_segment(directory: str, name: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, name)) as f:
+        return json.load(f)
+
+def write_manifest(directory: str, libraries: List[Dict[str, Any]], lsn: int = 0):
+    """Replace the manifest atomically, then delete the files it no longer refers to. `lsn` is
+    the last write of the write-ahead log the snapshot is known to hold."""
+    manifest = {'version': FORMAT_VERSION, 'lsn': lsn, 'libraries': libraries}
+    path = os.path.join(directory, MANIFEST)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(directory)
+    referenced = {
+        name
+        for library in libraries
+        for name in (library.get(key) for key in FILE_KEYS)
+        if name
+    }
+    for name in os.listdir(directory):
+        if name.endswith(FILE_EXTENSIONS) and name not in referenced:
+            os.remove(os.path.join(directory, name))
+
+def read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+    """The manifest of the snapshot in `directory`, or None if there's no snapshot there."""
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != FORMAT_VERSION:
+        raise ValueError(f'Unsupported snapshot version `{manifest.get("version")}`, expected {FORMAT_VERSION}.')
+    return manifest
+
+def fsync_directory(directory: str):
+    # Makes the rename of the manifest durable
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
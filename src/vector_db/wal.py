@@ -0,0 +1,166 @@
+"""
+Write-ahead log of the writes to a database, replayed on startup on top of the last snapshot.
+
+Every write to a library, and every library added, renamed or removed, is appended to the log
+as one record once it's applied in memory, and the write only returns once its record is on
+disk. A record is a JSON header, with the operation, its arguments and its log sequence number
+(LSN), followed by the embeddings it wrote as raw float32 bytes, so replaying it never calls
+the embedding provider. Each record is framed with its length and a CRC32, so a record torn by
+a crash is detected and dropped, along with anything after it.
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, Optional, Tuple
+import numpy as np
+from .snapshot import fsync_directory
+
+# CRC32 of the header and the vectors, length of the header, length of the vectors
+FRAME = struct.Struct('<IIQ')
+
+Record = Tuple[Dict[str, Any], Optional[np.ndarray]]
+
+def _read(path: str) -> Iterator[Tuple[int, Dict[str, Any], Optional[np.ndarray]]]:
+    """The records of a log, with the offset where each of them ends. Stops at the first torn
+    or corrupt record."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        while True:
+            frame = f.read(FRAME.size)
+            if len(frame) < FRAME.size:
+                return
+            crc, header_size, vectors_size = FRAME.unpack(frame)
+            payload = f.read(header_size + vectors_size)
+            if len(payload) < header_size + vectors_size or zlib.crc32(payload) != crc:
+                return
+            record = json.loads(payload[:header_size])
+            vectors = None
+            if 'shape' in record:
+                vectors = np.frombuffer(payload[header_size:], dtype=np.float32).reshape(record['shape'])
+            yield f.tell(), record, vectors
+
+class WriteAheadLog:
+    """
+    Append-only log of records, see `vector_db.wal`. Opening a log drops the torn record a crash
+    may have left at its end.
+
+    ## Group commit:
+    `append` only writes a record to the file's buffer, under a short lock. `sync` then blocks
+    until the record is on disk: the first writer to call it flushes every record appended so
+    far and fsyncs once, while the writers arriving meanwhile wait for that fsync, or the next
+    one. Under concurrent ingest, a single fsync covers the records of many writes instead of
+    paying one per write. `commit_delay` seconds of waiting before every fsync let more records
+    join it, at the cost of that much latency.
+    """
+    def __init__(
+        self,
+        path: str,
+        commit_delay: float = 0.0
+    ):
+        self.path = path
+        self.commit_delay = commit_delay
+        # LSN of the last record appended
+        self.lsn = 0
+        end = 0
+        for end, record, _ in _read(path):
+            self.lsn = record['lsn']
+        self._file = open(path, 'ab')
+        self._file.truncate(end)
+        self._lock = threading.Lock()
+        self._sync_condition = threading.Condition()
+        # LSN of the last record on disk, and whether a writer is running an fsync
+        self._synced = self.lsn
+        self._syncing = False
+        # Number of fsyncs, e.g. to measure how many writes each of them commits
+        self.fsyncs = 0
+
+    def records(self) -> Iterator[Record]:
+        """The records of the log, oldest first, and the embeddings they wrote."""
+        with self._lock:
+            self._file.flush()
+        for _, record, vectors in _read(self.path):
+            yield record, vectors
+
+    def append(self, record: Dict[str, Any], vectors: Optional[np.ndarray] = None) -> int:
+        """Append a record, and the embeddings it wrote, and return its LSN. The record isn't
+        durable until `sync` returns."""
+        with self._lock:
+            self.lsn += 1
+            record = {**record, 'lsn': self.lsn}
+            blob = b''
+            if vectors is not None:
+                vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+                record['shape'] = list(vectors.shape)
+                blob = vectors.tobytes()
+            header = json.dumps(record, default=str).encode()
+            self._file.write(FRAME.pack(zlib.crc32(header + blob), len(header), len(blob)))
+            self._file.write(header)
+            self._file.write(blob)
+            return self.lsn
+
+    def sync(self, lsn: int):
+        """Block until the record `lsn`, and every record before it, is on disk."""
+        with self._sync_condition:
+            while self._synced < lsn:
+                if self._syncing:
+                    self._sync_condition.wait()
+                    continue
+                self._syncing = True
+                self._sync_condition.release()
+                try:
+                    if self.commit_delay:
+                        time.sleep(self.commit_delay)
+                    with self._lock:
+                        self._file.flush()
+                        synced = self.lsn
+                    os.fsync(self._file.fileno())
+                    self.fsyncs += 1
+                finally:
+                    self._sync_condition.acquire()
+                    self._syncing = False
+                    self._sync_condition.notify_all()
+                self._synced = max(self._synced, synced)
+
+    def truncate(self, lsn: int):
+        """Drop the records up to `lsn`, e.g. once a snapshot holds their writes. The records
+        after it are copied to a new log, which atomically replaces this one."""
+        with self._sync_condition:
+            # No fsync of the current file may be running while it's replaced
+            while self._syncing:
+                self._sync_condition.wait()
+            self._syncing = True
+        try:
+            with self._lock:
+                self._file.flush()
+                tmp_path = f'{self.path}.tmp'
+                with open(self.path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                    start = 0
+                    for end, record, _ in _read(self.path):
+                        if record['lsn'] > lsn:
+                            src.seek(start)
+                            dst.write(src.read(end - start))
+                        start = end
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                self._file.close()
+                os.replace(tmp_path, self.path)
+                fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+                self._file = open(self.path, 'ab')
+                synced = self.lsn
+        finally:
+            with self._sync_condition:
+                self._syncing = False
+                self._sync_condition.notify_all()
+        with self._sync_condition:
+            self._synced = max(self._synced, synced)
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()